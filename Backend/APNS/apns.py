@@ -84,6 +84,10 @@ async def _post_apns(device_token: str, payload: Dict[str, Any]) -> tuple[int, s
         "api.push.apple.com",
         "api.sandbox.push.apple.com",
     ]
+    # Single host[:port] override (e.g. the local APNs stand-in in Benchmarks/fakes); no environment fallback
+    host_override = os.getenv("APNS_HOST")
+    if host_override:
+        hosts_order = [host_override]
 
     bundle_id = os.getenv("APNS_BUNDLE_ID") or os.getenv("AASA_BUNDLE_ID")
     if not bundle_id:
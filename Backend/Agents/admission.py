@@ -0,0 +1,246 @@
+import os
+import time
+import random
+import asyncio
+import email.utils
+from collections import OrderedDict
+from contextlib import asynccontextmanager
+from typing import Awaitable, Callable, Optional, TypeVar
+
+import openai
+
+from ..Metrics.metrics import counter, gauge, histogram
+
+T = TypeVar("T")
+
+queue_depth = gauge("llm_admission_queue_depth", "LLM calls waiting for a concurrency slot")
+in_flight = gauge("llm_admission_in_flight", "LLM calls holding a concurrency slot, by kind")
+rejections = counter("llm_admission_rejected_total", "LLM calls rejected by admission control, by reason")
+wait_seconds = histogram("llm_admission_wait_seconds", "Time LLM calls waited for a concurrency slot")
+backoff_retries = counter("llm_backoff_retries_total", "LLM calls retried after a retryable provider error, by status")
+
+
+class AdmissionRejected(Exception):
+    """The call was not admitted; `retry_after` is a hint in seconds for the client."""
+
+    def __init__(self, reason: str, retry_after: float):
+        super().__init__(f"LLM admission rejected: {reason}")
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+class _TokenBucket:
+    __slots__ = ("tokens", "updated")
+
+    def __init__(self, tokens: float):
+        self.tokens = tokens
+        self.updated = time.monotonic()
+
+
+class AdmissionController:
+    """Gate in front of every OpenAI call.
+
+    - Global cap of `max_concurrent` calls holding a slot (a chat stream holds it until the model starts answering).
+    - Per-user token buckets (`user_rate_per_minute`, `user_burst`) for user-initiated calls.
+    - At most `queue_limit` callers wait for a slot, each for at most `queue_timeout` seconds.
+    - After a provider 429 the controller cools down for its Retry-After: new calls wait it out
+      instead of stampeding the provider again.
+    Rejections raise AdmissionRejected with a retry hint.
+    """
+
+    def __init__(self, *, max_concurrent: Optional[int] = None, queue_limit: Optional[int] = None,
+                 queue_timeout: Optional[float] = None, user_rate_per_minute: Optional[float] = None,
+                 user_burst: Optional[float] = None):
+        self.max_concurrent = max(1, int(os.getenv("LLM_MAX_CONCURRENT", "32") if max_concurrent is None else max_concurrent))
+        self.queue_limit = max(0, int(os.getenv("LLM_QUEUE_LIMIT", "64") if queue_limit is None else queue_limit))
+        self.queue_timeout = max(0.0, float(os.getenv("LLM_QUEUE_TIMEOUT_SECONDS", "10") if queue_timeout is None else queue_timeout))
+        self.user_rate = max(0.0, float(os.getenv("LLM_USER_RATE_PER_MINUTE", "20") if user_rate_per_minute is None else user_rate_per_minute)) / 60.0
+        self.user_burst = max(1.0, float(os.getenv("LLM_USER_BURST", "5") if user_burst is None else user_burst))
+
+        self._active = 0
+        self._waiters: "OrderedDict[asyncio.Future, None]" = OrderedDict()
+        self._buckets: "OrderedDict[str, _TokenBucket]" = OrderedDict()
+        self._cooldown_until = 0.0
+
+    # Hold a slot for the duration of the block
+    @asynccontextmanager
+    async def slot(self, *, user_id: Optional[str] = None, kind: str = "chat"):
+        await self.acquire(user_id=user_id, kind=kind)
+        try:
+            yield
+        finally:
+            self.release(kind=kind)
+
+    # Take a slot (raises AdmissionRejected); every successful acquire needs exactly one release()
+    async def acquire(self, *, user_id: Optional[str] = None, kind: str = "chat") -> None:
+        if user_id is not None:
+            self._take_user_token(user_id)
+
+        start = time.monotonic()
+        if self._active >= self.max_concurrent or self._waiters or self._cooldown_until > start:
+            try:
+                if len(self._waiters) >= self.queue_limit:
+                    rejections.inc(reason="queue_full")
+                    raise AdmissionRejected("queue_full", self._retry_hint())
+                await self._wait_for_slot(start + self.queue_timeout)
+            except BaseException:
+                # Never admitted (full, timed out or cancelled): the call did not use the user's budget
+                if user_id is not None:
+                    self._refund_user_token(user_id)
+                raise
+        else:
+            self._active += 1
+        in_flight.inc(kind=kind)
+        wait_seconds.observe(time.monotonic() - start)
+
+    # Take a slot only if one is free right now (no queueing, no per-user budget); used for optional work
+    def try_acquire(self, *, kind: str) -> bool:
+        if self._active >= self.max_concurrent or self._waiters or self._cooldown_until > time.monotonic():
+            return False
+        self._active += 1
+        in_flight.inc(kind=kind)
+        return True
+
+    def release(self, *, kind: str = "chat") -> None:
+        self._active = max(0, self._active - 1)
+        in_flight.dec(kind=kind)
+        self._wake_next()
+
+    # Note a provider rate limit: hold new admissions until it has passed
+    def cool_down(self, seconds: float) -> None:
+        until = time.monotonic() + max(0.0, seconds)
+        if until > self._cooldown_until:
+            self._cooldown_until = until
+            print(f"[LLM] provider rate limited; pausing admissions for {seconds:.1f}s")
+
+    # FIFO wait: only the head of the queue may take a free slot, so newcomers never overtake waiters
+    async def _wait_for_slot(self, deadline: float) -> None:
+        loop = asyncio.get_running_loop()
+        fut = loop.create_future()
+        self._waiters[fut] = None
+        queue_depth.set(len(self._waiters))
+        try:
+            while True:
+                now = time.monotonic()
+                if now >= deadline:
+                    rejections.inc(reason="queue_timeout")
+                    raise AdmissionRejected("queue_timeout", self._retry_hint())
+                if self._cooldown_until > now:
+                    # Cooling down after a 429: sleep it out (bounded by our deadline), then re-check
+                    await asyncio.sleep(min(self._cooldown_until, deadline) - now)
+                    continue
+                if self._active < self.max_concurrent and next(iter(self._waiters)) is fut:
+                    self._active += 1
+                    return
+                if fut.done():
+                    # Woken but not admitted: keep our place in line with a fresh future
+                    fresh = loop.create_future()
+                    self._waiters[fresh] = None
+                    self._waiters.move_to_end(fresh, last=False)
+                    del self._waiters[fut]
+                    fut = fresh
+                try:
+                    await asyncio.wait_for(asyncio.shield(fut), deadline - now)
+                except asyncio.TimeoutError:
+                    continue
+        finally:
+            self._waiters.pop(fut, None)
+            queue_depth.set(len(self._waiters))
+            self._wake_next()
+
+    def _wake_next(self) -> None:
+        if self._waiters and self._active < self.max_concurrent:
+            head = next(iter(self._waiters))
+            if not head.done():
+                head.set_result(None)
+
+    def _take_user_token(self, user_id: str) -> None:
+        if self.user_rate <= 0:
+            return
+        now = time.monotonic()
+        bucket = self._buckets.get(user_id)
+        if bucket is None:
+            bucket = self._buckets[user_id] = _TokenBucket(self.user_burst)
+            while len(self._buckets) > 10_000:
+                self._buckets.popitem(last=False)
+        else:
+            self._buckets.move_to_end(user_id)
+            bucket.tokens = min(self.user_burst, bucket.tokens + (now - bucket.updated) * self.user_rate)
+        bucket.updated = now
+        if bucket.tokens < 1.0:
+            rejections.inc(reason="user_rate")
+            raise AdmissionRejected("user_rate", (1.0 - bucket.tokens) / self.user_rate)
+        bucket.tokens -= 1.0
+
+    def _refund_user_token(self, user_id: str) -> None:
+        bucket = self._buckets.get(user_id)
+        if bucket is not None and self.user_rate > 0:
+            bucket.tokens = min(self.user_burst, bucket.tokens + 1.0)
+
+    def _retry_hint(self) -> float:
+        return max(1.0, self._cooldown_until - time.monotonic())
+
+
+admission = AdmissionController()
+
+
+# Seconds the provider asked us to wait (Retry-After / retry-after-ms), if it said
+def _retry_after(error: Exception) -> Optional[float]:
+    response = getattr(error, "response", None)
+    headers = getattr(response, "headers", None)
+    if headers is None:
+        return None
+    for header, divisor in (("retry-after-ms", 1000.0), ("retry-after", 1.0)):
+        value = headers.get(header)
+        if value is None:
+            continue
+        try:
+            return max(0.0, float(value) / divisor)
+        except ValueError:
+            parsed = email.utils.parsedate_tz(value)
+            if parsed is not None:
+                return max(0.0, email.utils.mktime_tz(parsed) - time.time())
+    return None
+
+
+def _retryable_status(error: Exception) -> Optional[str]:
+    if isinstance(error, openai.RateLimitError):
+        return "429"
+    if isinstance(error, openai.InternalServerError):
+        return str(getattr(error, "status_code", "5xx"))
+    if isinstance(error, (openai.APITimeoutError, openai.APIConnectionError)):
+        return "connection"
+    return None
+
+
+# Run `call` (a fresh request per attempt), retrying 429 / 5xx / connection errors with exponential backoff
+# and full jitter. A Retry-After from the provider is honoured as the minimum wait and pauses admissions.
+async def with_backoff(call: Callable[[], Awaitable[T]], *, attempts: Optional[int] = None) -> T:
+    attempts = max(1, int(os.getenv("LLM_BACKOFF_MAX_ATTEMPTS", "3") if attempts is None else attempts))
+    base = float(os.getenv("LLM_BACKOFF_BASE_SECONDS", "0.5"))
+    cap = float(os.getenv("LLM_BACKOFF_MAX_SECONDS", "8"))
+    for attempt in range(attempts):
+        try:
+            return await call()
+        except Exception as e:
+            status = _retryable_status(e)
+            if status is None or attempt == attempts - 1:
+                raise
+            delay = random.uniform(0, min(cap, base * (2 ** attempt)))
+            retry_after = _retry_after(e)
+            if retry_after is not None:
+                if retry_after > cap:
+                    # Longer than we are willing to hold a request; let the caller fail fast
+                    admission.cool_down(retry_after)
+                    raise
+                delay = max(delay, retry_after)
+            if status == "429":
+                admission.cool_down(delay)
+            backoff_retries.inc(status=status)
+            print(f"[LLM] retryable error status={status} attempt={attempt + 1}/{attempts}; retrying in {delay:.2f}s")
+            await asyncio.sleep(delay)
+    raise RuntimeError("unreachable")
+
+
+def is_rate_limited(error: BaseException) -> bool:
+    return isinstance(error, (openai.RateLimitError, AdmissionRejected))
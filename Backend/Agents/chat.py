@@ -1,48 +1,90 @@
 import os
+from contextlib import asynccontextmanager, AsyncExitStack
 from pathlib import Path
 from typing import List, Optional
 from dotenv import load_dotenv
-from openai import OpenAI
+from .openai_client import get_openai_client, record_usage
+from .admission import with_backoff
+from .hedging import HedgePolicy, hedged_stream
 
 load_dotenv(dotenv_path = Path(__file__).resolve().parent.parent / ".env")
 
 class ChatAgent:
     def __init__(self):
-        self.client = OpenAI(api_key = os.getenv("OPENAI_API_KEY"))
+        self.client = get_openai_client()
         self.model = "gpt-5-mini"
+        self.prompt_cache_keys = os.getenv("CHAT_PROMPT_CACHE_KEYS", "true").strip().lower() != "false"
+        self.hedge_policy = HedgePolicy()
+        # Chain turns with previous_response_id until the chained context reaches this many tokens
+        self.chain_token_budget = int(os.getenv("CHAT_CHAIN_TOKEN_BUDGET", "16000"))
 
         prompt_path = Path(__file__).resolve().parent.parent / "Prompts" / "chat_prompt.txt"
         with open(prompt_path, "r", encoding = "utf-8") as f:
             self.system_prompt = f.read().strip()
 
-    def build_messages(self, *, session_partner_letter: str, last_user_message: str, partner_ab_context_text: Optional[str] = None) -> List[dict]:
-        input_messages: List[dict] = [
-            {"role": "system", "content": f"I'm Partner {session_partner_letter}"},
-            {"role": "system", "content": self.system_prompt},
-            {"role": "user", "content": f"last user message: {last_user_message}"},
-        ]
+    # Cache-friendly layout: the large static prompt is always the first message so every request shares
+    # that prefix; per-request parts follow, least volatile first (the partner thread only ever grows).
+    # A chained request (previous_response_id) already carries the static prompt, the partner letter and
+    # the partner thread sent so far in its context, so those are only sent to start a chain; on a chained
+    # turn partner_ab_context_text holds just the thread's new entries. A fresh chain gets the session
+    # summary instead of the full history.
+    def build_messages(self, *, session_partner_letter: str, last_user_message: str, partner_ab_context_text: Optional[str] = None,
+                       chained: bool = False, conversation_summary: Optional[str] = None) -> List[dict]:
+        input_messages: List[dict] = []
+        if not chained:
+            input_messages.append({"role": "system", "content": self.system_prompt})
+            input_messages.append({"role": "system", "content": f"I'm Partner {session_partner_letter}"})
 
         if partner_ab_context_text:
             input_messages.append({"role": "system", "content": partner_ab_context_text})
 
+        if conversation_summary and not chained:
+            input_messages.append({"role": "system", "content": conversation_summary})
+
+        input_messages.append({"role": "user", "content": f"last user message: {last_user_message}"})
         return input_messages
 
-    def create_response(self, *, messages: List[dict], previous_response_id: Optional[str] = None):
-        return self.client.responses.create(
-            model = self.model,
-            input = messages,
-            text = {"verbosity": "medium"},
-            reasoning = {"effort": "minimal"},
-            previous_response_id = previous_response_id,
-        )
+    # prompt_cache_key routes both partners of a relationship to the same prompt cache (None when unlinked or disabled)
+    def prompt_cache_key_for(self, relationship_id: Optional[str]) -> Optional[str]:
+        if not relationship_id or not self.prompt_cache_keys:
+            return None
+        return f"therai-chat-{relationship_id}"
 
-    def stream_response(self, *, messages: List[dict], previous_response_id: Optional[str] = None):
-        return self.client.responses.stream(
+    def _request_args(self, messages: List[dict], previous_response_id: Optional[str], prompt_cache_key: Optional[str]) -> dict:
+        args = dict(
             model = self.model,
             input = messages,
             text = {"verbosity": "medium"},
             reasoning = {"effort": "minimal"},
             previous_response_id = previous_response_id,
         )
+        if prompt_cache_key:
+            args["prompt_cache_key"] = prompt_cache_key
+        return args
+
+    # Concurrency admission is the caller's job (see admission.py); retryable provider errors back off here
+    async def create_response(self, *, messages: List[dict], previous_response_id: Optional[str] = None, prompt_cache_key: Optional[str] = None):
+        args = self._request_args(messages, previous_response_id, prompt_cache_key)
+        resp = await with_backoff(lambda: self.client.responses.create(**args))
+        record_usage(getattr(resp, "usage", None), agent = "chat")
+        return resp
+
+    # Async context manager yielding the opened stream; iterate it with `async for`. Opening the stream is
+    # retried with backoff (nothing has been streamed yet); errors mid-stream are not. With hedging enabled
+    # (CHAT_HEDGE_ENABLED) a slow start gets a duplicate request and the first to stream text wins.
+    # Usage is recorded by the caller from the response.completed event (see record_usage).
+    @asynccontextmanager
+    async def stream_response(self, *, messages: List[dict], previous_response_id: Optional[str] = None, prompt_cache_key: Optional[str] = None):
+        args = self._request_args(messages, previous_response_id, prompt_cache_key)
 
+        @asynccontextmanager
+        async def open_stream():
+            async with AsyncExitStack() as stack:
+                yield await with_backoff(lambda: stack.enter_async_context(self.client.responses.stream(**args)))
 
+        if not self.hedge_policy.enabled:
+            async with open_stream() as stream:
+                yield stream
+            return
+        async with hedged_stream(open_stream, self.hedge_policy) as stream:
+            yield stream
@@ -1,20 +1,20 @@
-import os
 from dotenv import load_dotenv
 from pathlib import Path
-from openai import OpenAI
+from .openai_client import get_openai_client, record_usage
+from .admission import admission, with_backoff
 
 load_dotenv(dotenv_path = Path(__file__).resolve().parent.parent / ".env")
 
 class ChatTitleAgent:
     def __init__(self):
-        self.client = OpenAI(api_key = os.getenv("OPENAI_API_KEY"))
+        self.client = get_openai_client()
         self.model = "gpt-5-mini"
 
         title_generation_prompt_path = Path(__file__).resolve().parent.parent / "Prompts" / "chat_title_generation_prompt.txt"
         with open(title_generation_prompt_path, "r", encoding = "utf-8") as f:
             self.title_generation_prompt = f.read().strip()
 
-    def generate_chat_title(self, user_messages: list[str]) -> str:
+    async def generate_chat_title(self, user_messages: list[str]) -> str:
         try:
             combined = " ... ".join(msg.strip() for msg in user_messages if msg and msg.strip())
             if not combined:
@@ -25,10 +25,13 @@ class ChatTitleAgent:
                 {"role": "user", "content": combined},
             ]
 
-            resp = self.client.responses.create(
-                model = self.model,
-                input = input_messages,
-            )
+            # Background work: no per-user budget, but it queues for a global slot like every other call
+            async with admission.slot(kind = "title"):
+                resp = await with_backoff(lambda: self.client.responses.create(
+                    model = self.model,
+                    input = input_messages,
+                ))
+            record_usage(getattr(resp, "usage", None), agent = "title")
 
             text = getattr(resp, "output_text", None) or "".join(
                 block.text
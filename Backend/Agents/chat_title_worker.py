@@ -0,0 +1,83 @@
+import os
+import uuid
+import asyncio
+import contextvars
+from collections import OrderedDict
+from typing import Dict, Optional
+
+from .chat_title import ChatTitleAgent
+from ..Database.chat_repo import get_recent_user_messages
+from ..Database.session_repo import update_session_title
+
+
+class ChatTitleWorker:
+    """In-process, queue-fed chat title generation that never blocks a chat request.
+
+    Each session gets at most one title call: it fires as soon as the second user message
+    exists, or after a debounce window if the user only ever sent one message. A fixed
+    number of worker tasks bounds concurrent LLM calls.
+    """
+
+    def __init__(self, agent: ChatTitleAgent):
+        self.agent = agent
+        self.debounce_seconds = float(os.getenv("CHAT_TITLE_DEBOUNCE_SECONDS", "30"))
+        self.concurrency = max(1, int(os.getenv("CHAT_TITLE_CONCURRENCY", "4")))
+        self.max_queue = max(1, int(os.getenv("CHAT_TITLE_QUEUE_SIZE", "1000")))
+
+        self._queue: Optional[asyncio.Queue] = None
+        self._workers: list[asyncio.Task] = []
+        self._timers: Dict[uuid.UUID, asyncio.TimerHandle] = {}
+        self._scheduled: "OrderedDict[uuid.UUID, None]" = OrderedDict()  # sessions already handed to the queue
+        self._scheduled_cap = 10_000
+
+    # Called after a user message is persisted; returns immediately
+    def notify_user_message(self, *, user_id: uuid.UUID, session_id: uuid.UUID, user_message_count: int) -> None:
+        if user_message_count not in (1, 2) or session_id in self._scheduled:
+            return
+        self._ensure_started()
+        if user_message_count == 1:
+            if session_id not in self._timers:
+                loop = asyncio.get_running_loop()
+                self._timers[session_id] = loop.call_later(self.debounce_seconds, self._enqueue, user_id, session_id)
+            return
+        # Second message: both inputs exist, no reason to wait any longer
+        self._enqueue(user_id, session_id)
+
+    def _enqueue(self, user_id: uuid.UUID, session_id: uuid.UUID) -> None:
+        timer = self._timers.pop(session_id, None)
+        if timer is not None:
+            timer.cancel()
+        if session_id in self._scheduled:
+            return
+        self._scheduled[session_id] = None
+        while len(self._scheduled) > self._scheduled_cap:
+            self._scheduled.popitem(last=False)
+        try:
+            self._queue.put_nowait((user_id, session_id))  # type: ignore[union-attr]
+        except asyncio.QueueFull:
+            print(f"[Title] queue full; skipping title for session={session_id}")
+
+    def _ensure_started(self) -> None:
+        if self._queue is not None and self._workers and not all(w.done() for w in self._workers):
+            return
+        self._queue = asyncio.Queue(maxsize=self.max_queue)
+        # Fresh context: workers outlive the request that starts them and must not share its DB request scope
+        self._workers = [asyncio.create_task(self._run(), context=contextvars.Context()) for _ in range(self.concurrency)]
+
+    async def _run(self) -> None:
+        while True:
+            user_id, session_id = await self._queue.get()  # type: ignore[union-attr]
+            try:
+                await self._generate(user_id=user_id, session_id=session_id)
+            except Exception as e:
+                print(f"[Title] generation failed session={session_id}: {e}")
+            finally:
+                self._queue.task_done()  # type: ignore[union-attr]
+
+    async def _generate(self, *, user_id: uuid.UUID, session_id: uuid.UUID) -> None:
+        recent_user_messages = await get_recent_user_messages(session_id=session_id, limit=2)
+        if not recent_user_messages:
+            return
+        chat_title = await self.agent.generate_chat_title(recent_user_messages)
+        if chat_title:
+            await update_session_title(user_id=user_id, session_id=session_id, title=chat_title)
@@ -0,0 +1,83 @@
+import os
+import json
+from typing import Iterable, List, Optional
+
+from .token_budget import estimate_tokens, clip_to_tokens
+from ..Database.chat_repo import RecentMessage
+
+SUMMARY_HEADER = "Conversation so far (oldest first, abbreviated):"
+
+
+def summary_token_budget() -> int:
+    return max(100, int(os.getenv("CHAT_SUMMARY_TOKEN_BUDGET", "1500")))
+
+
+def _message_token_cap() -> int:
+    return max(10, int(os.getenv("CHAT_SUMMARY_MESSAGE_TOKENS", "120")))
+
+
+# Visible text of a stored message (assistant rows hold a `_therai` annotation)
+def message_text(row: RecentMessage) -> str:
+    content = row.content or ""
+    if row.role != "assistant":
+        return content
+    try:
+        meta = json.loads(content).get("_therai")
+    except Exception:
+        return content
+    if not isinstance(meta, dict):
+        return content
+    if meta.get("type") == "partner_received":
+        return f"[message from partner] {meta.get('text') or ''}"
+    parts = []
+    for segment in meta.get("segments") or []:
+        if segment.get("type") == "text":
+            parts.append(segment.get("content") or "")
+        elif segment.get("type") == "partner_draft":
+            parts.append(f"[drafted for partner] {segment.get('text') or ''}")
+    return " ".join(p.strip() for p in parts if p and p.strip())
+
+
+def _line(role: str, text: str) -> Optional[str]:
+    text = clip_to_tokens(" ".join((text or "").split()), _message_token_cap())
+    if not text:
+        return None
+    return f"{'User' if role == 'user' else 'Assistant'}: {text}"
+
+
+# Keep the newest lines that fit the budget
+def _cap(lines: List[str], budget: int) -> List[str]:
+    kept, used = [], estimate_tokens(SUMMARY_HEADER)
+    for line in reversed(lines):
+        cost = estimate_tokens(line) + 1
+        if used + cost > budget:
+            break
+        kept.append(line)
+        used += cost
+    kept.reverse()
+    return kept
+
+
+def _lines(summary: Optional[str]) -> List[str]:
+    if not summary:
+        return []
+    return [line for line in summary.splitlines()[1:] if line.strip()]
+
+
+def _render(lines: List[str]) -> Optional[str]:
+    return "\n".join([SUMMARY_HEADER] + lines) if lines else None
+
+
+# Fold one finished turn into the rolling summary; oldest lines fall off once over budget
+def fold_turn(summary: Optional[str], *, user_text: str, assistant_text: str, budget: Optional[int] = None) -> Optional[str]:
+    lines = _lines(summary)
+    for line in (_line("user", user_text), _line("assistant", assistant_text)):
+        if line:
+            lines.append(line)
+    return _render(_cap(lines, budget or summary_token_budget()))
+
+
+# Build a summary from stored message rows (oldest first); used once for sessions that predate summaries
+def summary_from_rows(rows: Iterable[RecentMessage], *, budget: Optional[int] = None) -> Optional[str]:
+    lines = [line for line in (_line(r.role or "", message_text(r)) for r in rows) if line]
+    return _render(_cap(lines, budget or summary_token_budget()))
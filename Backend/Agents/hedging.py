@@ -0,0 +1,169 @@
+import os
+import time
+import asyncio
+from collections import deque
+from contextlib import asynccontextmanager
+from typing import AsyncContextManager, Callable, Deque, Dict, List, Optional
+
+from .admission import admission
+from ..Metrics.metrics import counter, histogram
+
+hedges_started = counter("chat_hedge_requests_total", "Hedged (duplicate) stream requests started")
+hedge_outcomes = counter("chat_hedge_outcomes_total", "Which request of a hedged pair produced the first delta, by winner")
+hedges_skipped = counter("chat_hedge_skipped_total", "Hedges that were due but not started, by reason")
+hedge_extra_input_tokens = counter("chat_hedge_extra_input_tokens_total", "Estimated input tokens billed for the losing request of hedged pairs")
+first_delta_seconds = histogram("chat_openai_first_delta_seconds", "Time from opening an OpenAI stream to its first text delta")
+
+_FIRST_DELTA = "response.output_text.delta"
+_END = object()
+
+
+class HedgePolicy:
+    """When to send a second, identical stream request.
+
+    The hedge delay is the `percentile` of recent times-to-first-delta (default delay until
+    `min_samples` exist, never below `min_delay_ms`). Hedges are capped at `max_rate` of requests
+    by a small credit bucket, and only start when admission control has a slot free right now.
+    """
+
+    def __init__(self, *, enabled: Optional[bool] = None, percentile: Optional[float] = None,
+                 min_delay_ms: Optional[float] = None, default_delay_ms: Optional[float] = None,
+                 max_rate: Optional[float] = None, min_samples: int = 20, window: int = 500):
+        self.enabled = (os.getenv("CHAT_HEDGE_ENABLED", "false").strip().lower() == "true") if enabled is None else enabled
+        self.percentile = min(0.999, max(0.5, float(os.getenv("CHAT_HEDGE_PERCENTILE", "0.95") if percentile is None else percentile)))
+        self.min_delay = max(0.0, float(os.getenv("CHAT_HEDGE_MIN_DELAY_MS", "500") if min_delay_ms is None else min_delay_ms) / 1000.0)
+        self.default_delay = max(self.min_delay, float(os.getenv("CHAT_HEDGE_DEFAULT_DELAY_MS", "2500") if default_delay_ms is None else default_delay_ms) / 1000.0)
+        self.max_rate = min(1.0, max(0.0, float(os.getenv("CHAT_HEDGE_MAX_RATE", "0.1") if max_rate is None else max_rate)))
+        self.min_samples = min_samples
+        self._samples: Deque[float] = deque(maxlen=window)
+        self._credits = 1.0
+
+    def delay(self) -> float:
+        if len(self._samples) < self.min_samples:
+            return self.default_delay
+        ordered = sorted(self._samples)
+        return max(self.min_delay, ordered[min(len(ordered) - 1, int(self.percentile * len(ordered)))])
+
+    # Called once per stream request; earns the credit that hedges spend
+    def note_request(self) -> None:
+        self._credits = min(5.0, self._credits + self.max_rate)
+
+    def record_first_delta(self, seconds: float) -> None:
+        self._samples.append(seconds)
+        first_delta_seconds.observe(seconds)
+
+    def take_hedge(self) -> bool:
+        if self._credits < 1.0:
+            hedges_skipped.inc(reason="rate_cap")
+            return False
+        if not admission.try_acquire(kind="hedge"):
+            hedges_skipped.inc(reason="no_slot")
+            return False
+        self._credits -= 1.0
+        return True
+
+
+# Stream from `open_stream()` (an async context manager yielding an event iterator), hedged per `policy`:
+# if the first text delta hasn't arrived after policy.delay(), an identical second request starts. The
+# first request to produce a delta wins; its buffered events are replayed and the other is cancelled
+# (closing its HTTP stream). An error before any delta only surfaces once no request is left running.
+@asynccontextmanager
+async def hedged_stream(open_stream: Callable[[], AsyncContextManager], policy: HedgePolicy):
+    q: asyncio.Queue = asyncio.Queue()
+    tasks: Dict[int, asyncio.Task] = {}
+    started: Dict[int, float] = {}
+
+    async def pump(idx: int) -> None:
+        try:
+            async with open_stream() as stream:
+                async for event in stream:
+                    q.put_nowait((idx, event))
+            q.put_nowait((idx, _END))
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            q.put_nowait((idx, e))
+
+    def launch(idx: int) -> None:
+        started[idx] = time.monotonic()
+        tasks[idx] = asyncio.create_task(pump(idx))
+        if idx == 1:
+            # Done callback, not a finally: a task cancelled before it first runs never executes its body
+            tasks[idx].add_done_callback(lambda _t: admission.release(kind="hedge"))
+
+    def cancel_others(winner: int) -> None:
+        for idx, task in tasks.items():
+            if idx != winner and not task.done():
+                task.cancel()
+
+    async def events():
+        buffered: Dict[int, List] = {0: []}
+        failed: Dict[int, Exception] = {}
+        winner: Optional[int] = None
+        policy.note_request()
+        launch(0)
+        hedge_at = started[0] + policy.delay()
+        get_task = None
+        try:
+            while True:
+                if get_task is None:
+                    get_task = asyncio.ensure_future(q.get())
+                timeout = None
+                if winner is None and 1 not in tasks and 0 not in failed:
+                    timeout = max(0.0, hedge_at - time.monotonic())
+                ready, _ = await asyncio.wait({get_task}, timeout=timeout)
+                if not ready:
+                    if policy.take_hedge():
+                        hedges_started.inc()
+                        print(f"[LLM] no first delta after {policy.delay():.2f}s; hedging stream request")
+                        buffered[1] = []
+                        launch(1)
+                    else:
+                        hedge_at = float("inf")
+                    continue
+                idx, item = get_task.result()
+                get_task = None
+
+                if winner is not None:
+                    if idx != winner:
+                        continue
+                    if item is _END:
+                        return
+                    if isinstance(item, Exception):
+                        raise item
+                    if 1 in tasks and getattr(item, "type", "") == "response.completed":
+                        # The loser was billed for (roughly) the same input
+                        usage = getattr(getattr(item, "response", None), "usage", None)
+                        hedge_extra_input_tokens.inc(int(getattr(usage, "input_tokens", 0) or 0))
+                    yield item
+                    continue
+
+                if isinstance(item, Exception):
+                    failed[idx] = item
+                    if all(i in failed for i in tasks):
+                        raise item
+                    continue
+                if item is _END or getattr(item, "type", "") == _FIRST_DELTA:
+                    winner = idx
+                    cancel_others(idx)
+                    if item is not _END:
+                        policy.record_first_delta(time.monotonic() - started[idx])
+                    if 1 in tasks:
+                        hedge_outcomes.inc(winner="hedge" if idx == 1 else "original")
+                    for event in buffered[idx]:
+                        yield event
+                    if item is _END:
+                        return
+                    yield item
+                    continue
+                buffered[idx].append(item)
+        finally:
+            if get_task is not None:
+                get_task.cancel()
+
+    try:
+        yield events()
+    finally:
+        for task in tasks.values():
+            task.cancel()
+        await asyncio.gather(*tasks.values(), return_exceptions=True)
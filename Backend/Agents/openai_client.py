@@ -0,0 +1,126 @@
+import os
+import threading
+from pathlib import Path
+from typing import Optional
+
+import httpx
+from dotenv import load_dotenv
+from openai import AsyncOpenAI
+
+from ..Metrics.metrics import counter, gauge
+
+load_dotenv(dotenv_path = Path(__file__).resolve().parent.parent / ".env")
+
+openai_requests = counter("openai_http_requests_total", "HTTP requests sent to the OpenAI API")
+openai_connections_opened = counter("openai_http_connections_opened_total", "New TCP connections opened to the OpenAI API")
+openai_input_tokens = counter("openai_input_tokens_total", "Input tokens billed by the OpenAI API, by agent and whether they hit the prompt cache")
+openai_output_tokens = counter("openai_output_tokens_total", "Output tokens generated by the OpenAI API, by agent")
+openai_in_flight = gauge("openai_http_in_flight_requests", "OpenAI HTTP requests in flight (streams count until their body is closed)")
+
+_client: Optional[AsyncOpenAI] = None
+_client_lock = threading.Lock()
+
+
+async def _trace(event_name: str, info: dict) -> None:
+    if event_name == "connection.connect_tcp.complete":
+        openai_connections_opened.inc()
+
+
+class _InFlightStream(httpx.AsyncByteStream):
+    def __init__(self, stream: httpx.AsyncByteStream):
+        self._stream = stream
+        self._closed = False
+
+    async def __aiter__(self):
+        async for chunk in self._stream:
+            yield chunk
+
+    async def aclose(self) -> None:
+        if not self._closed:
+            self._closed = True
+            openai_in_flight.dec()
+        await self._stream.aclose()
+
+
+class _InstrumentedTransport(httpx.AsyncHTTPTransport):
+    """Pooled transport that counts requests, new connections and requests in flight."""
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        request.extensions = {**request.extensions, "trace": _trace}
+        openai_requests.inc()
+        openai_in_flight.inc()
+        try:
+            response = await super().handle_async_request(request)
+        except BaseException:
+            openai_in_flight.dec()
+            raise
+        response.stream = _InFlightStream(response.stream)
+        return response
+
+
+def _http2_enabled() -> bool:
+    if os.getenv("OPENAI_HTTP2", "true").strip().lower() == "false":
+        return False
+    try:
+        import h2  # noqa: F401
+    except ImportError:
+        print("[OpenAI] h2 not installed; using HTTP/1.1 (pip install 'httpx[http2]')")
+        return False
+    return True
+
+
+def _build_client() -> AsyncOpenAI:
+    limits = httpx.Limits(
+        max_connections = int(os.getenv("OPENAI_MAX_CONNECTIONS", "100")),
+        max_keepalive_connections = int(os.getenv("OPENAI_MAX_KEEPALIVE_CONNECTIONS", "20")),
+        keepalive_expiry = float(os.getenv("OPENAI_KEEPALIVE_EXPIRY_SECONDS", "30")),
+    )
+    timeout = httpx.Timeout(
+        float(os.getenv("OPENAI_TIMEOUT_SECONDS", "120")),
+        connect = float(os.getenv("OPENAI_CONNECT_TIMEOUT_SECONDS", "5")),
+    )
+    http2 = _http2_enabled()
+    http_client = httpx.AsyncClient(
+        transport = _InstrumentedTransport(limits = limits, http2 = http2),
+        timeout = timeout,
+        follow_redirects = True,
+    )
+    print(f"[OpenAI] shared client max_connections={limits.max_connections} keepalive={limits.max_keepalive_connections} http2={http2}")
+    return AsyncOpenAI(
+        api_key = os.getenv("OPENAI_API_KEY"),
+        http_client = http_client,
+        timeout = timeout,
+        # Retries live in admission.with_backoff (jitter, shared 429 cool-down); SDK retries would stack on top
+        max_retries = int(os.getenv("OPENAI_MAX_RETRIES", "0")),
+    )
+
+
+# Process-wide AsyncOpenAI client: one connection pool (and HTTP/2 keep-alive) shared by every agent
+def get_openai_client() -> AsyncOpenAI:
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                _client = _build_client()
+    return _client
+
+
+# Record a response's token usage; returns (input_tokens, cached_input_tokens) for logging
+def record_usage(usage, *, agent: str) -> tuple[int, int]:
+    if usage is None:
+        return 0, 0
+    input_tokens = int(getattr(usage, "input_tokens", 0) or 0)
+    details = getattr(usage, "input_tokens_details", None)
+    cached = int(getattr(details, "cached_tokens", 0) or 0)
+    openai_input_tokens.inc(cached, agent=agent, cached="true")
+    openai_input_tokens.inc(max(0, input_tokens - cached), agent=agent, cached="false")
+    openai_output_tokens.inc(int(getattr(usage, "output_tokens", 0) or 0), agent=agent)
+    return input_tokens, cached
+
+
+# Close the shared pool (app shutdown)
+async def close_openai_client() -> None:
+    global _client
+    client, _client = _client, None
+    if client is not None:
+        await client.close()
@@ -0,0 +1,107 @@
+import os
+import json
+import uuid
+from datetime import datetime, timezone
+from typing import Iterable, List, Optional, Tuple
+
+from .token_budget import estimate_tokens, clip_to_tokens
+from ..Database.chat_repo import ChatMessage
+from ..Database.linked_sessions_repo import LinkedSession
+
+
+# Letter ("A"/"B") of a user within a linked_sessions row; "A" is the row's user_a_id
+def partner_letter_for(linked_row: Optional[LinkedSession], user_id: uuid.UUID) -> Optional[str]:
+    if not linked_row:
+        return None
+    if linked_row.user_a_id == user_id:
+        return "A"
+    if linked_row.user_b_id == user_id:
+        return "B"
+    return None
+
+
+# Render the materialized A/B entries of a linked session as the prompt's "Messages:" block (or under
+# another `header`), within `token_budget` tokens: the newest messages are kept (each clipped to
+# `message_tokens`), older ones are elided into a single note. Returns (text, tokens trimmed).
+def render_partner_ab_context(entries: Optional[Iterable[dict]], *, token_budget: Optional[int] = None,
+                              message_tokens: Optional[int] = None, header: str = "Messages:") -> Tuple[Optional[str], int]:
+    if token_budget is None:
+        token_budget = int(os.getenv("CHAT_PARTNER_CONTEXT_TOKEN_BUDGET", "2000"))
+    if message_tokens is None:
+        message_tokens = int(os.getenv("CHAT_PARTNER_CONTEXT_MESSAGE_TOKENS", "300"))
+
+    lines = []
+    for entry in entries or []:
+        text = ((entry or {}).get("text") or "").strip()
+        sender = (entry or {}).get("sender")
+        if text and sender in ("A", "B"):
+            lines.append(f"Partner {sender}: {text}")
+    if not lines:
+        return None, 0
+
+    full_tokens = [estimate_tokens(line) for line in lines]
+    kept: List[str] = []
+    used = estimate_tokens(header)
+    for line, tokens in zip(reversed(lines), reversed(full_tokens)):
+        if tokens > message_tokens:
+            line = clip_to_tokens(line, message_tokens)
+            tokens = estimate_tokens(line)
+        if kept and used + tokens > token_budget:
+            break
+        kept.append(line)
+        used += tokens
+    kept.reverse()
+
+    elided = len(lines) - len(kept)
+    head = [header]
+    if elided:
+        head.append(f"({elided} earlier message{'s' if elided != 1 else ''} omitted)")
+    trimmed = max(0, sum(full_tokens) - (used - estimate_tokens(header)))
+    return "\n".join(head + kept), trimmed
+
+
+def _parse_time(value) -> Optional[datetime]:
+    try:
+        parsed = datetime.fromisoformat(str(value))
+    except (TypeError, ValueError):
+        return None
+    return parsed if parsed.tzinfo else parsed.replace(tzinfo=timezone.utc)
+
+
+def _entry_time(entry: dict) -> Optional[datetime]:
+    return _parse_time(entry.get("created_at"))
+
+
+# Entries created after `watermark` (an ISO timestamp; None: all of them), in their original order
+def partner_entries_since(entries: Optional[Iterable[dict]], watermark: Optional[str]) -> List[dict]:
+    entries = [e for e in entries or [] if e]
+    since = _parse_time(watermark) if watermark else None
+    if since is None:
+        return entries
+    return [e for e in entries if (_entry_time(e) or since) > since]
+
+
+# created_at of the newest entry (the watermark a response that saw `entries` has reached), or None
+def partner_entries_watermark(entries: Optional[Iterable[dict]]) -> Optional[str]:
+    times = [t for t in (_entry_time(e) for e in entries or [] if e) if t is not None]
+    return max(times).isoformat() if times else None
+
+
+# Rebuild entries from raw session rows (`_therai.partner_received` annotations); used only when
+# the linked session has no materialized context yet
+def extract_partner_received(rows: Optional[Iterable[ChatMessage]], sender: str) -> List[dict]:
+    items = []
+    for r in rows or []:
+        try:
+            if r.role != "assistant":
+                continue
+            obj = json.loads(r.content or "")
+            meta = obj.get("_therai") if isinstance(obj, dict) else None
+            if not meta or meta.get("type") != "partner_received":
+                continue
+            if r.created_at is None:
+                continue
+            items.append({"sender": sender, "text": meta.get("text") or "", "created_at": r.created_at})
+        except Exception:
+            continue
+    return items
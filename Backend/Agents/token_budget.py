@@ -0,0 +1,31 @@
+import math
+from typing import Optional
+
+try:
+    import tiktoken
+    _encoding = tiktoken.get_encoding("o200k_base")
+except Exception as e:  # encoding data can be unavailable offline
+    print(f"[TokenBudget] tiktoken unavailable ({e!r}); estimating ~4 characters per token, "
+          "which undercounts non-English text")
+    _encoding = None
+
+
+# Token count of `text` (tiktoken when installed, else ~4 characters per token)
+def estimate_tokens(text: Optional[str]) -> int:
+    if not text:
+        return 0
+    if _encoding is not None:
+        return len(_encoding.encode(text, disallowed_special = ()))
+    return math.ceil(len(text) / 4)
+
+
+# Cut `text` to at most `max_tokens`, ending with an ellipsis when anything was dropped
+def clip_to_tokens(text: Optional[str], max_tokens: int) -> str:
+    text = (text or "").strip()
+    if max_tokens <= 0:
+        return ""
+    if estimate_tokens(text) <= max_tokens:
+        return text
+    if _encoding is not None:
+        return _encoding.decode(_encoding.encode(text, disallowed_special = ())[:max_tokens]).rstrip() + "…"
+    return text[: max_tokens * 4].rstrip() + "…"
@@ -0,0 +1,160 @@
+"""Local HTTP/2 (TLS + ALPN h2) stand-in for the APNs provider API.
+
+Accepts ``POST /3/device/<token>`` like api.push.apple.com: requests without a bearer token or
+``apns-topic`` get 403 / 400 with an APNs ``reason``, ``--bad-token-fraction`` of the rest get
+``400 BadDeviceToken`` and everything else ``200`` with an ``apns-id``, after ``--latency-ms``.
+``GET /_bench/stats`` (over the same HTTP/2 listener) returns push and connection counters.
+
+The app reaches it with ``APNS_HOST=127.0.0.1:<port>`` and trusts its self-signed certificate
+through ``SSL_CERT_FILE``; ``write_self_signed_cert`` creates one for 127.0.0.1 / localhost.
+
+Usage:
+    python -m Backend.Benchmarks.fakes.apns_fake --port 8103 --certfile apns.pem --keyfile apns.key
+"""
+
+import argparse
+import asyncio
+import datetime
+import ipaddress
+import json
+import random
+import ssl
+import uuid
+from collections import Counter
+from typing import Dict, Tuple
+
+import h2.config
+import h2.connection
+import h2.events
+from cryptography import x509
+from cryptography.hazmat.primitives import hashes, serialization
+from cryptography.hazmat.primitives.asymmetric import ec
+from cryptography.x509.oid import NameOID
+
+
+# Self-signed certificate valid for 127.0.0.1 and localhost; returns (certfile, keyfile)
+def write_self_signed_cert(directory: str) -> Tuple[str, str]:
+    key = ec.generate_private_key(ec.SECP256R1())
+    name = x509.Name([x509.NameAttribute(NameOID.COMMON_NAME, "apns-bench.local")])
+    now = datetime.datetime.now(datetime.timezone.utc)
+    cert = (
+        x509.CertificateBuilder()
+        .subject_name(name)
+        .issuer_name(name)
+        .public_key(key.public_key())
+        .serial_number(x509.random_serial_number())
+        .not_valid_before(now - datetime.timedelta(minutes=5))
+        .not_valid_after(now + datetime.timedelta(days=1))
+        .add_extension(x509.SubjectAlternativeName([
+            x509.DNSName("localhost"), x509.IPAddress(ipaddress.ip_address("127.0.0.1")),
+        ]), critical=False)
+        .add_extension(x509.BasicConstraints(ca=True, path_length=None), critical=True)
+        .sign(key, hashes.SHA256())
+    )
+    certfile, keyfile = f"{directory}/apns-bench.pem", f"{directory}/apns-bench.key"
+    with open(certfile, "wb") as f:
+        f.write(cert.public_bytes(serialization.Encoding.PEM))
+    with open(keyfile, "wb") as f:
+        f.write(key.private_bytes(serialization.Encoding.PEM, serialization.PrivateFormat.PKCS8, serialization.NoEncryption()))
+    return certfile, keyfile
+
+
+class APNsProtocol(asyncio.Protocol):
+    def __init__(self, *, stats: Counter, latency: float, bad_token_fraction: float):
+        self.stats = stats
+        self.latency = latency
+        self.bad_token_fraction = bad_token_fraction
+        self.conn = h2.connection.H2Connection(config=h2.config.H2Configuration(client_side=False, header_encoding="utf-8"))
+        self.transport = None
+        self.requests: Dict[int, dict] = {}
+
+    def connection_made(self, transport):
+        self.transport = transport
+        self.stats["connections"] += 1
+        self.conn.initiate_connection()
+        transport.write(self.conn.data_to_send())
+
+    def data_received(self, data: bytes):
+        try:
+            events = self.conn.receive_data(data)
+        except Exception:
+            self.transport.close()
+            return
+        for event in events:
+            if isinstance(event, h2.events.RequestReceived):
+                self.requests[event.stream_id] = {"headers": dict(event.headers), "body": b""}
+            elif isinstance(event, h2.events.DataReceived):
+                self.requests[event.stream_id]["body"] += event.data
+                self.conn.acknowledge_received_data(event.flow_controlled_length, event.stream_id)
+            elif isinstance(event, h2.events.StreamEnded):
+                request = self.requests.pop(event.stream_id, None)
+                if request is not None:
+                    asyncio.ensure_future(self.respond(event.stream_id, request))
+            elif isinstance(event, h2.events.ConnectionTerminated):
+                self.transport.close()
+        self.transport.write(self.conn.data_to_send())
+
+    async def respond(self, stream_id: int, request: dict):
+        headers = request["headers"]
+        path, method = headers.get(":path", ""), headers.get(":method", "")
+        if method == "GET" and path == "/_bench/stats":
+            status, body = 200, dict(self.stats)
+        elif method != "POST" or not path.startswith("/3/device/"):
+            status, body = 405, {"reason": "MethodNotAllowed"}
+        elif not headers.get("authorization", "").startswith("bearer "):
+            status, body = 403, {"reason": "MissingProviderToken"}
+        elif not headers.get("apns-topic"):
+            status, body = 400, {"reason": "MissingTopic"}
+        elif random.random() < self.bad_token_fraction:
+            status, body = 400, {"reason": "BadDeviceToken"}
+        else:
+            status, body = 200, None
+        if path.startswith("/3/device/"):
+            self.stats["pushes"] += 1
+            self.stats[f"status_{status}"] += 1
+            if self.latency:
+                await asyncio.sleep(self.latency)
+        if self.transport.is_closing():
+            return
+        payload = json.dumps(body).encode() if body is not None else b""
+        response_headers = [(":status", str(status)), ("apns-id", str(uuid.uuid4()))]
+        if payload:
+            response_headers.append(("content-type", "application/json"))
+        try:
+            self.conn.send_headers(stream_id, response_headers, end_stream=not payload)
+            if payload:
+                self.conn.send_data(stream_id, payload, end_stream=True)
+        except Exception:
+            return
+        self.transport.write(self.conn.data_to_send())
+
+
+async def serve(*, host: str, port: int, certfile: str, keyfile: str, latency_ms: float, bad_token_fraction: float) -> None:
+    context = ssl.create_default_context(ssl.Purpose.CLIENT_AUTH)
+    context.load_cert_chain(certfile, keyfile)
+    context.set_alpn_protocols(["h2"])
+    stats: Counter = Counter()
+    loop = asyncio.get_running_loop()
+    server = await loop.create_server(
+        lambda: APNsProtocol(stats=stats, latency=max(0.0, latency_ms / 1000.0), bad_token_fraction=bad_token_fraction),
+        host, port, ssl=context,
+    )
+    async with server:
+        await server.serve_forever()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8103)
+    parser.add_argument("--certfile", required=True)
+    parser.add_argument("--keyfile", required=True)
+    parser.add_argument("--latency-ms", type=float, default=20.0)
+    parser.add_argument("--bad-token-fraction", type=float, default=0.0)
+    args = parser.parse_args()
+    asyncio.run(serve(host=args.host, port=args.port, certfile=args.certfile, keyfile=args.keyfile,
+                      latency_ms=args.latency_ms, bad_token_fraction=args.bad_token_fraction))
+
+
+if __name__ == "__main__":
+    main()
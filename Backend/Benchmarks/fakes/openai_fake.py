@@ -0,0 +1,195 @@
+"""Local stand-in for the OpenAI Responses API (``POST /v1/responses``).
+
+Streaming requests get the event sequence the SDK's ``responses.stream`` expects:
+``response.created``, the output item / content part events, ``--tokens`` text deltas paced at
+``--tokens-per-second`` after ``--ttft-ms``, then ``response.completed`` with usage. Non-streaming
+requests (the title agent) get a complete response body after the same delay.
+
+Usage is estimated from the request (about 4 characters per input token). Requests that share a
+``prompt_cache_key`` report the common prefix with that key's previous input as cached tokens
+(in 128-token steps from 1024 tokens, like the real prompt cache). Response ids are remembered, so
+an unknown ``previous_response_id`` gets the same 400 the real API returns, and
+``--rate-limit-fraction`` answers that share of requests with a 429 and ``retry-after-ms``.
+
+``GET /_bench/stats`` returns request and token counters for the load driver.
+
+Usage:
+    python -m Backend.Benchmarks.fakes.openai_fake --port 8101 --tokens 200 --tokens-per-second 80
+"""
+
+import argparse
+import asyncio
+import json
+import random
+import time
+import uuid
+from collections import Counter
+
+import uvicorn
+from starlette.applications import Starlette
+from starlette.responses import JSONResponse, StreamingResponse
+from starlette.routing import Route
+
+_WORDS = ("that", "sounds", "really", "hard", "and", "it", "makes", "sense", "you", "feel", "hurt", "when",
+          "your", "partner", "does", "not", "notice", "what", "would", "help", "most", "right", "now", "maybe")
+
+
+def _estimate_tokens(text: str) -> int:
+    return max(1, len(text) // 4)
+
+
+def _cached_tokens(previous: str, current: str) -> int:
+    common = 0
+    for a, b in zip(previous, current):
+        if a != b:
+            break
+        common += 1
+    tokens = common // 4
+    return 0 if tokens < 1024 else (tokens // 128) * 128
+
+
+def _text(tokens: int) -> list:
+    return [_WORDS[i % len(_WORDS)] + " " for i in range(tokens)]
+
+
+def build_app(*, tokens: int, tokens_per_second: float, ttft_ms: float, jitter: float = 0.1,
+              rate_limit_fraction: float = 0.0) -> Starlette:
+    stats: Counter = Counter()
+    known_responses: set = set()
+    cache_prefixes: dict = {}
+    interval = 1.0 / tokens_per_second if tokens_per_second > 0 else 0.0
+
+    def response_body(response_id: str, model: str, status: str, output_text: str, usage: dict | None) -> dict:
+        output = []
+        if status == "completed":
+            output = [{
+                "id": f"msg_{response_id[5:]}",
+                "type": "message",
+                "role": "assistant",
+                "status": "completed",
+                "content": [{"type": "output_text", "text": output_text, "annotations": []}],
+            }]
+        return {
+            "id": response_id,
+            "object": "response",
+            "created_at": int(time.time()),
+            "model": model,
+            "status": status,
+            "output": output,
+            "parallel_tool_calls": True,
+            "tool_choice": "auto",
+            "tools": [],
+            "usage": usage,
+        }
+
+    def usage_for(body: dict, output_tokens: int) -> dict:
+        serialized = json.dumps(body.get("input"), sort_keys=True)
+        input_tokens = _estimate_tokens(serialized)
+        cached = 0
+        key = body.get("prompt_cache_key")
+        if key:
+            if key in cache_prefixes:
+                cached = min(input_tokens, _cached_tokens(cache_prefixes[key], serialized))
+            cache_prefixes[key] = serialized
+        stats["input_tokens"] += input_tokens
+        stats["cached_input_tokens"] += cached
+        stats["output_tokens"] += output_tokens
+        return {
+            "input_tokens": input_tokens,
+            "input_tokens_details": {"cached_tokens": cached},
+            "output_tokens": output_tokens,
+            "output_tokens_details": {"reasoning_tokens": 0},
+            "total_tokens": input_tokens + output_tokens,
+        }
+
+    async def first_token_delay() -> None:
+        await asyncio.sleep(max(0.0, ttft_ms / 1000.0 * random.uniform(1 - jitter, 1 + jitter)))
+
+    async def responses(request):
+        body = await request.json()
+        stats["requests"] += 1
+        if random.random() < rate_limit_fraction:
+            stats["rate_limited"] += 1
+            return JSONResponse(
+                {"error": {"message": "Rate limit reached (benchmark stand-in)", "type": "requests", "code": "rate_limit_exceeded"}},
+                status_code=429, headers={"retry-after-ms": "200"},
+            )
+        previous = body.get("previous_response_id")
+        if previous and previous not in known_responses:
+            stats["unknown_previous_response"] += 1
+            return JSONResponse(
+                {"error": {"message": f"Previous response with id '{previous}' not found.", "type": "invalid_request_error",
+                           "param": "previous_response_id", "code": "previous_response_not_found"}},
+                status_code=400,
+            )
+
+        response_id = f"resp_{uuid.uuid4().hex}"
+        model = body.get("model") or "gpt-5"
+        words = _text(tokens)
+        known_responses.add(response_id)
+
+        if not body.get("stream"):
+            stats["non_streaming"] += 1
+            await first_token_delay()
+            return JSONResponse(response_body(response_id, model, "completed", "".join(words[:8]).strip(), usage_for(body, min(8, tokens))))
+
+        stats["streaming"] += 1
+
+        async def events():
+            seq = 0
+
+            def frame(payload: dict) -> bytes:
+                nonlocal seq
+                payload["sequence_number"] = seq
+                seq += 1
+                return f"event: {payload['type']}\ndata: {json.dumps(payload)}\n\n".encode()
+
+            item_id = f"msg_{response_id[5:]}"
+            yield frame({"type": "response.created", "response": response_body(response_id, model, "in_progress", "", None)})
+            await first_token_delay()
+            yield frame({"type": "response.output_item.added", "output_index": 0,
+                         "item": {"id": item_id, "type": "message", "role": "assistant", "status": "in_progress", "content": []}})
+            yield frame({"type": "response.content_part.added", "item_id": item_id, "output_index": 0, "content_index": 0,
+                         "part": {"type": "output_text", "text": "", "annotations": []}})
+            for i, word in enumerate(words):
+                if i and interval:
+                    await asyncio.sleep(interval)
+                stats["deltas"] += 1
+                yield frame({"type": "response.output_text.delta", "item_id": item_id, "output_index": 0,
+                             "content_index": 0, "delta": word, "logprobs": []})
+            text = "".join(words)
+            yield frame({"type": "response.output_text.done", "item_id": item_id, "output_index": 0,
+                         "content_index": 0, "text": text, "logprobs": []})
+            yield frame({"type": "response.output_item.done", "output_index": 0,
+                         "item": {"id": item_id, "type": "message", "role": "assistant", "status": "completed",
+                                  "content": [{"type": "output_text", "text": text, "annotations": []}]}})
+            yield frame({"type": "response.completed",
+                         "response": response_body(response_id, model, "completed", text, usage_for(body, tokens))})
+
+        return StreamingResponse(events(), media_type="text/event-stream")
+
+    async def bench_stats(request):
+        return JSONResponse(dict(stats))
+
+    return Starlette(routes=[
+        Route("/v1/responses", responses, methods=["POST"]),
+        Route("/_bench/stats", bench_stats, methods=["GET"]),
+    ])
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8101)
+    parser.add_argument("--tokens", type=int, default=200, help="Output tokens (text deltas) per response")
+    parser.add_argument("--tokens-per-second", type=float, default=80.0)
+    parser.add_argument("--ttft-ms", type=float, default=400.0, help="Delay before the first delta")
+    parser.add_argument("--rate-limit-fraction", type=float, default=0.0)
+    args = parser.parse_args()
+    app = build_app(tokens=args.tokens, tokens_per_second=args.tokens_per_second, ttft_ms=args.ttft_ms,
+                    rate_limit_fraction=args.rate_limit_fraction)
+    uvicorn.run(app, host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,495 @@
+"""In-memory stand-in for the parts of Supabase the Backend talks to.
+
+* PostgREST (``/rest/v1``): select / insert / upsert / update / delete on any table, with the
+  filters, ordering, paging, ``or=`` groups, ``Prefer`` handling and ``Content-Range`` counts that
+  the ``Database`` repos use through postgrest-py. Tables are created on first write; primary keys
+  and column defaults for the app's tables are in ``PRIMARY_KEYS`` / ``DEFAULTS``.
+* RPCs the repos call (``/rest/v1/rpc/<name>``), implemented with the semantics of their SQL.
+* Auth: the JWKS document (``/auth/v1/keys``) for the key the load driver signs user tokens with,
+  and the admin user lookup.
+* Storage: object upload and signed URLs.
+* The triggers the migrations add (the per-session message counters of 004, the session
+  ``updated_at`` touch and deletion tombstones of 007).
+
+Every request waits ``--latency-ms`` first, standing in for the round trip to the hosted project,
+so the number of sequential queries per endpoint shows up in its latency. State lives in one
+event loop, so each statement is atomic (enough for the conditional updates the repos rely on).
+
+``GET /_bench/stats`` returns request counts by method and table, and the PostgREST/RPC response
+body bytes (``response_bytes``), for the load driver.
+
+Usage:
+    python -m Backend.Benchmarks.fakes.supabase_fake --port 8102 --jwks-file jwks.json --latency-ms 5
+"""
+
+import argparse
+import asyncio
+import fnmatch
+import json
+import re
+import uuid
+from collections import Counter, defaultdict
+from datetime import datetime, timezone
+from typing import Callable, Dict, List, Optional, Tuple
+
+import uvicorn
+from starlette.applications import Starlette
+from starlette.requests import Request
+from starlette.responses import JSONResponse, Response
+from starlette.routing import Route
+
+PRIMARY_KEYS: Dict[str, Tuple[str, ...]] = {
+    "profiles": ("user_id",),
+    "chat_stream_events": ("stream_id", "event_id"),
+}
+
+DEFAULTS: Dict[str, Callable[[], dict]] = {
+    "linked_sessions": lambda: {"partner_context": []},
+    "user_chat_sessions": lambda: {"title": None, "last_message_content": None, "last_response_id": None,
+                                   "last_response_tokens": None, "last_response_partner_context_at": None, "context_summary": None, "message_count": 0,
+                                   "user_message_count": 0, "assistant_message_count": 0, "partner_received_count": 0},
+    "chat_streams": lambda: {"followed_at": None, "stop_requested": None},
+    "device_tokens": lambda: {"enabled": True},
+    "partner_requests": lambda: {"status": "pending", "recipient_session_id": None, "created_message_id": None},
+}
+
+_SESSION_LIST_COLUMNS = ("title", "last_message_at", "last_message_content")
+
+_PARTNER_RECEIVED_PREFIX = '{"_therai": {"type": "partner_received"'
+
+_RESERVED = {"select", "order", "limit", "offset", "on_conflict", "columns"}
+
+
+class PostgrestError(Exception):
+    def __init__(self, status: int, code: str, message: str):
+        super().__init__(message)
+        self.status = status
+        self.code = code
+        self.message = message
+
+    def response(self) -> JSONResponse:
+        return JSONResponse({"code": self.code, "message": self.message, "details": None, "hint": None}, status_code=self.status)
+
+
+def _now() -> str:
+    return datetime.now(timezone.utc).isoformat()
+
+
+def _split_top(value: str) -> List[str]:
+    parts, depth, current = [], 0, []
+    for ch in value:
+        if ch == "(":
+            depth += 1
+        elif ch == ")":
+            depth -= 1
+        if ch == "," and depth == 0:
+            parts.append("".join(current))
+            current = []
+        else:
+            current.append(ch)
+    if current:
+        parts.append("".join(current))
+    return parts
+
+
+def _coerce(stored, raw: str):
+    if isinstance(stored, bool):
+        return raw.lower() == "true"
+    if isinstance(stored, (int, float)):
+        try:
+            return float(raw)
+        except ValueError:
+            return raw
+    return raw
+
+
+def _compare(stored, op: str, raw: str) -> bool:
+    if op == "is":
+        target = {"null": None, "true": True, "false": False}.get(raw.lower(), raw)
+        return stored is target
+    if op == "in":
+        values = [v.strip().strip('"') for v in _split_top(raw.strip()[1:-1])]
+        return stored is not None and any(stored == _coerce(stored, v) or str(stored) == v for v in values)
+    if stored is None:
+        return False
+    if len(raw) >= 2 and raw[0] == raw[-1] == '"':
+        # Quoted values (or= groups): PostgREST unescapes \" and \\
+        raw = re.sub(r'\\(.)', r'\1', raw[1:-1])
+    value = _coerce(stored, raw)
+    if op == "eq":
+        return stored == value or str(stored) == raw
+    if op == "neq":
+        return not (stored == value or str(stored) == raw)
+    if op in ("like", "ilike"):
+        pattern = raw.replace("%", "*")
+        return fnmatch.fnmatch(str(stored).lower(), pattern.lower()) if op == "ilike" else fnmatch.fnmatchcase(str(stored), pattern)
+    try:
+        if op == "gt":
+            return stored > value
+        if op == "gte":
+            return stored >= value
+        if op == "lt":
+            return stored < value
+        if op == "lte":
+            return stored <= value
+    except TypeError:
+        return False
+    raise PostgrestError(400, "PGRST100", f"unsupported operator: {op}")
+
+
+# One "op.value" (or "not.op.value") filter against a column
+def _condition(column: str, expr: str) -> Callable[[dict], bool]:
+    negate = expr.startswith("not.")
+    if negate:
+        expr = expr[4:]
+    op, _, raw = expr.partition(".")
+    return lambda row: _compare(row.get(column), op, raw) != negate
+
+
+# or=(a.eq.x,b.eq.y) / and=(...)
+def _group(kind: str, expr: str) -> Callable[[dict], bool]:
+    conditions = []
+    for part in _split_top(expr.strip()[1:-1]):
+        if part.startswith(("or(", "and(")):
+            inner_kind, _, rest = part.partition("(")
+            conditions.append(_group(inner_kind, "(" + rest))
+            continue
+        column, _, rest = part.partition(".")
+        conditions.append(_condition(column, rest))
+    combine = any if kind == "or" else all
+    return lambda row: combine(c(row) for c in conditions)
+
+
+def _filters(request: Request) -> List[Callable[[dict], bool]]:
+    filters = []
+    for key, value in request.query_params.multi_items():
+        if key in _RESERVED:
+            continue
+        if key in ("or", "and"):
+            filters.append(_group(key, value))
+        else:
+            filters.append(_condition(key, value))
+    return filters
+
+
+def _order_key(row: dict, column: str):
+    value = row.get(column)
+    return (value is None, value if value is not None else "")
+
+
+def _project(rows: List[dict], select: Optional[str]) -> List[dict]:
+    if not select or select.strip() == "*":
+        return [dict(r) for r in rows]
+    columns = [c.strip() for c in select.split(",") if c.strip()]
+    return [{c: r.get(c) for c in columns} for r in rows]
+
+
+def _prefer(request: Request) -> Dict[str, str]:
+    prefs = {}
+    for part in request.headers.get("prefer", "").split(","):
+        key, _, value = part.strip().partition("=")
+        if key:
+            prefs[key] = value
+    return prefs
+
+
+class Store:
+    def __init__(self):
+        self.tables: Dict[str, List[dict]] = defaultdict(list)
+        self.objects: Dict[str, bytes] = {}
+
+    def primary_key(self, table: str) -> Tuple[str, ...]:
+        return PRIMARY_KEYS.get(table, ("id",))
+
+    def _new_row(self, table: str, values: dict) -> dict:
+        row = DEFAULTS.get(table, dict)()
+        if self.primary_key(table) == ("id",):
+            row["id"] = str(uuid.uuid4())
+        row["created_at"] = _now()
+        row.update(values)
+        return row
+
+    def _find(self, table: str, columns: Tuple[str, ...], values: dict) -> Optional[dict]:
+        key = tuple(str(values.get(c)) for c in columns)
+        for row in self.tables[table]:
+            if tuple(str(row.get(c)) for c in columns) == key:
+                return row
+        return None
+
+    def select(self, table: str, filters, order: Optional[str], limit: Optional[int], offset: int) -> Tuple[List[dict], int]:
+        rows = [r for r in self.tables.get(table, []) if all(f(r) for f in filters)]
+        if order:
+            for term in reversed(order.split(",")):
+                column, _, direction = term.partition(".")
+                rows.sort(key=lambda r: _order_key(r, column), reverse=direction.startswith("desc"))
+        total = len(rows)
+        rows = rows[offset:]
+        if limit is not None:
+            rows = rows[:limit]
+        return rows, total
+
+    def insert(self, table: str, payload: List[dict], *, on_conflict: Optional[Tuple[str, ...]], resolution: Optional[str]) -> List[dict]:
+        written = []
+        for values in payload:
+            columns = on_conflict or self.primary_key(table)
+            existing = self._find(table, columns, values) if all(c in values for c in columns) else None
+            if existing is not None:
+                if resolution == "merge-duplicates":
+                    before = dict(existing)
+                    existing.update(values)
+                    self._row_changed(table, before, existing)
+                    written.append(existing)
+                    continue
+                if resolution == "ignore-duplicates":
+                    continue
+                raise PostgrestError(409, "23505", f'duplicate key value violates unique constraint "{table}_pkey"')
+            row = self._new_row(table, values)
+            self.tables[table].append(row)
+            self._row_changed(table, None, row)
+            written.append(row)
+        return written
+
+    def update(self, table: str, filters, values: dict) -> List[dict]:
+        rows = [r for r in self.tables.get(table, []) if all(f(r) for f in filters)]
+        for row in rows:
+            before = dict(row)
+            row.update(values)
+            self._row_changed(table, before, row)
+        return rows
+
+    def delete(self, table: str, filters) -> List[dict]:
+        rows = self.tables.get(table, [])
+        removed = [r for r in rows if all(f(r) for f in filters)]
+        self.tables[table] = [r for r in rows if not any(r is d for d in removed)]
+        for row in removed:
+            self._row_changed(table, row, None)
+        if table == "chat_streams" and removed:
+            gone = {r["id"] for r in removed}
+            self.tables["chat_stream_events"] = [e for e in self.tables.get("chat_stream_events", []) if e.get("stream_id") not in gone]
+        return removed
+
+    # -- Triggers ---------------------------------------------------------------------------------
+
+    def _row_changed(self, table: str, before: Optional[dict], after: Optional[dict]) -> None:
+        if table == "user_chat_messages":
+            if before is not None:
+                self._count_message(before, -1)
+            if after is not None:
+                self._count_message(after, 1)
+        if table == "user_chat_sessions":
+            self._session_changed(before, after)
+
+    # touch_chat_session_updated_at / record_chat_session_tombstone (migration 007)
+    def _session_changed(self, before: Optional[dict], after: Optional[dict]) -> None:
+        if before is None:
+            after.setdefault("updated_at", after.get("created_at") or _now())
+        elif after is None:
+            tombstones = self.tables["user_chat_session_tombstones"]
+            tombstones[:] = [t for t in tombstones if t["session_id"] != before["id"]]
+            tombstones.append({"session_id": before["id"], "user_id": before.get("user_id"), "deleted_at": _now()})
+        elif any(before.get(c) != after.get(c) for c in _SESSION_LIST_COLUMNS):
+            after["updated_at"] = _now()
+
+    # user_chat_messages_count_trigger (migration 004)
+    def _count_message(self, message: dict, delta: int) -> None:
+        session = self._find("user_chat_sessions", ("id",), {"id": message.get("session_id")})
+        if session is None:
+            return
+        role = message.get("role")
+        columns = ["message_count"]
+        if role in ("user", "assistant"):
+            columns.append(f"{role}_message_count")
+        if role == "assistant" and str(message.get("content") or "").startswith(_PARTNER_RECEIVED_PREFIX):
+            columns.append("partner_received_count")
+        for column in columns:
+            session[column] = (session.get(column) or 0) + delta
+
+    # -- RPCs ---------------------------------------------------------------------------------
+
+    def rpc_chat_sessions_version(self, p_user_id: str):
+        stamps = [r.get("updated_at") for r in self.tables.get("user_chat_sessions", []) if r.get("user_id") == p_user_id]
+        stamps += [t["deleted_at"] for t in self.tables.get("user_chat_session_tombstones", []) if t.get("user_id") == p_user_id]
+        stamps = [s for s in stamps if s]
+        return max(stamps, key=datetime.fromisoformat) if stamps else None
+
+    def rpc_append_linked_session_partner_context(self, p_linked_session_id: str, p_sender: str, p_text: str,
+                                                   p_max_entries: int = 500):
+        for row in self.tables.get("linked_sessions", []):
+            if row.get("id") == p_linked_session_id:
+                entries = list(row.get("partner_context") or [])
+                entries.append({"sender": p_sender, "text": p_text, "created_at": _now()})
+                row["partner_context"] = entries[-p_max_entries:]
+        return None
+
+    def rpc_append_chat_message(self, p_user_id: str, p_session_id: str, p_role: str, p_content: str,
+                                p_last_message_content: Optional[str] = None, p_partner_request_id: Optional[str] = None,
+                                p_partner_request_mode: Optional[str] = None, p_linked_session_id: Optional[str] = None,
+                                p_partner_context_sender: Optional[str] = None):
+        if p_partner_request_id is not None and p_partner_request_mode not in ("attach", "accept"):
+            raise PostgrestError(400, "P0001", f"Invalid partner request mode: {p_partner_request_mode}")
+        if p_linked_session_id is not None and p_partner_context_sender not in ("A", "B"):
+            raise PostgrestError(400, "P0001", f"Invalid partner context sender: {p_partner_context_sender}")
+        message = self.insert("user_chat_messages", [{"user_id": p_user_id, "session_id": p_session_id,
+                                                      "role": p_role, "content": p_content}],
+                              on_conflict=None, resolution=None)[0]
+        session = self._find("user_chat_sessions", ("id",), {"id": p_session_id}) or {}
+        session.update({"last_message_content": p_last_message_content if p_last_message_content is not None else p_content,
+                        "last_message_at": _now()})
+        request = self._find("partner_requests", ("id",), {"id": p_partner_request_id}) if p_partner_request_id else None
+        if request is not None and (p_partner_request_mode == "accept" or request.get("status") == "pending"):
+            if p_partner_request_mode == "accept":
+                request.update({"status": "accepted", "accepted_at": request.get("accepted_at") or _now()})
+            request.update({"recipient_session_id": p_session_id, "created_message_id": message["id"]})
+        if p_linked_session_id is not None:
+            text = p_last_message_content if p_last_message_content is not None else p_content
+            self.rpc_append_linked_session_partner_context(p_linked_session_id, p_partner_context_sender, text)
+        counters = ("message_count", "user_message_count", "assistant_message_count", "partner_received_count")
+        return {"message": dict(message), "counts": {c: session.get(c) or 0 for c in counters}}
+
+    def rpc_accept_link_invite_tx(self, invite_token: str, invitee_user_id: str):
+        invite = self._find("link_invites", ("invite_token",), {"invite_token": invite_token})
+        if invite is None:
+            raise PostgrestError(400, "P0001", "Invalid invite token")
+        if invite.get("used_at"):
+            raise PostgrestError(400, "P0001", "Invite token already used")
+        if (invite.get("expires_at") or "") < _now():
+            raise PostgrestError(400, "P0001", "Invite token expired")
+        inviter = invite.get("invite_user_id")
+        if inviter == invitee_user_id:
+            raise PostgrestError(400, "P0001", "Cannot link to the same user")
+        for row in self.tables.get("paired_accounts", []):
+            sides = (row.get("partner_a_user_id"), row.get("partner_b_user_id"))
+            if inviter in sides:
+                raise PostgrestError(400, "P0001", "Inviter already linked to another partner")
+            if invitee_user_id in sides:
+                raise PostgrestError(400, "P0001", "Invitee already linked to another partner")
+        rel = self.insert("paired_accounts", [{"partner_a_user_id": inviter, "partner_b_user_id": invitee_user_id}],
+                          on_conflict=None, resolution=None)[0]
+        invite.update({"used_at": _now(), "invitee_user_id": invitee_user_id, "paired_account_id": rel["id"]})
+        return {"relationship_id": rel["id"]}
+
+
+def build_app(*, jwks: dict, latency_ms: float = 0.0) -> Starlette:
+    store = Store()
+    stats: Counter = Counter()
+    latency = max(0.0, latency_ms / 1000.0)
+
+    async def round_trip(kind: str) -> None:
+        stats[kind] += 1
+        stats["requests"] += 1
+        if latency:
+            await asyncio.sleep(latency)
+
+    def reply(body, **kwargs) -> JSONResponse:
+        response = JSONResponse(body, **kwargs)
+        stats["response_bytes"] += len(response.body)
+        return response
+
+    async def table(request: Request):
+        name = request.path_params["table"]
+        await round_trip(f"{request.method} {name}")
+        prefs = _prefer(request)
+        params = request.query_params
+        try:
+            if request.method in ("GET", "HEAD"):
+                limit = params.get("limit")
+                rows, total = store.select(name, _filters(request), params.get("order"),
+                                           int(limit) if limit is not None else None, int(params.get("offset") or 0))
+                headers = {}
+                if prefs.get("count"):
+                    offset = int(params.get("offset") or 0)
+                    headers["content-range"] = f"{offset}-{offset + len(rows) - 1}/{total}" if rows else f"*/{total}"
+                body = _project(rows, params.get("select"))
+                if request.method == "HEAD":
+                    return Response(status_code=200, headers=headers)
+                return reply(body, headers=headers)
+
+            if request.method == "POST":
+                payload = await request.json()
+                rows = payload if isinstance(payload, list) else [payload]
+                on_conflict = tuple(c.strip() for c in params["on_conflict"].split(",")) if params.get("on_conflict") else None
+                written = store.insert(name, rows, on_conflict=on_conflict, resolution=prefs.get("resolution"))
+                if prefs.get("return") == "representation":
+                    return reply(_project(written, params.get("select")), status_code=201)
+                return Response(status_code=201)
+
+            if request.method == "PATCH":
+                changed = store.update(name, _filters(request), await request.json())
+            else:
+                changed = store.delete(name, _filters(request))
+            if prefs.get("return") == "representation":
+                return reply(_project(changed, params.get("select")))
+            return Response(status_code=204)
+        except PostgrestError as e:
+            return e.response()
+
+    async def rpc(request: Request):
+        name = request.path_params["name"]
+        await round_trip(f"RPC {name}")
+        handler = getattr(store, f"rpc_{name}", None)
+        if handler is None:
+            return PostgrestError(404, "PGRST202", f"Could not find the function public.{name}").response()
+        args = await request.json() if await request.body() else {}
+        try:
+            return reply(handler(**args))
+        except PostgrestError as e:
+            return e.response()
+
+    async def keys(request: Request):
+        stats["GET jwks"] += 1
+        return JSONResponse(jwks)
+
+    async def admin_user(request: Request):
+        user_id = request.path_params["user_id"]
+        await round_trip("GET auth.users")
+        return JSONResponse({
+            "id": user_id,
+            "aud": "authenticated",
+            "role": "authenticated",
+            "email": f"{user_id[:8]}@bench.local",
+            "app_metadata": {"provider": "email"},
+            "user_metadata": {"full_name": f"Bench {user_id[:8]}"},
+            "created_at": _now(),
+        })
+
+    async def upload(request: Request):
+        bucket, path = request.path_params["bucket"], request.path_params["path"]
+        await round_trip(f"UPLOAD {bucket}")
+        store.objects[f"{bucket}/{path}"] = await request.body()
+        return JSONResponse({"Key": f"{bucket}/{path}", "Id": str(uuid.uuid4())})
+
+    async def sign(request: Request):
+        bucket, path = request.path_params["bucket"], request.path_params["path"]
+        await round_trip(f"SIGN {bucket}")
+        if f"{bucket}/{path}" not in store.objects:
+            return JSONResponse({"statusCode": "404", "error": "not_found", "message": "Object not found"}, status_code=400)
+        return JSONResponse({"signedURL": f"/object/sign/{bucket}/{path}?token={uuid.uuid4().hex}"})
+
+    async def bench_stats(request: Request):
+        return JSONResponse({**dict(stats), "rows": {name: len(rows) for name, rows in store.tables.items()}})
+
+    return Starlette(routes=[
+        Route("/rest/v1/rpc/{name}", rpc, methods=["POST"]),
+        Route("/rest/v1/{table}", table, methods=["GET", "HEAD", "POST", "PATCH", "DELETE"]),
+        Route("/auth/v1/keys", keys, methods=["GET"]),
+        Route("/auth/v1/admin/users/{user_id}", admin_user, methods=["GET"]),
+        Route("/storage/v1/object/sign/{bucket}/{path:path}", sign, methods=["POST"]),
+        Route("/storage/v1/object/{bucket}/{path:path}", upload, methods=["POST", "PUT"]),
+        Route("/_bench/stats", bench_stats, methods=["GET"]),
+    ])
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8102)
+    parser.add_argument("--jwks-file", required=True, help="JWKS document served at /auth/v1/keys")
+    parser.add_argument("--latency-ms", type=float, default=5.0, help="Added to every request (network round trip)")
+    args = parser.parse_args()
+    with open(args.jwks_file, encoding="utf-8") as f:
+        jwks = json.load(f)
+    uvicorn.run(build_app(jwks=jwks, latency_ms=args.latency_ms), host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
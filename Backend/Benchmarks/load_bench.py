@@ -0,0 +1,544 @@
+"""Offline load test of ``Backend.app`` against local OpenAI, Supabase and APNs stand-ins.
+
+Starts ``Benchmarks/fakes`` (OpenAI Responses, PostgREST/Auth/Storage, HTTP/2 APNs) and the app
+under uvicorn as subprocesses, all on 127.0.0.1, pointed at each other purely through env vars:
+``OPENAI_BASE_URL``, ``SUPABASE_URL``, ``APNS_HOST`` and ``SSL_CERT_FILE`` (the APNs fake's
+self-signed certificate). User JWTs are ES256 tokens signed with a key whose JWKS the Supabase
+fake serves, so the real auth path runs. ``LLM_USER_RATE_PER_MINUTE`` defaults to 0 (off) because
+every synthetic user sends far more than a person would; override it with ``--app-env``.
+
+The Supabase fake is seeded with ``--pairs`` linked couples (profiles with stored avatars, device
+tokens, ``--sessions-per-user`` chat sessions with ``--history`` messages each) plus one pending
+partner request per accept call. Then each scenario runs ``--warmup`` unrecorded calls and
+``--requests`` measured calls, ``--concurrency`` at a time, one scenario after another:
+
+* sessions        GET  /chat/sessions
+* sessions_sync   GET  /chat/sessions?since=<watermark> with If-None-Match (an app refresh: 304 until the list changes;
+                  every user's first full list is read before the measured calls and is not counted)
+* avatars         GET  /profile/avatars
+* partner_stream  POST /partner/request/stream (first call per session pre-creates the request)
+* partner_accept  POST /partner/requests/{id}/accept (a fresh pending request per call)
+* chat_stream     POST /chat/sessions/message/stream
+
+For every scenario the report has latency (request start to end of body) and, for the SSE
+endpoints, time to first token frame, as p50/p95/p99/mean/max in milliseconds, successful
+requests per second, status counts, and the upstream calls per request the fakes counted
+(Supabase requests and response bytes, OpenAI requests/tokens, APNs pushes). ``--out`` writes it as JSON;
+``--baseline`` prints the change against an earlier report.
+
+Usage:
+    python -m Backend.Benchmarks.load_bench --requests 200 --concurrency 20 --out bench.json
+    python -m Backend.Benchmarks.load_bench --out after.json --baseline bench.json --app-env CHAT_HEDGE_ENABLED=true
+"""
+
+import argparse
+import asyncio
+import base64
+import json
+import os
+import shutil
+import socket
+import ssl
+import subprocess
+import sys
+import tempfile
+import time
+import uuid
+from collections import Counter
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
+
+import httpx
+import jwt
+from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.primitives.asymmetric import ec
+
+from .fakes.apns_fake import write_self_signed_cert
+
+REPO_ROOT = Path(__file__).resolve().parents[2]
+SERVICE_KEY = "bench-service-role-key"
+BUNDLE_ID = "com.therai.bench"
+SCENARIOS = ("sessions", "sessions_sync", "avatars", "partner_stream", "partner_accept", "chat_stream")
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def _git_rev() -> Optional[str]:
+    try:
+        rev = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=REPO_ROOT, capture_output=True, text=True, check=True).stdout.strip()
+        dirty = subprocess.run(["git", "status", "--porcelain", "--untracked-files=no"], cwd=REPO_ROOT, capture_output=True, text=True).stdout.strip()
+        return f"{rev}-dirty" if dirty else rev
+    except Exception:
+        return None
+
+
+def _ms_stats(values: List[float]) -> Optional[dict]:
+    if not values:
+        return None
+    ordered = sorted(values)
+
+    def pick(q: float) -> float:
+        return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+    return {
+        "p50": round(pick(0.50) * 1000, 1),
+        "p95": round(pick(0.95) * 1000, 1),
+        "p99": round(pick(0.99) * 1000, 1),
+        "mean": round(sum(ordered) / len(ordered) * 1000, 1),
+        "max": round(ordered[-1] * 1000, 1),
+    }
+
+
+class Stack:
+    """The fakes and the app as subprocesses, with their logs under `workdir`."""
+
+    def __init__(self, args, workdir: str):
+        self.args = args
+        self.workdir = workdir
+        self.procs: Dict[str, subprocess.Popen] = {}
+        self.user_key = ec.generate_private_key(ec.SECP256R1())
+        self.ports = {name: _free_port() for name in ("openai", "supabase", "apns", "app")}
+        self.supabase_url = f"http://127.0.0.1:{self.ports['supabase']}"
+        self.openai_url = f"http://127.0.0.1:{self.ports['openai']}"
+        self.apns_url = f"https://127.0.0.1:{self.ports['apns']}"
+        self.app_url = f"http://127.0.0.1:{self.ports['app']}"
+        self.certfile, self.keyfile = write_self_signed_cert(workdir)
+
+    def _spawn(self, name: str, argv: List[str], env: Optional[dict] = None) -> None:
+        log = open(os.path.join(self.workdir, f"{name}.log"), "wb")
+        self.procs[name] = subprocess.Popen([sys.executable, *argv], cwd=REPO_ROOT, env=env, stdout=log, stderr=subprocess.STDOUT)
+
+    def _app_env(self) -> dict:
+        apns_key = ec.generate_private_key(ec.SECP256R1()).private_bytes(
+            serialization.Encoding.PEM, serialization.PrivateFormat.PKCS8, serialization.NoEncryption())
+        env = {k: v for k, v in os.environ.items() if k not in ("SUPABASE_JWKS_URL", "METRICS_TOKEN")}
+        env.update({
+            "SUPABASE_URL": self.supabase_url,
+            "SUPABASE_SECRET_KEY": SERVICE_KEY,
+            "OPENAI_API_KEY": "sk-bench",
+            "OPENAI_BASE_URL": f"{self.openai_url}/v1",
+            "APNS_HOST": f"127.0.0.1:{self.ports['apns']}",
+            "APNS_TEAM_ID": "BENCHTEAM1",
+            "APNS_KEY_ID": "BENCHKEY01",
+            "APNS_AUTH_KEY_BASE64": base64.b64encode(apns_key).decode(),
+            "APNS_BUNDLE_ID": BUNDLE_ID,
+            "SSL_CERT_FILE": self.certfile,
+            "LLM_USER_RATE_PER_MINUTE": "0",
+            "PYTHONUNBUFFERED": "1",
+        })
+        for item in self.args.app_env:
+            key, _, value = item.partition("=")
+            env[key] = value
+        return env
+
+    def start(self) -> None:
+        jwk = jwt.algorithms.ECAlgorithm.to_jwk(self.user_key.public_key(), as_dict=True)
+        jwks_file = os.path.join(self.workdir, "jwks.json")
+        with open(jwks_file, "w", encoding="utf-8") as f:
+            json.dump({"keys": [{**jwk, "kid": "bench", "alg": "ES256", "use": "sig"}]}, f)
+
+        a = self.args
+        self._spawn("openai", ["-m", "Backend.Benchmarks.fakes.openai_fake", "--port", str(self.ports["openai"]),
+                               "--tokens", str(a.tokens), "--tokens-per-second", str(a.tokens_per_second),
+                               "--ttft-ms", str(a.ttft_ms)])
+        self._spawn("supabase", ["-m", "Backend.Benchmarks.fakes.supabase_fake", "--port", str(self.ports["supabase"]),
+                                 "--jwks-file", jwks_file, "--latency-ms", str(a.db_latency_ms)])
+        self._spawn("apns", ["-m", "Backend.Benchmarks.fakes.apns_fake", "--port", str(self.ports["apns"]),
+                             "--certfile", self.certfile, "--keyfile", self.keyfile, "--latency-ms", str(a.apns_latency_ms)])
+        self._spawn("app", ["-m", "uvicorn", "Backend.app:app", "--host", "127.0.0.1", "--port", str(self.ports["app"]),
+                            "--workers", str(a.app_workers), "--log-level", "warning", "--no-access-log"], env=self._app_env())
+
+    async def wait_ready(self, timeout: float = 30.0) -> None:
+        checks = {
+            "openai": f"{self.openai_url}/_bench/stats",
+            "supabase": f"{self.supabase_url}/_bench/stats",
+            "apns": f"{self.apns_url}/_bench/stats",
+            "app": f"{self.app_url}/openapi.json",
+        }
+        deadline = time.monotonic() + timeout
+        async with self.fake_client() as client:
+            for name, url in checks.items():
+                while True:
+                    if self.procs[name].poll() is not None:
+                        raise RuntimeError(f"{name} exited with {self.procs[name].returncode}; see {self.workdir}/{name}.log")
+                    try:
+                        if (await client.get(url)).status_code == 200:
+                            break
+                    except httpx.TransportError:
+                        pass
+                    if time.monotonic() > deadline:
+                        raise RuntimeError(f"{name} not ready after {timeout}s; see {self.workdir}/{name}.log")
+                    await asyncio.sleep(0.1)
+
+    def fake_client(self) -> httpx.AsyncClient:
+        return httpx.AsyncClient(http2=True, verify=ssl.create_default_context(cafile=self.certfile), timeout=10.0)
+
+    async def fake_stats(self, client: httpx.AsyncClient) -> Dict[str, dict]:
+        stats = {}
+        for name, url in (("openai", self.openai_url), ("supabase", self.supabase_url), ("apns", self.apns_url)):
+            stats[name] = (await client.get(f"{url}/_bench/stats")).json()
+        return stats
+
+    def token_for(self, user_id: str) -> str:
+        now = int(time.time())
+        claims = {
+            "sub": user_id,
+            "aud": "authenticated",
+            "iss": f"{self.supabase_url}/auth/v1",
+            "iat": now,
+            "exp": now + 6 * 3600,
+            "role": "authenticated",
+            "user_metadata": {"full_name": f"Bench {user_id[:8]}"},
+        }
+        return jwt.encode(claims, self.user_key, algorithm="ES256", headers={"kid": "bench"})
+
+    def stop(self) -> None:
+        for proc in self.procs.values():
+            if proc.poll() is None:
+                proc.terminate()
+        for proc in self.procs.values():
+            try:
+                proc.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                proc.kill()
+
+
+# Seed the Supabase fake through PostgREST / Storage, the way a real project would be populated
+async def seed(stack: Stack, *, pairs: int, sessions_per_user: int, history: int, accepts: int) -> dict:
+    headers = {"apikey": SERVICE_KEY, "Authorization": f"Bearer {SERVICE_KEY}", "Prefer": "return=representation"}
+    base = datetime.now(timezone.utc) - timedelta(days=1)
+    rows: Dict[str, List[dict]] = {name: [] for name in (
+        "paired_accounts", "profiles", "device_tokens", "user_chat_sessions", "user_chat_messages",
+        "linked_sessions", "partner_requests")}
+    world = {"pairs": [], "accepts": []}
+
+    def session_row(user_id: str, n: int) -> dict:
+        row = {"id": str(uuid.uuid4()), "user_id": user_id, "title": f"Session {n}",
+               "last_message_at": (base + timedelta(minutes=n)).isoformat(), "last_message_content": "..."}
+        rows["user_chat_sessions"].append(row)
+        return row
+
+    for p in range(pairs):
+        a, b = str(uuid.uuid4()), str(uuid.uuid4())
+        relationship_id = str(uuid.uuid4())
+        rows["paired_accounts"].append({"id": relationship_id, "partner_a_user_id": a, "partner_b_user_id": b})
+        pair = {"a": a, "b": b, "relationship_id": relationship_id, "chat_sessions": {}, "partner_session": None}
+        for user_id in (a, b):
+            rows["profiles"].append({"user_id": user_id, "full_name": f"Bench {user_id[:8]}", "avatar_path": f"avatar/{user_id}.jpg"})
+            rows["device_tokens"].append({"user_id": user_id, "token": uuid.uuid4().hex * 2, "platform": "ios",
+                                          "bundle_id": BUNDLE_ID, "enabled": True})
+            for n in range(sessions_per_user):
+                session = session_row(user_id, n)
+                for m in range(history):
+                    rows["user_chat_messages"].append({
+                        "user_id": user_id, "session_id": session["id"], "role": "user" if m % 2 == 0 else "assistant",
+                        "content": f"seed message {m} of session {n}",
+                        "created_at": (base + timedelta(minutes=n, seconds=m)).isoformat(),
+                    })
+            pair["chat_sessions"][user_id] = session_row(user_id, sessions_per_user)["id"]
+        pair["partner_session"] = session_row(a, sessions_per_user + 1)["id"]
+        world["pairs"].append(pair)
+
+    for i in range(accepts):
+        pair = world["pairs"][i % pairs]
+        sender_session = session_row(pair["a"], sessions_per_user + 2 + i // pairs)["id"]
+        rows["linked_sessions"].append({
+            "relationship_id": pair["relationship_id"], "user_a_id": pair["a"], "user_b_id": pair["b"],
+            "user_a_personal_session_id": sender_session, "user_b_personal_session_id": None, "partner_context": [],
+        })
+        request_id = str(uuid.uuid4())
+        rows["partner_requests"].append({
+            "id": request_id, "relationship_id": pair["relationship_id"], "sender_user_id": pair["a"],
+            "recipient_user_id": pair["b"], "sender_session_id": sender_session,
+            "content": "Could we talk about the weekend plans tonight?", "status": "pending",
+        })
+        world["accepts"].append({"request_id": request_id, "recipient": pair["b"]})
+
+    async with httpx.AsyncClient(base_url=stack.supabase_url, headers=headers, timeout=60.0) as client:
+        for table, payload in rows.items():
+            for start in range(0, len(payload), 1000):
+                res = await client.post(f"/rest/v1/{table}", json=payload[start:start + 1000])
+                res.raise_for_status()
+        for pair in world["pairs"]:
+            for user_id in (pair["a"], pair["b"]):
+                res = await client.post(f"/storage/v1/object/avatar/{user_id}.jpg", content=b"\xff\xd8bench-avatar",
+                                        headers={"content-type": "image/jpeg"})
+                res.raise_for_status()
+    return world
+
+
+class Sample:
+    __slots__ = ("status", "latency", "ttft", "ok")
+
+    def __init__(self, status: int, latency: float, ttft: Optional[float], ok: bool):
+        self.status = status
+        self.latency = latency
+        self.ttft = ttft
+        self.ok = ok
+
+
+async def _plain(client: httpx.AsyncClient, method: str, path: str, token: str, **kwargs) -> Sample:
+    started = time.perf_counter()
+    res = await client.request(method, path, headers={"Authorization": f"Bearer {token}"}, **kwargs)
+    await res.aread()
+    return Sample(res.status_code, time.perf_counter() - started, None, res.status_code == 200)
+
+
+# Read an SSE response to the end; TTFT is the first `event: token` frame
+async def _sse(client: httpx.AsyncClient, path: str, token: str, body: dict) -> Sample:
+    started = time.perf_counter()
+    ttft = None
+    outcome = None
+    async with client.stream("POST", path, json=body, headers={"Authorization": f"Bearer {token}"}) as res:
+        async for line in res.aiter_lines():
+            if not line.startswith("event: "):
+                continue
+            event = line[7:].strip()
+            if event == "token" and ttft is None:
+                ttft = time.perf_counter() - started
+            elif event in ("done", "error", "rate_limited") and outcome is None:
+                outcome = event
+    return Sample(res.status_code, time.perf_counter() - started, ttft, res.status_code == 200 and outcome == "done")
+
+
+# Scenario calls by name, plus the unmeasured setup some of them need before their first call
+def build_scenarios(stack: Stack, world: dict) -> Tuple[Dict[str, Callable[[httpx.AsyncClient, int], Awaitable[Sample]]],
+                                                        Dict[str, Callable[[httpx.AsyncClient, int], Awaitable[None]]]]:
+    pairs = world["pairs"]
+    users = [(p, u) for p in pairs for u in (p["a"], p["b"])]
+    tokens: Dict[str, str] = {}
+
+    def token(user_id: str) -> str:
+        if user_id not in tokens:
+            tokens[user_id] = stack.token_for(user_id)
+        return tokens[user_id]
+
+    async def sessions(client, i):
+        _, user_id = users[i % len(users)]
+        return await _plain(client, "GET", "/chat/sessions", token(user_id))
+
+    # Each user keeps the watermark and ETag of its last 200, like the app's cached list. Setup reads every
+    # user's full list and then one delta (the ETag covers the since URL), outside the measured window and
+    # its upstream counters, so measured calls are the If-None-Match revalidation alone.
+    synced: Dict[str, Tuple[str, str]] = {}
+
+    async def prime_sessions_sync(client, concurrency):
+        pending = [user_id for _, user_id in users if user_id not in synced]
+
+        async def prime():
+            while pending:
+                user_id = pending.pop()
+                headers = {"Authorization": f"Bearer {token(user_id)}"}
+                res = await client.get("/chat/sessions", headers=headers)
+                res.raise_for_status()
+                res = await client.get("/chat/sessions", params={"since": res.json().get("watermark") or ""}, headers=headers)
+                res.raise_for_status()
+                synced[user_id] = (res.json().get("watermark") or "", res.headers.get("etag", ""))
+
+        await asyncio.gather(*(prime() for _ in range(concurrency)))
+
+    async def sessions_sync(client, i):
+        _, user_id = users[i % len(users)]
+        watermark, etag = synced[user_id]
+        started = time.perf_counter()
+        res = await client.get("/chat/sessions", params={"since": watermark},
+                               headers={"Authorization": f"Bearer {token(user_id)}", "If-None-Match": etag})
+        await res.aread()
+        if res.status_code == 200:
+            synced[user_id] = (res.json().get("watermark") or watermark, res.headers.get("etag", ""))
+        return Sample(res.status_code, time.perf_counter() - started, None, res.status_code in (200, 304))
+
+    async def avatars(client, i):
+        _, user_id = users[i % len(users)]
+        return await _plain(client, "GET", "/profile/avatars", token(user_id))
+
+    async def partner_stream(client, i):
+        pair = pairs[i % len(pairs)]
+        body = {"message": f"I'd love for us to plan a quiet evening this week ({i}).", "session_id": pair["partner_session"]}
+        return await _sse(client, "/partner/request/stream", token(pair["a"]), body)
+
+    async def partner_accept(client, i):
+        accept = world["accepts"][i]
+        return await _plain(client, "POST", f"/partner/requests/{accept['request_id']}/accept", token(accept["recipient"]))
+
+    async def chat_stream(client, i):
+        pair, user_id = users[i % len(users)]
+        body = {"message": f"We argued again about chores and I feel unheard ({i}).", "session_id": pair["chat_sessions"][user_id]}
+        return await _sse(client, "/chat/sessions/message/stream", token(user_id), body)
+
+    scenarios = {"sessions": sessions, "sessions_sync": sessions_sync, "avatars": avatars, "partner_stream": partner_stream,
+                 "partner_accept": partner_accept, "chat_stream": chat_stream}
+    return scenarios, {"sessions_sync": prime_sessions_sync}
+
+
+async def run_scenario(name: str, call, *, requests: int, concurrency: int, warmup: int, app_client: httpx.AsyncClient,
+                       stack: Stack, fake_client: httpx.AsyncClient, setup=None) -> dict:
+    samples: List[Sample] = []
+    failures: Counter = Counter()
+    next_index = 0
+
+    async def worker(end: int, record: bool):
+        nonlocal next_index
+        while next_index < end:
+            i = next_index
+            next_index += 1
+            try:
+                sample = await call(app_client, i)
+            except Exception as e:
+                if record:
+                    failures[type(e).__name__] += 1
+                continue
+            if record:
+                samples.append(sample)
+
+    if setup is not None:
+        await setup(app_client, concurrency)
+
+    # Unrecorded warm-up calls (first connections, JWKS fetch, lazy clients) use the indexes after the measured ones
+    next_index = requests
+    await asyncio.gather(*(worker(requests + warmup, False) for _ in range(min(concurrency, warmup))))
+    next_index = 0
+
+    before = await stack.fake_stats(fake_client)
+    started = time.perf_counter()
+    await asyncio.gather(*(worker(requests, True) for _ in range(concurrency)))
+    wall = time.perf_counter() - started
+    # Let post-response work (background tasks, checkpoints) land before counting upstream calls
+    await asyncio.sleep(0.5)
+    after = await stack.fake_stats(fake_client)
+
+    ok = [s for s in samples if s.ok]
+
+    def per_request(service: str, key: str) -> float:
+        return round((after[service].get(key, 0) - before[service].get(key, 0)) / max(1, requests), 2)
+
+    return {
+        "requests": requests,
+        "concurrency": concurrency,
+        "ok": len(ok),
+        "errors": requests - len(ok),
+        "status_counts": dict(Counter(str(s.status) for s in samples)),
+        "client_failures": dict(failures),
+        "wall_seconds": round(wall, 3),
+        "requests_per_second": round(len(ok) / wall, 2) if wall > 0 else None,
+        "latency_ms": _ms_stats([s.latency for s in ok]),
+        "ttft_ms": _ms_stats([s.ttft for s in ok if s.ttft is not None]),
+        "upstream_per_request": {
+            "supabase_requests": per_request("supabase", "requests"),
+            "supabase_response_bytes": per_request("supabase", "response_bytes"),
+            "openai_stream_requests": per_request("openai", "streaming"),
+            "openai_other_requests": per_request("openai", "non_streaming"),
+            "openai_input_tokens": per_request("openai", "input_tokens"),
+            "openai_cached_input_tokens": per_request("openai", "cached_input_tokens"),
+            "apns_pushes": per_request("apns", "pushes"),
+        },
+    }
+
+
+def _print_scenario(name: str, res: dict) -> None:
+    lat, ttft = res["latency_ms"] or {}, res["ttft_ms"] or {}
+    line = (f"[{name:>14}] ok={res['ok']}/{res['requests']} rps={res['requests_per_second']} "
+            f"p50={lat.get('p50')}ms p95={lat.get('p95')}ms p99={lat.get('p99')}ms")
+    if ttft:
+        line += f" ttft_p50={ttft.get('p50')}ms ttft_p95={ttft.get('p95')}ms"
+    line += f" db/req={res['upstream_per_request']['supabase_requests']}"
+    line += f" db_bytes/req={res['upstream_per_request']['supabase_response_bytes']:.0f}"
+    print(line)
+
+
+def _print_comparison(report: dict, baseline: dict) -> None:
+    print(f"\nvs baseline {baseline.get('git_rev')} ({baseline.get('generated_at')}):")
+    for name, res in report["scenarios"].items():
+        old = baseline.get("scenarios", {}).get(name)
+        if not old:
+            continue
+        parts = []
+        for label, new_v, old_v in (
+            ("p50", (res["latency_ms"] or {}).get("p50"), (old["latency_ms"] or {}).get("p50")),
+            ("p95", (res["latency_ms"] or {}).get("p95"), (old["latency_ms"] or {}).get("p95")),
+            ("p99", (res["latency_ms"] or {}).get("p99"), (old["latency_ms"] or {}).get("p99")),
+            ("ttft_p50", (res["ttft_ms"] or {}).get("p50"), (old["ttft_ms"] or {}).get("p50")),
+            ("rps", res["requests_per_second"], old["requests_per_second"]),
+            ("db/req", res["upstream_per_request"]["supabase_requests"], old["upstream_per_request"]["supabase_requests"]),
+            ("db_bytes/req", res["upstream_per_request"].get("supabase_response_bytes"),
+             old["upstream_per_request"].get("supabase_response_bytes")),
+        ):
+            if new_v is None or not old_v:
+                continue
+            parts.append(f"{label} {old_v}->{new_v} ({(new_v - old_v) / old_v * 100:+.1f}%)")
+        print(f"[{name:>14}] " + "  ".join(parts))
+
+
+async def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--scenarios", default=",".join(SCENARIOS), help="Comma-separated subset of: " + ", ".join(SCENARIOS))
+    parser.add_argument("--requests", type=int, default=200, help="Requests per scenario")
+    parser.add_argument("--concurrency", type=int, default=20)
+    parser.add_argument("--warmup", type=int, default=5, help="Unrecorded requests before each scenario")
+    parser.add_argument("--pairs", type=int, default=50, help="Linked couples to seed")
+    parser.add_argument("--sessions-per-user", type=int, default=20)
+    parser.add_argument("--history", type=int, default=10, help="Seeded messages per session")
+    parser.add_argument("--tokens", type=int, default=200, help="OpenAI fake: output tokens per response")
+    parser.add_argument("--tokens-per-second", type=float, default=80.0)
+    parser.add_argument("--ttft-ms", type=float, default=400.0)
+    parser.add_argument("--db-latency-ms", type=float, default=5.0, help="Supabase fake: added round trip per request")
+    parser.add_argument("--apns-latency-ms", type=float, default=20.0)
+    parser.add_argument("--app-workers", type=int, default=1)
+    parser.add_argument("--app-env", action="append", default=[], metavar="KEY=VALUE", help="Extra env for the app (repeatable)")
+    parser.add_argument("--workdir", default=None, help="Directory for logs and keys (default: a temp dir, kept on failure)")
+    parser.add_argument("--out", default=None, help="JSON report path")
+    parser.add_argument("--baseline", default=None, help="Earlier JSON report to compare against")
+    args = parser.parse_args()
+
+    names = [n.strip() for n in args.scenarios.split(",") if n.strip()]
+    unknown = [n for n in names if n not in SCENARIOS]
+    if unknown:
+        parser.error(f"unknown scenarios: {', '.join(unknown)}")
+
+    workdir = args.workdir or tempfile.mkdtemp(prefix="therai-load-bench-")
+    os.makedirs(workdir, exist_ok=True)
+    stack = Stack(args, workdir)
+    failed = True
+    try:
+        stack.start()
+        await stack.wait_ready()
+        world = await seed(stack, pairs=args.pairs, sessions_per_user=args.sessions_per_user, history=args.history,
+                           accepts=args.requests + args.warmup if "partner_accept" in names else 0)
+        scenarios, setups = build_scenarios(stack, world)
+
+        report = {
+            "generated_at": datetime.now(timezone.utc).isoformat(),
+            "git_rev": _git_rev(),
+            "config": {k: v for k, v in vars(args).items() if k not in ("out", "baseline", "workdir")},
+            "scenarios": {},
+        }
+        limits = httpx.Limits(max_connections=args.concurrency * 2, max_keepalive_connections=args.concurrency * 2)
+        async with httpx.AsyncClient(base_url=stack.app_url, timeout=120.0, limits=limits) as app_client, stack.fake_client() as fake_client:
+            for name in names:
+                res = await run_scenario(name, scenarios[name], requests=args.requests, concurrency=args.concurrency, warmup=args.warmup,
+                                         app_client=app_client, stack=stack, fake_client=fake_client, setup=setups.get(name))
+                report["scenarios"][name] = res
+                _print_scenario(name, res)
+
+        if args.out:
+            with open(args.out, "w", encoding="utf-8") as f:
+                json.dump(report, f, indent=2)
+        if args.baseline:
+            with open(args.baseline, encoding="utf-8") as f:
+                _print_comparison(report, json.load(f))
+        failed = False
+    finally:
+        stack.stop()
+        if failed or args.workdir:
+            print(f"logs: {workdir}")
+        else:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,171 @@
+"""Micro-benchmark for the <partner_message> stream parser.
+
+Builds long synthetic model responses with many partner blocks (including
+attribute-style open tags and long drafts), splits them into small random
+deltas so that open and close tags are routinely cut across deltas, and
+times:
+
+* legacy: the regex/rescan loop formerly inlined in ``iter_sse``
+* parser: ``Streaming.partner_message_parser.PartnerMessageParser``
+
+The parser's output over the deltas must equal the output of parsing the
+whole response in one piece (the ground truth); the run aborts otherwise.
+The legacy loop is checked against the same ground truth and the report
+says whether it diverged: it leaks attribute-style open tags into the
+visible text whenever such a tag is split across deltas.
+
+Usage:
+    python -m Backend.Benchmarks.partner_parser_bench --chars 200000
+"""
+
+import argparse
+import random
+import re
+import time
+
+from ..Streaming.partner_message_parser import PartnerMessageParser, TokenEvent, PartnerMessageEvent
+
+
+def legacy_parse(deltas):
+    open_pat = re.compile(r"<partner_message(?:\s+[^>]*)?>")
+    end_marker = "</partner_message>"
+    tag_start = "<partner_message"
+    buffer = ""
+    in_partner = False
+    tokens = []
+    partners = []
+    segments = []
+    current_text_segment = ""
+    for delta in deltas:
+        buffer += delta
+        while True:
+            if not in_partner:
+                m = open_pat.search(buffer)
+                if m:
+                    before = buffer[:m.start()]
+                    if before:
+                        tokens.append(before)
+                        current_text_segment += before
+                    buffer = buffer[m.end():]
+                    in_partner = True
+                    continue
+                if buffer:
+                    max_k = min(len(buffer), len(tag_start))
+                    overlap = 0
+                    for k in range(max_k, -1, -1):
+                        if buffer.endswith(tag_start[:k]):
+                            overlap = k
+                            break
+                    flush_len = len(buffer) - overlap
+                    if flush_len > 0:
+                        flushable = buffer[:flush_len]
+                        tokens.append(flushable)
+                        current_text_segment += flushable
+                        buffer = buffer[flush_len:]
+                break
+            else:
+                close_idx = buffer.find(end_marker)
+                if close_idx == -1:
+                    break
+                content = buffer[:close_idx]
+                partners.append(content)
+                if current_text_segment:
+                    segments.append({"type": "text", "content": current_text_segment})
+                    current_text_segment = ""
+                segments.append({"type": "partner_draft", "text": content})
+                buffer = buffer[close_idx + len(end_marker):]
+                in_partner = False
+                continue
+    if buffer:
+        tokens.append(buffer)
+        current_text_segment += buffer
+    if current_text_segment:
+        segments.append({"type": "text", "content": current_text_segment})
+    return "".join(tokens), partners, segments, len(tokens)
+
+
+def parser_parse(deltas):
+    parser = PartnerMessageParser()
+    partners = []
+    token_events = 0
+    for delta in deltas:
+        for ev in parser.feed(delta):
+            if isinstance(ev, TokenEvent):
+                token_events += 1
+            elif isinstance(ev, PartnerMessageEvent):
+                partners.append(ev.text)
+    for ev in parser.close():
+        if isinstance(ev, TokenEvent):
+            token_events += 1
+    return parser.text, partners, parser.segments, token_events
+
+
+def build_response(rng: random.Random, *, chars: int, draft_chars: int) -> str:
+    words = ["we", "feel", "<3", "a<b", "partner", "message", "<partner", "listen", "together", "</p>", "okay"]
+    out = []
+    size = 0
+    while size < chars:
+        prose = " ".join(rng.choice(words) for _ in range(rng.randint(20, 80))) + " "
+        out.append(prose)
+        size += len(prose)
+        if rng.random() < 0.6:
+            open_tag = "<partner_message>" if rng.random() < 0.7 else '<partner_message to="partner">'
+            draft = " ".join(rng.choice(words[:3] + words[5:6]) for _ in range(draft_chars // 5))
+            block = f"{open_tag}{draft}</partner_message>"
+            out.append(block)
+            size += len(block)
+    return "".join(out)
+
+
+def split_deltas(rng: random.Random, text: str, *, max_delta: int):
+    deltas = []
+    i = 0
+    while i < len(text):
+        n = rng.randint(1, max_delta)
+        deltas.append(text[i:i + n])
+        i += n
+    return deltas
+
+
+def bench(fn, deltas, repeat: int):
+    best = float("inf")
+    result = None
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        result = fn(deltas)
+        best = min(best, time.perf_counter() - t0)
+    return best, result
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--chars", type=int, default=200_000, help="Approximate response length")
+    parser.add_argument("--draft-chars", type=int, default=4_000, help="Approximate length of each partner draft")
+    parser.add_argument("--max-delta", type=int, default=6, help="Largest delta size in characters")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    text = build_response(rng, chars=args.chars, draft_chars=args.draft_chars)
+    deltas = split_deltas(rng, text, max_delta=args.max_delta)
+
+    legacy_s, legacy_res = bench(legacy_parse, deltas, args.repeat)
+    parser_s, parser_res = bench(parser_parse, deltas, args.repeat)
+
+    truth = legacy_parse([text])[:3]
+    if parser_parse([text])[:3] != truth:
+        raise SystemExit("Single-delta parser output differs from the legacy implementation")
+    if parser_res[:3] != truth:
+        raise SystemExit("Parser output over split deltas diverged from the ground truth")
+    legacy_ok = legacy_res[:3] == truth
+
+    print(f"response chars={len(text)} deltas={len(deltas)} partner_blocks={len(parser_res[1])}")
+    print(f"legacy: {legacy_s * 1000:.1f} ms  ({legacy_s / len(deltas) * 1e6:.2f} us/delta, token events={legacy_res[3]}, "
+          f"matches ground truth={legacy_ok}, partner blocks found={len(legacy_res[1])})")
+    print(f"parser: {parser_s * 1000:.1f} ms  ({parser_s / len(deltas) * 1e6:.2f} us/delta, token events={parser_res[3]})")
+    print(f"speedup: {legacy_s / parser_s:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,163 @@
+"""Payload bytes and parse time of the repo reads: ``select=*`` dicts vs projected row types.
+
+For each read the ``Database`` repos make on a request path, builds result sets shaped like the
+live tables (every column the migrations add, realistic text sizes: message bodies, the rolling
+``context_summary`` of a session, a linked session's materialized ``partner_context``) and
+serializes them the way PostgREST does. Two variants are compared per read:
+
+* star:      the full ``select=*`` body, decoded into dicts (what the repos returned before)
+* projected: only the repo's column list, decoded and converted into its slotted row type
+
+It reports response bytes, JSON decode time of each body, and the time to convert the decoded
+projected rows into row types (uuid parsing included: ids the routers used to parse at the call
+site now arrive as ``uuid.UUID``), per call, median over ``--iterations``.
+
+The repos are imported for their column lists and converters, so ``SUPABASE_URL`` and
+``SUPABASE_SECRET_KEY`` must be set (any values; nothing is sent).
+
+Usage:
+    SUPABASE_URL=http://127.0.0.1:9 SUPABASE_SECRET_KEY=x python -m Backend.Benchmarks.row_projection_bench --iterations 300
+"""
+
+import argparse
+import json
+import random
+import statistics
+import time
+import uuid
+from datetime import datetime, timedelta, timezone
+
+from ..Database.chat_repo import MESSAGE_COLUMNS, RECENT_MESSAGE_COLUMNS, _chat_message, _recent_message
+from ..Database.link_repo import LinkInvite
+from ..Database.linked_sessions_repo import LINKED_SESSION_COLUMNS, _linked_session
+from ..Database.partner_requests_repo import PARTNER_REQUEST_COLUMNS, PartnerRequestRef, _partner_request
+from ..Database.session_repo import SESSION_SUMMARY_COLUMNS, _session_summary
+
+_WORDS = "we talked about it again last night and I still feel like they are not hearing what I mean".split()
+
+
+def _text(rng: random.Random, chars: int) -> str:
+    words = []
+    while sum(len(w) + 1 for w in words) < chars:
+        words.append(rng.choice(_WORDS))
+    return " ".join(words)
+
+
+def _ts(rng: random.Random) -> str:
+    return (datetime(2026, 1, 1, tzinfo=timezone.utc) + timedelta(seconds=rng.randint(0, 10_000_000))).isoformat()
+
+
+def _id() -> str:
+    return str(uuid.uuid4())
+
+
+def message_row(rng: random.Random) -> dict:
+    role = rng.choice(["user", "assistant"])
+    return {"id": _id(), "user_id": _id(), "session_id": _id(), "role": role,
+            "content": _text(rng, 200 if role == "user" else 900), "created_at": _ts(rng)}
+
+
+def session_row(rng: random.Random) -> dict:
+    return {"id": _id(), "user_id": _id(), "title": _text(rng, 30), "created_at": _ts(rng),
+            "last_message_at": _ts(rng), "last_message_content": _text(rng, 300),
+            "last_response_id": "resp_" + uuid.uuid4().hex, "last_response_tokens": rng.randint(500, 9000),
+            "context_summary": _text(rng, 5000), "context_summary_updated_at": _ts(rng),
+            "message_count": 40, "user_message_count": 20, "assistant_message_count": 20, "partner_received_count": 2}
+
+
+def partner_request_row(rng: random.Random) -> dict:
+    return {"id": _id(), "relationship_id": _id(), "sender_user_id": _id(), "recipient_user_id": _id(),
+            "sender_session_id": _id(), "recipient_session_id": _id(), "created_message_id": _id(),
+            "content": _text(rng, 250), "status": "pending", "created_at": _ts(rng),
+            "delivered_at": _ts(rng), "accepted_at": None, "updated_at": _ts(rng)}
+
+
+def linked_session_row(rng: random.Random) -> dict:
+    return {"id": _id(), "relationship_id": _id(), "user_a_id": _id(), "user_b_id": _id(),
+            "user_a_personal_session_id": _id(), "user_b_personal_session_id": _id(), "created_at": _ts(rng),
+            "partner_context": [{"sender": rng.choice("AB"), "text": _text(rng, 250), "created_at": _ts(rng)}
+                                for _ in range(60)]}
+
+
+def invite_row(rng: random.Random) -> dict:
+    return {"id": _id(), "invite_user_id": _id(), "invite_token": uuid.uuid4().hex, "expires_at": _ts(rng),
+            "used_at": None, "invitee_user_id": None, "paired_account_id": None, "created_at": _ts(rng)}
+
+
+def _partner_request_ref(row: dict) -> PartnerRequestRef:
+    recipient = row.get("recipient_session_id")
+    return PartnerRequestRef(id=uuid.UUID(row["id"]), recipient_session_id=uuid.UUID(recipient) if recipient else None)
+
+
+def _link_invite(row: dict) -> LinkInvite:
+    return LinkInvite(invite_token=row["invite_token"], expires_at=row["expires_at"])
+
+
+# (read, rows per call, row factory, projected columns, converter)
+CASES = [
+    ("list_messages_for_session", 200, message_row, MESSAGE_COLUMNS, _chat_message),
+    ("list_recent_messages_for_session", 40, message_row, RECENT_MESSAGE_COLUMNS, _recent_message),
+    ("list_sessions_for_user", 100, session_row, SESSION_SUMMARY_COLUMNS, _session_summary),
+    ("get_session_by_id", 1, session_row, SESSION_SUMMARY_COLUMNS, _session_summary),
+    ("list_pending_for_user", 50, partner_request_row, PARTNER_REQUEST_COLUMNS, _partner_request),
+    ("get_request_by_id", 1, partner_request_row, PARTNER_REQUEST_COLUMNS, _partner_request),
+    ("get_latest_pending_for_context", 1, partner_request_row, "id, recipient_session_id", _partner_request_ref),
+    ("get_linked_session (partner)", 1, linked_session_row, LINKED_SESSION_COLUMNS, _linked_session),
+    ("get_linked_session (chat)", 1, linked_session_row, LINKED_SESSION_COLUMNS + ", partner_context", _linked_session),
+    ("get_unexpired_invite_for_user", 1, invite_row, "invite_token, expires_at", _link_invite),
+]
+
+
+def _body(rows, columns=None) -> bytes:
+    if columns is not None:
+        names = [c.strip() for c in columns.split(",")]
+        rows = [{c: r.get(c) for c in names} for r in rows]
+    return json.dumps(rows, separators=(",", ":")).encode()
+
+
+def _median_us(fn, iterations: int) -> float:
+    samples = []
+    for _ in range(iterations):
+        started = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - started)
+    return statistics.median(samples) * 1e6
+
+
+def run_case(rng: random.Random, rows_per_call: int, factory, columns: str, convert, iterations: int) -> dict:
+    rows = [factory(rng) for _ in range(rows_per_call)]
+    star, projected = _body(rows), _body(rows, columns)
+    decoded = json.loads(projected)
+    return {
+        "rows": rows_per_call,
+        "star_bytes": len(star),
+        "projected_bytes": len(projected),
+        "star_decode_us": round(_median_us(lambda: json.loads(star), iterations), 1),
+        "projected_decode_us": round(_median_us(lambda: json.loads(projected), iterations), 1),
+        "convert_us": round(_median_us(lambda: [convert(r) for r in decoded], iterations), 1),
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--iterations", type=int, default=300)
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--json", action="store_true", help="Print the results as JSON")
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    results = {name: run_case(rng, n, factory, columns, convert, args.iterations)
+               for name, n, factory, columns, convert in CASES}
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+    print(f"{'read':<34}{'rows':>5}{'bytes *':>10}{'bytes proj':>12}{'saved':>7}"
+          f"{'decode * us':>13}{'decode proj us':>16}{'convert us':>12}")
+    for name, r in results.items():
+        saved = 1 - r["projected_bytes"] / r["star_bytes"]
+        print(f"{name:<34}{r['rows']:>5}{r['star_bytes']:>10}{r['projected_bytes']:>12}{saved:>7.0%}"
+              f"{r['star_decode_us']:>13}{r['projected_decode_us']:>16}{r['convert_us']:>12}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,189 @@
+"""Frames per response and CPU per stream for SSE token coalescing.
+
+Runs N concurrent streams through an in-process Starlette app (StreamingResponse
+over httpx's ASGI transport, so every write pays the ASGI send path). Each
+stream is fed model-like deltas (a word every few milliseconds, with optional
+"thinking" pauses) through an asyncio queue, mirroring the producer/consumer
+split in ``chat_router``. Two encoders are compared:
+
+* legacy: one ``event: token`` frame per delta plus a ``:`` heartbeat every 100 ms
+* writer: ``Streaming.sse_writer.SSEWriter`` (latency/bytes flush policy, idle keepalive)
+
+For each engine it reports frames and bytes per response, keepalives, added
+token latency (delta enqueue to frame emission, p50/p95) and process CPU per
+stream (server and client side together). The token text decoded from both
+outputs must equal the input.
+
+Usage:
+    python -m Backend.Benchmarks.sse_frames_bench --streams 200 --tokens 300
+"""
+
+import argparse
+import asyncio
+import json
+import random
+import time
+
+import httpx
+from starlette.applications import Starlette
+from starlette.responses import StreamingResponse
+from starlette.routing import Route
+
+from ..Streaming.sse_writer import SSEWriter
+
+_DONE = object()
+
+
+async def feed(q: asyncio.Queue, deltas, interval: float, pauses) -> None:
+    for i, delta in enumerate(deltas):
+        await asyncio.sleep(pauses.get(i, interval))
+        q.put_nowait((time.monotonic(), delta))
+    q.put_nowait((time.monotonic(), _DONE))
+
+
+def split_frames(body: bytes) -> list:
+    return [f + b"\n\n" for f in body.split(b"\n\n") if f]
+
+
+def decode_tokens(frames) -> str:
+    text = []
+    for frame in frames:
+        if frame.startswith(b"event: token\n"):
+            text.append(json.loads(frame.split(b"data: ", 1)[1]))
+    return "".join(text)
+
+
+async def legacy_sse(q: asyncio.Queue, stats: dict):
+    get_task = None
+    while True:
+        if get_task is None:
+            get_task = asyncio.ensure_future(q.get())
+        ready, _ = await asyncio.wait({get_task}, timeout=0.1)
+        if not ready:
+            stats["keepalives"] += 1
+            yield b":\n\n"
+            continue
+        enqueued, delta = get_task.result()
+        get_task = None
+        if delta is _DONE:
+            break
+        stats["delays"].append(time.monotonic() - enqueued)
+        yield f"event: token\ndata: {json.dumps(delta)}\n\n".encode()
+    yield b"event: done\ndata: {}\n\n"
+
+
+async def writer_sse(q: asyncio.Queue, stats: dict):
+    writer = SSEWriter()
+    pending_enqueued = []
+    get_task = None
+
+    def sent() -> None:
+        now = time.monotonic()
+        stats["delays"].extend(now - t for t in pending_enqueued)
+        pending_enqueued.clear()
+
+    while True:
+        if get_task is None:
+            get_task = asyncio.ensure_future(q.get())
+        ready, _ = await asyncio.wait({get_task}, timeout=writer.wait_timeout())
+        if not ready:
+            chunk = writer.on_timeout()
+            if chunk:
+                if chunk.startswith(b"event: token"):
+                    sent()
+                yield chunk
+            continue
+        enqueued, delta = get_task.result()
+        get_task = None
+        if delta is _DONE:
+            break
+        pending_enqueued.append(enqueued)
+        chunk = writer.token(delta)
+        if chunk:
+            sent()
+            yield chunk
+    sent()
+    stats["keepalives"] += writer.keepalives
+    yield writer.event("done")
+
+
+def build_deltas(rng: random.Random, tokens: int) -> list:
+    words = ["we", "could", "try", "talking", "tonight", "about", "how", "the", "week", "felt", "for", "both", "of", "you"]
+    return [rng.choice(words) + " " for _ in range(tokens)]
+
+
+async def run_engine(name: str, sse, *, streams: int, deltas: list, interval: float, pauses: dict) -> dict:
+    stats = {"keepalives": 0, "delays": []}
+    expected = "".join(deltas)
+
+    async def endpoint(request):
+        q: asyncio.Queue = asyncio.Queue()
+        feeder = asyncio.create_task(feed(q, deltas, interval, pauses))
+
+        async def body():
+            try:
+                async for chunk in sse(q, stats):
+                    yield chunk
+            finally:
+                feeder.cancel()
+
+        return StreamingResponse(body(), media_type="text/event-stream")
+
+    app = Starlette(routes=[Route("/stream", endpoint, methods=["POST"])])
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=None) as client:
+        cpu0, wall0 = time.process_time(), time.perf_counter()
+        responses = await asyncio.gather(*(client.post("/stream") for _ in range(streams)))
+        cpu, wall = time.process_time() - cpu0, time.perf_counter() - wall0
+
+    outputs = [split_frames(r.content) for r in responses]
+    for frames in outputs:
+        if decode_tokens(frames) != expected:
+            raise SystemExit(f"[{name}] decoded token text differs from the input")
+
+    delays = sorted(stats["delays"])
+    pct = lambda p: delays[min(len(delays) - 1, int(p * len(delays)))] * 1000 if delays else 0.0
+    return {
+        "engine": name,
+        "streams": streams,
+        "frames_per_response": round(sum(len(f) for f in outputs) / streams, 1),
+        "bytes_per_response": round(sum(len(r.content) for r in responses) / streams, 1),
+        "keepalives_per_response": round(stats["keepalives"] / streams, 1),
+        "token_delay_p50_ms": round(pct(0.50), 1),
+        "token_delay_p95_ms": round(pct(0.95), 1),
+        "cpu_ms_per_stream": round(cpu / streams * 1000, 3),
+        "wall_seconds": round(wall, 2),
+    }
+
+
+async def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--streams", type=int, default=200)
+    parser.add_argument("--tokens", type=int, default=300)
+    parser.add_argument("--interval", type=float, default=0.01, help="Seconds between deltas")
+    parser.add_argument("--pauses", type=int, default=2, help="Number of 1.5 s thinking pauses per response")
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--out", type=str, default=None, help="Optional JSON report path")
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    deltas = build_deltas(rng, args.tokens)
+    pauses = {rng.randrange(1, args.tokens): 1.5 for _ in range(args.pauses)}
+
+    results = []
+    for name, sse in (("legacy", legacy_sse), ("writer", writer_sse)):
+        res = await run_engine(name, sse, streams=args.streams, deltas=deltas, interval=args.interval, pauses=pauses)
+        results.append(res)
+        print(
+            f"[{res['engine']:>6}] frames/response={res['frames_per_response']} bytes/response={res['bytes_per_response']} "
+            f"keepalives/response={res['keepalives_per_response']} token_delay p50={res['token_delay_p50_ms']}ms "
+            f"p95={res['token_delay_p95_ms']}ms cpu/stream={res['cpu_ms_per_stream']}ms wall={res['wall_seconds']}s"
+        )
+
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
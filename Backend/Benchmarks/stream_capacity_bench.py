@@ -0,0 +1,200 @@
+"""Concurrent SSE stream capacity: thread-per-stream engine vs asyncio engine.
+
+Runs the same fake token source through two in-process Starlette apps:
+
+* legacy: sync generator wrapped in ``iterate_in_threadpool`` fed by a daemon
+  producer thread and a ``queue.Queue`` polled every 100 ms (the old
+  ``/chat/sessions/message/stream`` engine)
+* async: async generator fed by an ``asyncio`` producer task and an
+  ``asyncio.Queue`` (the current engine)
+
+Every stream emits ``--tokens`` deltas ``--interval`` seconds apart, so an
+unconstrained engine finishes all streams in about ``tokens * interval``.
+The report shows the peak number of streams that were producing at the same
+time, the extra OS threads they needed, the wall clock for the whole batch, and
+how long a ``run_in_threadpool`` call (any blocking helper offloaded by a
+request) had to wait for a worker while the streams were open.
+
+Usage:
+    python -m Backend.Benchmarks.stream_capacity_bench --streams 200
+"""
+
+import argparse
+import asyncio
+import json
+import queue
+import threading
+import time
+
+import httpx
+from starlette.applications import Starlette
+from starlette.concurrency import iterate_in_threadpool, run_in_threadpool
+from starlette.responses import StreamingResponse
+from starlette.routing import Route
+
+
+class _Gauge:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.active = 0
+        self.peak = 0
+
+    def enter(self):
+        with self.lock:
+            self.active += 1
+            self.peak = max(self.peak, self.active)
+
+    def leave(self):
+        with self.lock:
+            self.active -= 1
+
+
+def build_app(*, tokens: int, interval: float, gauge: _Gauge) -> Starlette:
+    async def legacy(request):
+        def iter_sse():
+            q: queue.Queue = queue.Queue()
+            done = {"flag": False}
+
+            def producer():
+                try:
+                    for i in range(tokens):
+                        time.sleep(interval)  # blocking OpenAI client read
+                        q.put(f"t{i} ")
+                finally:
+                    done["flag"] = True
+
+            threading.Thread(target=producer, daemon=True).start()
+            gauge.enter()
+            try:
+                while True:
+                    try:
+                        delta = q.get(timeout=0.1)
+                    except queue.Empty:
+                        if done["flag"] and q.empty():
+                            break
+                        yield b":\n\n"
+                        continue
+                    yield f"event: token\ndata: {json.dumps(delta)}\n\n".encode()
+                yield b"event: done\ndata: {}\n\n"
+            finally:
+                gauge.leave()
+
+        return StreamingResponse(iterate_in_threadpool(iter_sse()), media_type="text/event-stream")
+
+    async def async_engine(request):
+        async def iter_sse():
+            q: asyncio.Queue = asyncio.Queue()
+
+            async def producer():
+                try:
+                    for i in range(tokens):
+                        await asyncio.sleep(interval)  # AsyncOpenAI stream read
+                        q.put_nowait(("delta", f"t{i} "))
+                finally:
+                    q.put_nowait(("completed", None))
+
+            task = asyncio.create_task(producer())
+            gauge.enter()
+            get_task = None
+            try:
+                while True:
+                    if get_task is None:
+                        get_task = asyncio.ensure_future(q.get())
+                    ready, _ = await asyncio.wait({get_task}, timeout=0.1)
+                    if not ready:
+                        yield b":\n\n"
+                        continue
+                    kind, delta = get_task.result()
+                    get_task = None
+                    if kind == "completed":
+                        break
+                    yield f"event: token\ndata: {json.dumps(delta)}\n\n".encode()
+                yield b"event: done\ndata: {}\n\n"
+            finally:
+                gauge.leave()
+                if get_task is not None:
+                    get_task.cancel()
+                task.cancel()
+
+        return StreamingResponse(iter_sse(), media_type="text/event-stream")
+
+    return Starlette(routes=[
+        Route("/legacy", legacy, methods=["POST"]),
+        Route("/async", async_engine, methods=["POST"]),
+    ])
+
+
+async def run_engine(path: str, *, streams: int, tokens: int, interval: float) -> dict:
+    gauge = _Gauge()
+    app = build_app(tokens=tokens, interval=interval, gauge=gauge)
+    threads_before = threading.active_count()
+    peak_threads = threads_before
+    stop = asyncio.Event()
+
+    async def sample_threads():
+        nonlocal peak_threads
+        while not stop.is_set():
+            peak_threads = max(peak_threads, threading.active_count())
+            await asyncio.sleep(0.05)
+
+    probe_waits: list = []
+
+    async def probe_threadpool():
+        # Stand-in for a DB call issued by an unrelated request during the load
+        await asyncio.sleep(0.05)
+        while not stop.is_set():
+            t0 = time.perf_counter()
+            await run_in_threadpool(lambda: None)
+            probe_waits.append(time.perf_counter() - t0)
+            await asyncio.sleep(0.02)
+
+    sampler = asyncio.create_task(sample_threads())
+    prober = asyncio.create_task(probe_threadpool())
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=None) as client:
+        started = time.perf_counter()
+        responses = await asyncio.gather(*(client.post(path) for _ in range(streams)))
+        elapsed = time.perf_counter() - started
+    stop.set()
+    await sampler
+    await prober
+
+    completed = sum(1 for r in responses if r.status_code == 200 and b"event: done" in r.content)
+    return {
+        "engine": path.strip("/"),
+        "streams": streams,
+        "completed": completed,
+        "peak_concurrent_streams": gauge.peak,
+        "peak_extra_threads": peak_threads - threads_before,
+        "wall_seconds": round(elapsed, 3),
+        "threadpool_probe_max_ms": round(max(probe_waits, default=0.0) * 1000, 1),
+        "ideal_seconds": round(tokens * interval, 3),
+    }
+
+
+async def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--streams", type=int, default=200)
+    parser.add_argument("--tokens", type=int, default=20)
+    parser.add_argument("--interval", type=float, default=0.05)
+    parser.add_argument("--out", type=str, default=None, help="Optional JSON report path")
+    args = parser.parse_args()
+
+    results = []
+    for path in ("/legacy", "/async"):
+        res = await run_engine(path, streams=args.streams, tokens=args.tokens, interval=args.interval)
+        results.append(res)
+        print(
+            f"[{res['engine']:>6}] streams={res['streams']} completed={res['completed']} "
+            f"peak_concurrent={res['peak_concurrent_streams']} peak_extra_threads={res['peak_extra_threads']} "
+            f"wall={res['wall_seconds']}s (ideal {res['ideal_seconds']}s) "
+            f"threadpool_probe_max={res['threadpool_probe_max_ms']}ms"
+        )
+
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
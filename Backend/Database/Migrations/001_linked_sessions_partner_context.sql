@@ -0,0 +1,65 @@
+-- Materialized partner A/B context per linked session.
+--
+-- linked_sessions.partner_context holds the delivered partner messages of the pair, oldest first:
+--   [{"sender": "A" | "B", "text": "...", "created_at": "..."}, ...]
+-- where "A" is linked_sessions.user_a_id. partner_router appends one entry every time it writes a
+-- `_therai.partner_received` message, so a chat turn reads the transcript from the row it already
+-- loads instead of scanning both partners' sessions.
+
+alter table public.linked_sessions
+    add column if not exists partner_context jsonb;
+
+-- One-time backfill from existing partner_received rows (messages in B's session were sent by A and vice versa)
+update public.linked_sessions ls
+   set partner_context = coalesce((
+        select jsonb_agg(
+                   jsonb_build_object('sender', d.sender, 'text', d.text, 'created_at', d.created_at)
+                   order by d.created_at
+               )
+          from (
+                select 'A' as sender, (m.content::jsonb #>> '{_therai,text}') as text, m.created_at
+                  from public.user_chat_messages m
+                 where m.session_id = ls.user_b_personal_session_id
+                   and m.role = 'assistant'
+                   and m.content like '{"_therai": {"type": "partner_received"%'
+                union all
+                select 'B' as sender, (m.content::jsonb #>> '{_therai,text}') as text, m.created_at
+                  from public.user_chat_messages m
+                 where m.session_id = ls.user_a_personal_session_id
+                   and m.role = 'assistant'
+                   and m.content like '{"_therai": {"type": "partner_received"%'
+               ) d
+         where coalesce(d.text, '') <> ''
+       ), '[]'::jsonb)
+ where ls.partner_context is null;
+
+alter table public.linked_sessions
+    alter column partner_context set default '[]'::jsonb,
+    alter column partner_context set not null;
+
+-- Atomic append, keeping only the newest p_max_entries entries
+create or replace function public.append_linked_session_partner_context(
+    p_linked_session_id uuid,
+    p_sender text,
+    p_text text,
+    p_max_entries integer default 500
+)
+returns void
+language sql
+as $$
+    update public.linked_sessions
+       set partner_context = (
+            select coalesce(jsonb_agg(e.value order by e.ord), '[]'::jsonb)
+              from (
+                    select value, ord
+                      from jsonb_array_elements(
+                               partner_context || jsonb_build_array(
+                                   jsonb_build_object('sender', p_sender, 'text', p_text, 'created_at', now())
+                               )
+                           ) with ordinality as t(value, ord)
+                     order by ord desc
+                     limit p_max_entries
+                   ) e
+           )
+     where id = p_linked_session_id;
+$$;
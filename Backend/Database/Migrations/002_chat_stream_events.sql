@@ -0,0 +1,25 @@
+-- Resumable chat streams (STREAM_RESUME_STORE=supabase).
+--
+-- Every SSE frame of /chat/sessions/message/stream is written behind (in small batches) to
+-- chat_stream_events, so a client that reconnects with Last-Event-ID on another machine can
+-- replay what it missed and keep following the generation. Each stream keeps at most
+-- STREAM_RESUME_BUFFER_EVENTS frames and the whole stream expires STREAM_RESUME_TTL_SECONDS
+-- after it finishes (rows are removed by the app; cascade deletes the frames).
+
+create table if not exists public.chat_streams (
+    id uuid primary key,
+    user_id uuid not null,
+    session_id uuid not null,
+    done boolean not null default false,
+    expires_at timestamptz not null,
+    created_at timestamptz not null default now()
+);
+
+create index if not exists chat_streams_expires_at_idx on public.chat_streams (expires_at);
+
+create table if not exists public.chat_stream_events (
+    stream_id uuid not null references public.chat_streams (id) on delete cascade,
+    event_id integer not null,
+    frame text not null,
+    primary key (stream_id, event_id)
+);
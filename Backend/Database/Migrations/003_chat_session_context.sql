@@ -0,0 +1,13 @@
+-- Server-managed conversation context per chat session.
+--
+-- last_response_id / last_response_tokens: the session's latest completed OpenAI response and its
+-- total (input + output) tokens. The next turn chains from it (previous_response_id) until that
+-- total passes CHAT_CHAIN_TOKEN_BUDGET; then the chain is restarted from the summary.
+-- context_summary: a rolling, token-capped transcript of the session (oldest lines dropped first),
+-- folded forward after every turn and used whenever the chain is missing, expired or too long.
+
+alter table public.user_chat_sessions
+    add column if not exists last_response_id text,
+    add column if not exists last_response_tokens integer,
+    add column if not exists context_summary text,
+    add column if not exists context_summary_updated_at timestamptz;
@@ -0,0 +1,81 @@
+-- Per-session message counters, maintained at write time.
+--
+-- user_chat_sessions.message_count: every message of the session; user_message_count /
+-- assistant_message_count: by role; partner_received_count: assistant rows that carry a delivered
+-- partner message ({"_therai": {"type": "partner_received", ...}}). A trigger on user_chat_messages
+-- keeps them in step with inserts, deletes and edits, so the chat turn (title scheduling) and the
+-- empty-session check read one session row instead of fetching message ids to count them.
+
+alter table public.user_chat_sessions
+    add column if not exists message_count integer not null default 0,
+    add column if not exists user_message_count integer not null default 0,
+    add column if not exists assistant_message_count integer not null default 0,
+    add column if not exists partner_received_count integer not null default 0;
+
+create or replace function public.bump_chat_session_message_counts(
+    p_session_id uuid,
+    p_role text,
+    p_content text,
+    p_delta integer
+)
+returns void
+language sql
+as $$
+    update public.user_chat_sessions
+       set message_count = message_count + p_delta,
+           user_message_count = user_message_count + case when p_role = 'user' then p_delta else 0 end,
+           assistant_message_count = assistant_message_count + case when p_role = 'assistant' then p_delta else 0 end,
+           partner_received_count = partner_received_count + case
+                when p_role = 'assistant' and p_content like '{"_therai": {"type": "partner_received"%' then p_delta
+                else 0
+           end
+     where id = p_session_id;
+$$;
+
+create or replace function public.user_chat_messages_count_trigger()
+returns trigger
+language plpgsql
+as $$
+begin
+    if tg_op = 'UPDATE'
+       and new.session_id = old.session_id
+       and new.role = old.role
+       and (new.content like '{"_therai": {"type": "partner_received"%')
+           = (old.content like '{"_therai": {"type": "partner_received"%') then
+        -- Content rewrites (stream checkpoints) don't move any counter
+        return null;
+    end if;
+    if tg_op in ('UPDATE', 'DELETE') then
+        perform public.bump_chat_session_message_counts(old.session_id, old.role, old.content, -1);
+    end if;
+    if tg_op in ('INSERT', 'UPDATE') then
+        perform public.bump_chat_session_message_counts(new.session_id, new.role, new.content, 1);
+    end if;
+    return null;
+end;
+$$;
+
+drop trigger if exists user_chat_messages_count on public.user_chat_messages;
+create trigger user_chat_messages_count
+    after insert or delete or update of session_id, role, content on public.user_chat_messages
+    for each row execute function public.user_chat_messages_count_trigger();
+
+-- One-time backfill from existing messages
+update public.user_chat_sessions s
+   set message_count = c.total,
+       user_message_count = c.user_total,
+       assistant_message_count = c.assistant_total,
+       partner_received_count = c.partner_received_total
+  from (
+        select session_id,
+               count(*) as total,
+               count(*) filter (where role = 'user') as user_total,
+               count(*) filter (where role = 'assistant') as assistant_total,
+               count(*) filter (
+                   where role = 'assistant'
+                     and content like '{"_therai": {"type": "partner_received"%'
+               ) as partner_received_total
+          from public.user_chat_messages
+         group by session_id
+       ) c
+ where c.session_id = s.id;
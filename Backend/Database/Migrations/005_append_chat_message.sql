@@ -0,0 +1,66 @@
+-- One-round-trip message append.
+--
+-- append_chat_message inserts a chat message and, in the same transaction, stamps its session's
+-- last_message_content / last_message_at (the counters from 004 move with the insert trigger) and,
+-- for partner deliveries, attaches the new message to its partner_requests row:
+--   p_partner_request_mode = 'attach': recipient session + message id on a still-pending request
+--   p_partner_request_mode = 'accept': the same, and the request moves to accepted
+-- p_last_message_content defaults to p_content (partner deliveries pass the plain text instead of
+-- the annotated message). Returns {"message": <user_chat_messages row>, "counts": {...}}.
+
+create or replace function public.append_chat_message(
+    p_user_id uuid,
+    p_session_id uuid,
+    p_role text,
+    p_content text,
+    p_last_message_content text default null,
+    p_partner_request_id uuid default null,
+    p_partner_request_mode text default null
+)
+returns jsonb
+language plpgsql
+as $$
+declare
+    v_message public.user_chat_messages;
+    v_session public.user_chat_sessions;
+begin
+    if p_partner_request_id is not null and coalesce(p_partner_request_mode, '') not in ('attach', 'accept') then
+        raise exception 'Invalid partner request mode: %', p_partner_request_mode;
+    end if;
+
+    insert into public.user_chat_messages (user_id, session_id, role, content)
+    values (p_user_id, p_session_id, p_role, p_content)
+    returning * into v_message;
+
+    update public.user_chat_sessions
+       set last_message_content = coalesce(p_last_message_content, p_content),
+           last_message_at = now()
+     where id = p_session_id
+    returning * into v_session;
+
+    if p_partner_request_mode = 'accept' then
+        update public.partner_requests
+           set status = 'accepted',
+               accepted_at = coalesce(accepted_at, now()),
+               recipient_session_id = p_session_id,
+               created_message_id = v_message.id
+         where id = p_partner_request_id;
+    elsif p_partner_request_mode = 'attach' then
+        update public.partner_requests
+           set recipient_session_id = p_session_id,
+               created_message_id = v_message.id
+         where id = p_partner_request_id
+           and status = 'pending';
+    end if;
+
+    return jsonb_build_object(
+        'message', to_jsonb(v_message),
+        'counts', jsonb_build_object(
+            'message_count', coalesce(v_session.message_count, 0),
+            'user_message_count', coalesce(v_session.user_message_count, 0),
+            'assistant_message_count', coalesce(v_session.assistant_message_count, 0),
+            'partner_received_count', coalesce(v_session.partner_received_count, 0)
+        )
+    );
+end;
+$$;
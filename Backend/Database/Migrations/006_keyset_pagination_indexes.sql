@@ -0,0 +1,23 @@
+-- Keyset pagination for messages and sessions.
+--
+-- GET /chat/sessions/{id}/messages pages on (created_at, id) within a session, and GET /chat/sessions
+-- on (last_message_at, created_at, id) descending within a user. Each composite index below matches
+-- one of those orderings exactly, so a page is an index range scan starting at the cursor instead of
+-- a sort over the whole session / user followed by an offset skip.
+--
+-- The sessions cursor compares last_message_at with plain < / =, which never matches NULL, so the
+-- column becomes not null: rows that never had a message take their created_at.
+
+create index if not exists user_chat_messages_session_created_id_idx
+    on public.user_chat_messages (session_id, created_at, id);
+
+update public.user_chat_sessions
+   set last_message_at = created_at
+ where last_message_at is null;
+
+alter table public.user_chat_sessions
+    alter column last_message_at set default now(),
+    alter column last_message_at set not null;
+
+create index if not exists user_chat_sessions_user_activity_idx
+    on public.user_chat_sessions (user_id, last_message_at desc, created_at desc, id desc);
@@ -0,0 +1,84 @@
+-- Delta sync for the sessions list.
+--
+-- user_chat_sessions.updated_at moves whenever a field the list shows changes (title,
+-- last_message_at, last_message_content) and on insert; counter and conversation-context writes
+-- leave it alone, so a chat turn bumps it once (through last_message_*), not per statement.
+-- Deleted sessions leave a tombstone in user_chat_session_tombstones for 30 days (the app's
+-- SESSIONS_TOMBSTONE_RETENTION); a client whose watermark is older than that gets a full list.
+-- GET /chat/sessions?since=<watermark> returns the sessions with updated_at after the watermark
+-- plus the tombstones deleted after it. chat_sessions_version (the newest updated_at / deleted_at of
+-- a user) is the list's version for its ETag and the watermark handed back to clients.
+
+alter table public.user_chat_sessions
+    add column if not exists updated_at timestamptz;
+
+update public.user_chat_sessions
+   set updated_at = greatest(created_at, coalesce(last_message_at, created_at))
+ where updated_at is null;
+
+alter table public.user_chat_sessions
+    alter column updated_at set default now(),
+    alter column updated_at set not null;
+
+create index if not exists user_chat_sessions_user_updated_idx
+    on public.user_chat_sessions (user_id, updated_at);
+
+create or replace function public.touch_chat_session_updated_at()
+returns trigger
+language plpgsql
+as $$
+begin
+    if new.title is distinct from old.title
+       or new.last_message_at is distinct from old.last_message_at
+       or new.last_message_content is distinct from old.last_message_content then
+        new.updated_at = now();
+    end if;
+    return new;
+end;
+$$;
+
+drop trigger if exists user_chat_sessions_touch_updated_at on public.user_chat_sessions;
+create trigger user_chat_sessions_touch_updated_at
+    before update on public.user_chat_sessions
+    for each row execute function public.touch_chat_session_updated_at();
+
+create table if not exists public.user_chat_session_tombstones (
+    session_id uuid primary key,
+    user_id uuid not null,
+    deleted_at timestamptz not null default now()
+);
+
+create index if not exists user_chat_session_tombstones_user_deleted_idx
+    on public.user_chat_session_tombstones (user_id, deleted_at);
+
+create or replace function public.record_chat_session_tombstone()
+returns trigger
+language plpgsql
+as $$
+begin
+    insert into public.user_chat_session_tombstones (session_id, user_id, deleted_at)
+    values (old.id, old.user_id, now())
+    on conflict (session_id) do update set deleted_at = excluded.deleted_at;
+    -- Expired tombstones of the same user go with it; watermarks that old get a full list anyway
+    delete from public.user_chat_session_tombstones
+     where user_id = old.user_id
+       and deleted_at < now() - interval '30 days';
+    return null;
+end;
+$$;
+
+drop trigger if exists user_chat_sessions_tombstone on public.user_chat_sessions;
+create trigger user_chat_sessions_tombstone
+    after delete on public.user_chat_sessions
+    for each row execute function public.record_chat_session_tombstone();
+
+create or replace function public.chat_sessions_version(p_user_id uuid)
+returns timestamptz
+language sql
+stable
+as $$
+    select greatest(
+        (select max(updated_at) from public.user_chat_sessions where user_id = p_user_id),
+        (select max(deleted_at) from public.user_chat_session_tombstones where user_id = p_user_id)
+    );
+$$;
@@ -0,0 +1,10 @@
+-- Partner-thread watermark of a session's response chain.
+--
+-- A chained turn (previous_response_id) already holds the partner letter and every partner-thread
+-- entry sent earlier in the chain, so only entries added since are sent again.
+-- last_response_partner_context_at is the created_at of the newest linked_sessions.partner_context
+-- entry the chain of last_response_id has seen (null: none yet); it is written together with
+-- last_response_id after every turn and cleared with it.
+
+alter table public.user_chat_sessions
+    add column if not exists last_response_partner_context_at timestamptz;
@@ -0,0 +1,83 @@
+-- Partner deliveries update the materialized A/B context in the same transaction.
+--
+-- append_chat_message (005) gains p_linked_session_id / p_partner_context_sender: when both are set,
+-- the delivered text (p_last_message_content, else p_content) is appended to that linked session's
+-- partner_context by append_linked_session_partner_context (001) before the transaction commits, so
+-- a stored partner_received message and its context entry land together or not at all. A chat turn
+-- only rebuilds partner_context when it is null, so an entry lost after the message was written
+-- would otherwise stay missing for good.
+--
+-- The new parameters change the signature, so the 005 version is dropped first (an overload with
+-- defaulted parameters would make named calls ambiguous).
+
+drop function if exists public.append_chat_message(uuid, uuid, text, text, text, uuid, text);
+
+create or replace function public.append_chat_message(
+    p_user_id uuid,
+    p_session_id uuid,
+    p_role text,
+    p_content text,
+    p_last_message_content text default null,
+    p_partner_request_id uuid default null,
+    p_partner_request_mode text default null,
+    p_linked_session_id uuid default null,
+    p_partner_context_sender text default null
+)
+returns jsonb
+language plpgsql
+as $$
+declare
+    v_message public.user_chat_messages;
+    v_session public.user_chat_sessions;
+begin
+    if p_partner_request_id is not null and coalesce(p_partner_request_mode, '') not in ('attach', 'accept') then
+        raise exception 'Invalid partner request mode: %', p_partner_request_mode;
+    end if;
+    if p_linked_session_id is not null and coalesce(p_partner_context_sender, '') not in ('A', 'B') then
+        raise exception 'Invalid partner context sender: %', p_partner_context_sender;
+    end if;
+
+    insert into public.user_chat_messages (user_id, session_id, role, content)
+    values (p_user_id, p_session_id, p_role, p_content)
+    returning * into v_message;
+
+    update public.user_chat_sessions
+       set last_message_content = coalesce(p_last_message_content, p_content),
+           last_message_at = now()
+     where id = p_session_id
+    returning * into v_session;
+
+    if p_partner_request_mode = 'accept' then
+        update public.partner_requests
+           set status = 'accepted',
+               accepted_at = coalesce(accepted_at, now()),
+               recipient_session_id = p_session_id,
+               created_message_id = v_message.id
+         where id = p_partner_request_id;
+    elsif p_partner_request_mode = 'attach' then
+        update public.partner_requests
+           set recipient_session_id = p_session_id,
+               created_message_id = v_message.id
+         where id = p_partner_request_id
+           and status = 'pending';
+    end if;
+
+    if p_linked_session_id is not null then
+        perform public.append_linked_session_partner_context(
+            p_linked_session_id,
+            p_partner_context_sender,
+            coalesce(p_last_message_content, p_content)
+        );
+    end if;
+
+    return jsonb_build_object(
+        'message', to_jsonb(v_message),
+        'counts', jsonb_build_object(
+            'message_count', coalesce(v_session.message_count, 0),
+            'user_message_count', coalesce(v_session.user_message_count, 0),
+            'assistant_message_count', coalesce(v_session.assistant_message_count, 0),
+            'partner_received_count', coalesce(v_session.partner_received_count, 0)
+        )
+    );
+end;
+$$;
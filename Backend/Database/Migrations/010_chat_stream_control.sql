@@ -0,0 +1,10 @@
+-- Cross-machine control of resumable chat streams (STREAM_RESUME_STORE=supabase).
+--
+-- Only the machine that started a generation can stop it, and it used to count only its own
+-- followers: a client that resumed on another machine looked like no client at all. Followers
+-- elsewhere now stamp followed_at while they tail the stream, and /streams/{id}/stop off-origin
+-- sets stop_requested; the generating machine polls both for its live streams.
+
+alter table public.chat_streams
+    add column if not exists followed_at timestamptz,
+    add column if not exists stop_requested text;
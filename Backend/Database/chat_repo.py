@@ -1,85 +1,168 @@
 import uuid
-from typing import List
-from starlette.concurrency import run_in_threadpool
+from dataclasses import dataclass
+from typing import List, Optional, Sequence
+from .pagination import apply_keyset
+from .request_scope import run_query, invalidate
 from .supabase_client import supabase
 
 TABLE_NAME = "user_chat_messages"
 SESSIONS_TABLE = "user_chat_sessions"
 
-# Save a chat message of a specific user and session
-async def save_message(*, user_id: uuid.UUID, session_id: uuid.UUID, role: str, content: str) -> dict:
+# A message as listed for one session; the caller already knows its user_id and session_id
+@dataclass(frozen=True, slots=True)
+class ChatMessage:
+    id: uuid.UUID
+    role: str
+    content: str
+    created_at: str
+
+MESSAGE_COLUMNS = "id, role, content, created_at"
+
+
+def _chat_message(row: dict) -> ChatMessage:
+    return ChatMessage(id=uuid.UUID(row["id"]), role=row["role"], content=row["content"], created_at=row["created_at"])
+
+
+# A message as read to rebuild conversation context; no id, nothing pages on it
+@dataclass(frozen=True, slots=True)
+class RecentMessage:
+    role: str
+    content: str
+    created_at: str
+
+RECENT_MESSAGE_COLUMNS = "role, content, created_at"
+
+
+def _recent_message(row: dict) -> RecentMessage:
+    return RecentMessage(role=row["role"], content=row["content"], created_at=row["created_at"])
+
+
+# Append a message and stamp its session (last_message_content / last_message_at; counters move with the
+# insert trigger) in one round trip via the append_chat_message RPC. For partner deliveries, pass the request
+# and "attach" (request stays pending) or "accept" to link the new message to it in the same transaction,
+# and the linked session plus sender letter ("A"/"B") to append the delivered text to its partner_context.
+# Returns {"message": <row>, "counts": {message_count, user_message_count, ...}}
+async def append_message(
+    *,
+    user_id: uuid.UUID,
+    session_id: uuid.UUID,
+    role: str,
+    content: str,
+    last_message_content: Optional[str] = None,
+    partner_request_id: Optional[uuid.UUID] = None,
+    partner_request_mode: Optional[str] = None,
+    linked_session_id: Optional[uuid.UUID] = None,
+    partner_context_sender: Optional[str] = None,
+) -> dict:
+    if partner_request_id is not None and partner_request_mode not in ("attach", "accept"):
+        raise ValueError(f"Invalid partner request mode: {partner_request_mode!r}")
+    if linked_session_id is not None and partner_context_sender not in ("A", "B"):
+        raise ValueError(f"Invalid partner context sender: {partner_context_sender!r}")
+    try:
+        preview = (content or "")[:120].replace("\n", " ")
+        print(f"[DB] append_message role={role} session_id={session_id} user_id={user_id} preview={preview!r}")
+    except Exception:
+        pass
+    res = await run_query(
+        supabase
+        .rpc("append_chat_message", {
+            "p_user_id": str(user_id),
+            "p_session_id": str(session_id),
+            "p_role": role,
+            "p_content": content,
+            "p_last_message_content": last_message_content,
+            "p_partner_request_id": str(partner_request_id) if partner_request_id else None,
+            "p_partner_request_mode": partner_request_mode if partner_request_id else None,
+            "p_linked_session_id": str(linked_session_id) if linked_session_id else None,
+            "p_partner_context_sender": partner_context_sender if linked_session_id else None,
+        })
+        .execute()
+    )
+    if getattr(res, "error", None):
+        print(f"[DB] append_message error: {getattr(res, 'error', None)}")
+        raise RuntimeError(f"Supabase append_chat_message failed: {res.error}")
+    data = res.data[0] if isinstance(res.data, list) and res.data else res.data
+    if not isinstance(data, dict) or not data.get("message"):
+        raise RuntimeError("Supabase append_chat_message returned no message")
+    invalidate("session")
+    if partner_request_id is not None:
+        invalidate("partner_request")
+    if linked_session_id is not None:
+        invalidate("linked_session")
+    print(f"[DB] append_message ok id={data['message'].get('id')}")
+    return data
+
+# Insert or overwrite a message by its (caller-chosen) id; created_at is only set by the first write
+async def upsert_message(*, message_id: uuid.UUID, user_id: uuid.UUID, session_id: uuid.UUID, role: str, content: str) -> None:
     payload = {
+        "id": str(message_id),
         "user_id": str(user_id),
         "session_id": str(session_id),
         "role": role,
         "content": content,
     }
-    try:
-        preview = (content or "")[:120].replace("\n", " ")
-        print(f"[DB] save_message insert role={role} session_id={session_id} user_id={user_id} preview={preview!r}")
-    except Exception:
-        pass
-    def _insert():
-        return supabase.table(TABLE_NAME).insert(payload).execute()
-    res = await run_in_threadpool(_insert)
+    res = await run_query(supabase.table(TABLE_NAME).upsert(payload, returning="minimal").execute())
     if getattr(res, "error", None):
-        print(f"[DB] save_message error: {getattr(res, 'error', None)}")
-        raise RuntimeError(f"Supabase insert failed: {res.error}")
-    if not hasattr(res, 'data') or not res.data:
-        print("[DB] save_message returned no data")
-        raise RuntimeError("Supabase insert returned no data")
-    try:
-        inserted = res.data[0]
-        print(f"[DB] save_message ok id={inserted.get('id')}")
-    except Exception:
-        pass
-    return res.data[0]
-
-# List user/assistant messages for a specific session (from oldest to newest)
-async def list_messages_for_session(*, user_id: uuid.UUID, session_id: uuid.UUID, limit: int = 100, offset: int = 0) -> List[dict]:
-    def _select():
-        return (
-            supabase
-            .table(TABLE_NAME)
-            .select("*")
-            .eq("user_id", str(user_id))
-            .eq("session_id", str(session_id))
-            .order("created_at", desc = False)
-            .range(offset, offset + max(limit - 1, 0))
-            .execute()
-        )
-    res = await run_in_threadpool(_select)
+        raise RuntimeError(f"Supabase upsert message failed: {res.error}")
+
+MESSAGE_SORT_COLUMNS = ("created_at", "id")
+
+# One keyset page of a session's messages in (created_at, id) order: oldest first, or newest first when
+# walking back from the end. `after` is the (created_at, id) of the last row of the previous page; rows
+# come back in walk order, so a page costs the same wherever it starts.
+async def list_messages_for_session(
+    *,
+    user_id: uuid.UUID,
+    session_id: uuid.UUID,
+    limit: int = 100,
+    newest_first: bool = False,
+    after: Optional[Sequence[str]] = None,
+) -> List[ChatMessage]:
+    query = (
+        supabase
+        .table(TABLE_NAME)
+        .select(MESSAGE_COLUMNS)
+        .eq("user_id", str(user_id))
+        .eq("session_id", str(session_id))
+    )
+    res = await run_query(
+        apply_keyset(query, MESSAGE_SORT_COLUMNS, after, descending = newest_first)
+        .order("created_at", desc = newest_first)
+        .order("id", desc = newest_first)
+        .limit(limit)
+        .execute()
+    )
     if getattr(res, "error", None):
         raise RuntimeError(f"Supabase select failed: {res.error}")
-    return res.data
-
-# Update the session's last_message_content when a user message is saved
-async def update_session_last_message(*, session_id: uuid.UUID, content: str) -> None:
-    def _update():
-        return (
-            supabase
-            .table(SESSIONS_TABLE)
-            .update({"last_message_content": content})
-            .eq("id", str(session_id))
-            .execute()
-        )
-    res = await run_in_threadpool(_update)
-    if getattr(res, "error", None):
-        raise RuntimeError(f"Failed to update session last_message_content: {res.error}")
+    return [_chat_message(r) for r in res.data or []]
 
+# The newest `limit` messages of a session, returned oldest first
+async def list_recent_messages_for_session(*, user_id: uuid.UUID, session_id: uuid.UUID, limit: int = 40) -> List[RecentMessage]:
+    res = await run_query(
+        supabase
+        .table(TABLE_NAME)
+        .select(RECENT_MESSAGE_COLUMNS)
+        .eq("user_id", str(user_id))
+        .eq("session_id", str(session_id))
+        .order("created_at", desc=True)
+        .order("id", desc=True)  # same tie-break as the (session_id, created_at, id) keyset index
+        .limit(limit)
+        .execute()
+    )
+    if getattr(res, "error", None):
+        raise RuntimeError(f"Supabase select recent messages failed: {res.error}")
+    return [_recent_message(row) for row in reversed(res.data or [])]
 
 # Delete all messages for a specific user's session. Returns number of deleted rows
 async def delete_messages_for_session(*, user_id: uuid.UUID, session_id: uuid.UUID) -> int:
-    def _delete():
-        return (
-            supabase
-            .table(TABLE_NAME)
-            .delete()
-            .eq("user_id", str(user_id))
-            .eq("session_id", str(session_id))
-            .execute()
-        )
-    res = await run_in_threadpool(_delete)
+    res = await run_query(
+        supabase
+        .table(TABLE_NAME)
+        .delete()
+        .eq("user_id", str(user_id))
+        .eq("session_id", str(session_id))
+        .execute()
+    )
     if getattr(res, "error", None):
         raise RuntimeError(f"Supabase delete messages failed: {res.error}")
     # supabase-py returns data of deleted rows when RLS permits; count via len(data) if present
@@ -89,56 +172,48 @@ async def delete_messages_for_session(*, user_id: uuid.UUID, session_id: uuid.UU
         return 0
 
 
+MESSAGE_COUNT_COLUMNS = "message_count, user_message_count, assistant_message_count, partner_received_count"
+
+# Read a session's message counters (kept current by the user_chat_messages trigger, migration 004)
+async def get_session_message_counts(*, session_id: uuid.UUID) -> dict:
+    res = await run_query(
+        supabase
+        .table(SESSIONS_TABLE)
+        .select(MESSAGE_COUNT_COLUMNS)
+        .eq("id", str(session_id))
+        .limit(1)
+        .execute()
+    )
+    if getattr(res, "error", None):
+        raise RuntimeError(f"Supabase select session message counts failed: {res.error}")
+    row = (res.data or [{}])[0]
+    return {column.strip(): row.get(column.strip()) or 0 for column in MESSAGE_COUNT_COLUMNS.split(",")}
+
+
 # Check if a session has any messages (returns True if session is empty, False if it has messages)
 async def is_session_empty(*, session_id: uuid.UUID) -> bool:
-    def _count():
-        return (
-            supabase
-            .table(TABLE_NAME)
-            .select("id", count="exact")
-            .eq("session_id", str(session_id))
-            .limit(1)
-            .execute()
-        )
-    res = await run_in_threadpool(_count)
-    if getattr(res, "error", None):
-        raise RuntimeError(f"Supabase count messages failed: {res.error}")
-    # Check if any messages exist
-    return len(res.data or []) == 0
+    counts = await get_session_message_counts(session_id=session_id)
+    return counts["message_count"] == 0
 
 
 # Count the number of user messages in a session
 async def count_user_messages(*, session_id: uuid.UUID) -> int:
-    def _count():
-        return (
-            supabase
-            .table(TABLE_NAME)
-            .select("id", count="exact")
-            .eq("session_id", str(session_id))
-            .eq("role", "user")
-            .execute()
-        )
-    res = await run_in_threadpool(_count)
-    if getattr(res, "error", None):
-        raise RuntimeError(f"Supabase count user messages failed: {res.error}")
-    # Return the count
-    return len(res.data or [])
+    counts = await get_session_message_counts(session_id=session_id)
+    return counts["user_message_count"]
 
 
 # Get the last N user messages from a session (for title generation)
 async def get_recent_user_messages(*, session_id: uuid.UUID, limit: int = 2) -> List[str]:
-    def _select():
-        return (
-            supabase
-            .table(TABLE_NAME)
-            .select("content")
-            .eq("session_id", str(session_id))
-            .eq("role", "user")
-            .order("created_at", desc=False)
-            .limit(limit)
-            .execute()
-        )
-    res = await run_in_threadpool(_select)
+    res = await run_query(
+        supabase
+        .table(TABLE_NAME)
+        .select("content")
+        .eq("session_id", str(session_id))
+        .eq("role", "user")
+        .order("created_at", desc=False)
+        .limit(limit)
+        .execute()
+    )
     if getattr(res, "error", None):
         raise RuntimeError(f"Supabase select user messages failed: {res.error}")
     return [row["content"] for row in res.data or []]
\ No newline at end of file
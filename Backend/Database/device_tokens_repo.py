@@ -1,7 +1,7 @@
 import uuid
 from typing import List, Optional
 from datetime import datetime, timezone
-from starlette.concurrency import run_in_threadpool
+from .request_scope import run_query
 
 from .supabase_client import supabase
 
@@ -18,41 +18,32 @@ async def upsert_token(*, user_id: uuid.UUID, token: str, platform: str, bundle_
         "updated_at": datetime.now(timezone.utc).isoformat(),
     }
 
-    def _upsert():
-        return supabase.table(TABLE).upsert(payload, on_conflict="user_id,token").execute()
-
-    res = await run_in_threadpool(_upsert)
+    res = await run_query(supabase.table(TABLE).upsert(payload, on_conflict="user_id,token").execute())
     if getattr(res, "error", None):
         raise RuntimeError(f"Supabase upsert device_token failed: {res.error}")
 
 
 async def disable_token_by_value(*, token: str) -> None:
-    def _update():
-        return (
-            supabase
-            .table(TABLE)
-            .update({"enabled": False, "updated_at": datetime.now(timezone.utc).isoformat()})
-            .eq("token", token)
-            .execute()
-        )
-
-    res = await run_in_threadpool(_update)
+    res = await run_query(
+        supabase
+        .table(TABLE)
+        .update({"enabled": False, "updated_at": datetime.now(timezone.utc).isoformat()})
+        .eq("token", token)
+        .execute()
+    )
     if getattr(res, "error", None):
         raise RuntimeError(f"Supabase disable device_token failed: {res.error}")
 
 
 async def list_tokens_for_user(*, user_id: uuid.UUID) -> List[dict]:
-    def _select():
-        return (
-            supabase
-            .table(TABLE)
-            .select("token, enabled")
-            .eq("user_id", str(user_id))
-            .eq("enabled", True)
-            .execute()
-        )
-
-    res = await run_in_threadpool(_select)
+    res = await run_query(
+        supabase
+        .table(TABLE)
+        .select("token, enabled")
+        .eq("user_id", str(user_id))
+        .eq("enabled", True)
+        .execute()
+    )
     if getattr(res, "error", None):
         raise RuntimeError(f"Supabase select device_tokens failed: {res.error}")
     return res.data
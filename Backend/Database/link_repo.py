@@ -1,8 +1,13 @@
+import os
+import time
 import uuid
+from collections import OrderedDict
+from dataclasses import dataclass
 from datetime import datetime, timedelta, timezone
-from typing import Optional
-from starlette.concurrency import run_in_threadpool
+from typing import Optional, Tuple
+from .request_scope import run_query, memoized, invalidate
 from .supabase_client import supabase
+from ..Metrics.metrics import counter, gauge
 
 RELATIONSHIP_LINKS_TABLE = "link_invites"
 RELATIONSHIPS_TABLE = "paired_accounts"
@@ -14,38 +19,139 @@ def _utc_in_hours_iso(hours: int) -> str:
 def _utc_now_iso() -> str:
     return datetime.now(timezone.utc).isoformat()
 
-# Return True if the user appears in 'paired_accounts' on either side
-async def is_user_linked(*, user_id: uuid.UUID) -> bool:
+@dataclass(frozen=True, slots=True)
+class Relationship:
+    id: uuid.UUID
+    partner_user_id: uuid.UUID
+    side: str  # "A" or "B": which column of the paired_accounts row holds the user
+    linked_at: Optional[str]
+
+# An unused invite as handed out for sharing
+@dataclass(frozen=True, slots=True)
+class LinkInvite:
+    invite_token: str
+    expires_at: str
+
+
+class _RelationshipCache:
+    """Process-wide user_id -> Relationship (or None for unlinked) map with TTL and LRU eviction.
+
+    Link changes are rare, so entries live for `ttl_seconds`; "not linked" entries only for
+    `negative_ttl_seconds`, since the partner who accepts may be served by another process.
+    Writes in this process drop the affected users explicitly, but an unlink handled by another
+    process leaves positive entries here stale until they expire. Writes therefore resolve with
+    `fresh=True`, which always reads the database: the link writes here (invite, unlink) and
+    everything that puts something in front of the partner (partner requests, accepting them).
+    Reads keep the cache: once unlinked nothing new can reach a couple's shared thread, so a
+    stale entry only shows a user what they could already see.
+    """
+
+    def __init__(self, *, max_entries: int, ttl_seconds: float, negative_ttl_seconds: float):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.negative_ttl_seconds = negative_ttl_seconds
+        self._entries: "OrderedDict[str, Tuple[float, Optional[Relationship]]]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    # (found, relationship); found is False on a miss or an expired entry
+    def get(self, user_id: str) -> Tuple[bool, Optional[Relationship]]:
+        entry = self._entries.get(user_id)
+        if entry is not None and entry[0] > time.monotonic():
+            self._entries.move_to_end(user_id)
+            self._record(hit=True)
+            return True, entry[1]
+        if entry is not None:
+            self._entries.pop(user_id, None)
+            relationship_cache_entries.set(len(self._entries))
+        self._record(hit=False)
+        return False, None
+
+    def put(self, user_id: str, relationship: Optional[Relationship]) -> None:
+        ttl = self.ttl_seconds if relationship is not None else self.negative_ttl_seconds
+        if ttl <= 0 or self.max_entries <= 0:
+            return
+        self._entries[user_id] = (time.monotonic() + ttl, relationship)
+        self._entries.move_to_end(user_id)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+        relationship_cache_entries.set(len(self._entries))
+
+    def invalidate(self, *user_ids: str) -> None:
+        for user_id in user_ids:
+            self._entries.pop(user_id, None)
+        relationship_cache_entries.set(len(self._entries))
+
+    def _record(self, *, hit: bool) -> None:
+        if hit:
+            self.hits += 1
+        else:
+            self.misses += 1
+        relationship_cache_lookups.inc(result="hit" if hit else "miss")
+        relationship_cache_hit_ratio.set(self.hits / (self.hits + self.misses))
+
+
+relationship_cache_lookups = counter("relationship_cache_lookups_total", "Relationship resolver lookups, by result (hit/miss, or bypass for fresh reads)")
+relationship_cache_hit_ratio = gauge("relationship_cache_hit_ratio", "Relationship resolver cache hits / cached lookups since process start (fresh reads excluded)")
+relationship_cache_entries = gauge("relationship_cache_entries", "Users currently held in the relationship resolver cache")
+
+_relationship_cache = _RelationshipCache(
+    max_entries = int(os.getenv("RELATIONSHIP_CACHE_MAX_ENTRIES", "10000")),
+    ttl_seconds = float(os.getenv("RELATIONSHIP_CACHE_TTL_SECONDS", "300")),
+    negative_ttl_seconds = float(os.getenv("RELATIONSHIP_CACHE_NEGATIVE_TTL_SECONDS", "5")),
+)
+
+
+# Load the user's relationship from 'paired_accounts' (either side) in one query; deduped within a request
+@memoized("relationship")
+async def _fetch_relationship(*, user_id: uuid.UUID) -> Optional[Relationship]:
     user_id_str = str(user_id)
-    def _select_rel_by_partner_a():
-        return (supabase
-                .table(RELATIONSHIPS_TABLE)
-                .select("id")
-                .eq("partner_a_user_id", user_id_str)
-                .limit(1)
-                .execute()
-                )
-    def _select_rel_by_partner_b():
-        return (supabase
-                .table(RELATIONSHIPS_TABLE)
-                .select("id")
-                .eq("partner_b_user_id", user_id_str)
-                .limit(1)
-                .execute()
-                )
-    res_a = await run_in_threadpool(_select_rel_by_partner_a)
-    if getattr(res_a, "error", None):
-        raise RuntimeError(f"Supabase select relationship failed: {res_a.error}")
-    if res_a.data:
-        return True
-    res_b = await run_in_threadpool(_select_rel_by_partner_b)
-    if getattr(res_b, "error", None):
-        raise RuntimeError(f"Supabase select relationship failed: {res_b.error}")
-    return bool(res_b.data)
+    res = await run_query(
+        supabase
+        .table(RELATIONSHIPS_TABLE)
+        .select("id, partner_a_user_id, partner_b_user_id, created_at")
+        .or_(f"partner_a_user_id.eq.{user_id_str},partner_b_user_id.eq.{user_id_str}")
+        .limit(1)
+        .execute()
+    )
+    if getattr(res, "error", None):
+        raise RuntimeError(f"Supabase select relationship failed: {res.error}")
+    if not res.data:
+        return None
+    row = res.data[0]
+    side = "A" if row.get("partner_a_user_id") == user_id_str else "B"
+    return Relationship(
+        id = uuid.UUID(row["id"]),
+        partner_user_id = uuid.UUID(row["partner_b_user_id"] if side == "A" else row["partner_a_user_id"]),
+        side = side,
+        linked_at = row.get("created_at"),
+    )
+
+# Resolve the user's relationship (None when unlinked), served from the process cache when fresh.
+# fresh=True skips the cache (one query per request at most) and refreshes it; see _RelationshipCache
+async def resolve_relationship(*, user_id: uuid.UUID, fresh: bool = False) -> Optional[Relationship]:
+    if fresh:
+        relationship_cache_lookups.inc(result="bypass")
+    else:
+        found, relationship = _relationship_cache.get(str(user_id))
+        if found:
+            return relationship
+    relationship = await _fetch_relationship(user_id = user_id)
+    _relationship_cache.put(str(user_id), relationship)
+    return relationship
+
+# Drop cached relationships for these users (call after any write to 'paired_accounts' that affects them)
+def invalidate_relationships(*user_ids: uuid.UUID) -> None:
+    _relationship_cache.invalidate(*(str(u) for u in user_ids))
+    invalidate("relationship")
+
+# Return True if the user appears in 'paired_accounts' on either side
+async def is_user_linked(*, user_id: uuid.UUID, fresh: bool = False) -> bool:
+    return await resolve_relationship(user_id = user_id, fresh = fresh) is not None
 
 # Create a single-use invite row for the inviter with an expiry (internal use only)
-async def _create_link_invite(*, inviter_user_id: uuid.UUID, expires_in_hours: int = 24) -> dict:
-    if await is_user_linked(user_id = inviter_user_id):
+async def _create_link_invite(*, inviter_user_id: uuid.UUID, expires_in_hours: int = 24) -> LinkInvite:
+    if await is_user_linked(user_id = inviter_user_id, fresh = True):
         raise PermissionError("You are already linked to a partner. Please unlink first.")
     invite_token = uuid.uuid4().hex
     payload = {
@@ -56,36 +162,34 @@ async def _create_link_invite(*, inviter_user_id: uuid.UUID, expires_in_hours: i
         "invitee_user_id": None,
         "paired_account_id": None,
     }
-    def _insert():
-        return supabase.table(RELATIONSHIP_LINKS_TABLE).insert(payload).execute()
-    res = await run_in_threadpool(_insert)
+    res = await run_query(supabase.table(RELATIONSHIP_LINKS_TABLE).insert(payload).execute())
     if getattr(res, "error", None):
         raise RuntimeError(f"Supabase insert link invite failed: {res.error}")
-    return res.data[0]
+    return LinkInvite(invite_token = invite_token, expires_at = payload["expires_at"])
 
 # Return an existing, unexpired, unused invite for the inviter if present
-async def get_unexpired_invite_for_user(*, inviter_user_id: uuid.UUID) -> dict | None:
+async def get_unexpired_invite_for_user(*, inviter_user_id: uuid.UUID) -> LinkInvite | None:
     user_id_str = str(inviter_user_id)
-    def _select():
-        return (
-            supabase
-            .table(RELATIONSHIP_LINKS_TABLE)
-            .select("*")
-            .eq("invite_user_id", user_id_str)
-            .is_("used_at", "null")  # unused
-            .gt("expires_at", _utc_now_iso())  # not expired
-            .order("expires_at", desc = False)
-            .limit(1)
-            .execute()
-        )
-    res = await run_in_threadpool(_select)
+    res = await run_query(
+        supabase
+        .table(RELATIONSHIP_LINKS_TABLE)
+        .select("invite_token, expires_at")
+        .eq("invite_user_id", user_id_str)
+        .is_("used_at", "null")  # unused
+        .gt("expires_at", _utc_now_iso())  # not expired
+        .order("expires_at", desc = False)
+        .limit(1)
+        .execute()
+    )
     if getattr(res, "error", None):
         raise RuntimeError(f"Supabase select unexpired invite failed: {res.error}")
-    return res.data[0] if res.data else None
+    if not res.data:
+        return None
+    return LinkInvite(invite_token = res.data[0]["invite_token"], expires_at = res.data[0]["expires_at"])
 
 # Get or create an invite (idempotent within TTL)
-async def get_or_create_link_invite(*, inviter_user_id: uuid.UUID, expires_in_hours: int = 24) -> dict:
-    if await is_user_linked(user_id = inviter_user_id):
+async def get_or_create_link_invite(*, inviter_user_id: uuid.UUID, expires_in_hours: int = 24) -> LinkInvite:
+    if await is_user_linked(user_id = inviter_user_id, fresh = True):
         raise PermissionError("You are already linked to a partner. Please unlink first.")
     existing = await get_unexpired_invite_for_user(inviter_user_id = inviter_user_id)
     if existing:
@@ -94,18 +198,15 @@ async def get_or_create_link_invite(*, inviter_user_id: uuid.UUID, expires_in_ho
 
 # Accept the invite via transactional RPC and return relationship ID
 async def accept_link_invite(*, invite_token: str, invitee_user_id: uuid.UUID) -> uuid.UUID:
-    def _rpc_accept():
-        return (
-            supabase
-            .rpc("accept_link_invite_tx",
-                 {
-                     "invite_token": invite_token,
-                     "invitee_user_id": str(invitee_user_id),
-                     })
-            .execute()
-        )
-
-    rpc_res = await run_in_threadpool(_rpc_accept)
+    rpc_res = await run_query(
+        supabase
+        .rpc("accept_link_invite_tx",
+             {
+                 "invite_token": invite_token,
+                 "invitee_user_id": str(invitee_user_id),
+                 })
+        .execute()
+    )
     if getattr(rpc_res, "error", None):
         msg = str(rpc_res.error)
         if any(key in msg for key in [
@@ -131,139 +232,40 @@ async def accept_link_invite(*, invite_token: str, invitee_user_id: uuid.UUID) -
     if not relationship_id_str:
         raise RuntimeError("RPC accept_link_invite_tx returned no relationship id")
 
+    # The inviter's id comes back with the fresh row: drop their cached (unlinked) entry as well
+    invalidate_relationships(invitee_user_id)
+    relationship = await resolve_relationship(user_id = invitee_user_id)
+    if relationship is not None:
+        invalidate_relationships(relationship.partner_user_id)
+
     return uuid.UUID(relationship_id_str)
 
 # Delete the relationship containing the user, if any, and report success
 async def unlink_relationship_for_user(*, user_id: uuid.UUID) -> bool:
-    user_id_str = str(user_id)
-
-    def _select_rel_by_partner_a():
-        return (
-            supabase
-            .table(RELATIONSHIPS_TABLE)
-            .select("*")
-            .eq("partner_a_user_id", user_id_str)
-            .limit(1)
-            .execute()
-        )
-    def _select_rel_by_partner_b():
-        return (
-            supabase
-            .table(RELATIONSHIPS_TABLE)
-            .select("*")
-            .eq("partner_b_user_id", user_id_str)
-            .limit(1)
-            .execute()
-        )
-
-    rel_res_a = await run_in_threadpool(_select_rel_by_partner_a)
-    if getattr(rel_res_a, "error", None):
-        raise RuntimeError(f"Supabase select relationship failed: {rel_res_a.error}")
-    relationship = rel_res_a.data[0] if rel_res_a.data else None
-    if not relationship:
-        rel_res_b = await run_in_threadpool(_select_rel_by_partner_b)
-        if getattr(rel_res_b, "error", None):
-            raise RuntimeError(f"Supabase select relationship failed: {rel_res_b.error}")
-        relationship = rel_res_b.data[0] if rel_res_b.data else None
-
+    relationship = await resolve_relationship(user_id = user_id, fresh = True)
     if not relationship:
         return False
 
-    rel_id = relationship["id"]
-
-    def _delete_rel():
-        return (
-            supabase
-            .table(RELATIONSHIPS_TABLE)
-            .delete()
-            .eq("id", rel_id)
-            .execute()
-        )
-
-    del_res = await run_in_threadpool(_delete_rel)
+    del_res = await run_query(
+        supabase
+        .table(RELATIONSHIPS_TABLE)
+        .delete()
+        .eq("id", str(relationship.id))
+        .execute()
+    )
     if getattr(del_res, "error", None):
         raise RuntimeError(f"Supabase delete relationship failed: {del_res.error}")
+    invalidate_relationships(user_id, relationship.partner_user_id)
     return True
 
 # Return (linked, relationship_id, linked_at_iso) for the given user
 async def get_link_status_for_user(*, user_id: uuid.UUID) -> tuple[bool, Optional[uuid.UUID], Optional[str]]:
-    user_id_str = str(user_id)
-
-    def _select_rel_by_partner_a():
-        return (
-            supabase
-            .table(RELATIONSHIPS_TABLE)
-            .select("*")
-            .eq("partner_a_user_id", user_id_str)
-            .limit(1)
-            .execute()
-        )
-    def _select_rel_by_partner_b():
-        return (
-            supabase
-            .table(RELATIONSHIPS_TABLE)
-            .select("*")
-            .eq("partner_b_user_id", user_id_str)
-            .limit(1)
-            .execute()
-        )
-
-    rel_res_a = await run_in_threadpool(_select_rel_by_partner_a)
-    if getattr(rel_res_a, "error", None):
-        raise RuntimeError(f"Supabase select relationship failed: {rel_res_a.error}")
-    relationship = rel_res_a.data[0] if rel_res_a.data else None
-    if not relationship:
-        rel_res_b = await run_in_threadpool(_select_rel_by_partner_b)
-        if getattr(rel_res_b, "error", None):
-            raise RuntimeError(f"Supabase select relationship failed: {rel_res_b.error}")
-        relationship = rel_res_b.data[0] if rel_res_b.data else None
-
+    relationship = await resolve_relationship(user_id = user_id)
     if not relationship:
         return False, None, None
-    linked_at_iso: Optional[str] = relationship.get("created_at") if isinstance(relationship, dict) else None
-    return True, uuid.UUID(relationship["id"]), linked_at_iso  # type: ignore[index]
+    return True, relationship.id, relationship.linked_at
 
 # Get partner's user_id from relationship
 async def get_partner_user_id(*, user_id: uuid.UUID) -> Optional[uuid.UUID]:
-    user_id_str = str(user_id)
-
-    def _select_rel_by_partner_a():
-        return (
-            supabase
-            .table(RELATIONSHIPS_TABLE)
-            .select("partner_a_user_id, partner_b_user_id")
-            .eq("partner_a_user_id", user_id_str)
-            .limit(1)
-            .execute()
-        )
-    def _select_rel_by_partner_b():
-        return (
-            supabase
-            .table(RELATIONSHIPS_TABLE)
-            .select("partner_a_user_id, partner_b_user_id")
-            .eq("partner_b_user_id", user_id_str)
-            .limit(1)
-            .execute()
-        )
-
-    rel_res_a = await run_in_threadpool(_select_rel_by_partner_a)
-    if getattr(rel_res_a, "error", None):
-        raise RuntimeError(f"Supabase select relationship failed: {rel_res_a.error}")
-
-    if rel_res_a.data:
-        relationship = rel_res_a.data[0]
-        # User is partner_a, so return partner_b
-        return uuid.UUID(relationship["partner_b_user_id"])
-
-    rel_res_b = await run_in_threadpool(_select_rel_by_partner_b)
-    if getattr(rel_res_b, "error", None):
-        raise RuntimeError(f"Supabase select relationship failed: {rel_res_b.error}")
-
-    if rel_res_b.data:
-        relationship = rel_res_b.data[0]
-        # User is partner_b, so return partner_a
-        return uuid.UUID(relationship["partner_a_user_id"])
-
-    return None
-
-
+    relationship = await resolve_relationship(user_id = user_id)
+    return relationship.partner_user_id if relationship else None
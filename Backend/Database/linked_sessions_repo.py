@@ -1,16 +1,46 @@
 import uuid
+from dataclasses import dataclass
 from datetime import datetime, timezone
-from typing import Optional
-from starlette.concurrency import run_in_threadpool
+from typing import List, Optional
+from .request_scope import run_query, memoized, invalidate
 from .supabase_client import supabase
 
 LINKED_SESSIONS_TABLE = "linked_sessions"
 
 
+@dataclass(frozen=True, slots=True)
+class LinkedSession:
+    id: uuid.UUID
+    relationship_id: uuid.UUID
+    user_a_id: uuid.UUID
+    user_b_id: uuid.UUID
+    user_a_personal_session_id: Optional[uuid.UUID]
+    user_b_personal_session_id: Optional[uuid.UUID]
+    partner_context: Optional[List[dict]] = None  # materialized A/B thread; only loaded on request
+
+LINKED_SESSION_COLUMNS = "id, relationship_id, user_a_id, user_b_id, user_a_personal_session_id, user_b_personal_session_id"
+
+
+def _optional_uuid(value: Optional[str]) -> Optional[uuid.UUID]:
+    return uuid.UUID(value) if value else None
+
+
+def _linked_session(row: dict) -> LinkedSession:
+    return LinkedSession(
+        id=uuid.UUID(row["id"]),
+        relationship_id=uuid.UUID(row["relationship_id"]),
+        user_a_id=uuid.UUID(row["user_a_id"]),
+        user_b_id=uuid.UUID(row["user_b_id"]),
+        user_a_personal_session_id=_optional_uuid(row.get("user_a_personal_session_id")),
+        user_b_personal_session_id=_optional_uuid(row.get("user_b_personal_session_id")),
+        partner_context=row.get("partner_context"),
+    )
+
+
 # Creates (or upserts) a record that ties each partner's personal session under a relationship
 async def create_linked_session(*, relationship_id: uuid.UUID, user_a_id: uuid.UUID,
                                user_b_id: uuid.UUID, user_a_personal_session_id: uuid.UUID,
-                               user_b_personal_session_id: Optional[uuid.UUID]) -> dict:
+                               user_b_personal_session_id: Optional[uuid.UUID]) -> LinkedSession:
     payload = {
         "relationship_id": str(relationship_id),
         "user_a_id": str(user_a_id),
@@ -19,34 +49,37 @@ async def create_linked_session(*, relationship_id: uuid.UUID, user_a_id: uuid.U
         "user_b_personal_session_id": str(user_b_personal_session_id) if user_b_personal_session_id else None,
         "created_at": datetime.now(timezone.utc).isoformat()
     }
-    def _upsert():
-        return supabase.table(LINKED_SESSIONS_TABLE).upsert(
+    res = await run_query(
+        supabase.table(LINKED_SESSIONS_TABLE).upsert(
             payload,
             on_conflict = "relationship_id,user_a_personal_session_id",
         ).execute()
-
-    res = await run_in_threadpool(_upsert)
+    )
     if getattr(res, "error", None):
         raise RuntimeError(f"Supabase upsert linked session failed: {res.error}")
-    return res.data[0]
+    invalidate("linked_session")
+    return _linked_session(res.data[0])
 
-# Finds, for a given relationship and personal session, the linked row (or returns None)
-async def get_linked_session_by_relationship_and_source_session(*, relationship_id: uuid.UUID, source_session_id: uuid.UUID) -> Optional[dict]:
+# Finds, for a given relationship and personal session, the linked row (or returns None).
+# The materialized partner_context is only selected when the caller renders it.
+@memoized("linked_session")
+async def get_linked_session_by_relationship_and_source_session(*, relationship_id: uuid.UUID, source_session_id: uuid.UUID,
+                                                                with_partner_context: bool = False) -> Optional[LinkedSession]:
     relationship_id_str = str(relationship_id)
     source_session_id_str = str(source_session_id)
-    def _select():
-        return (supabase
-                .table(LINKED_SESSIONS_TABLE)
-                .select("*")
-                .eq("relationship_id", relationship_id_str)
-                .or_(f"user_a_personal_session_id.eq.{source_session_id_str},user_b_personal_session_id.eq.{source_session_id_str}")
-                .limit(1)
-                .execute()
-                )
-    res = await run_in_threadpool(_select)
+    columns = f"{LINKED_SESSION_COLUMNS}, partner_context" if with_partner_context else LINKED_SESSION_COLUMNS
+    res = await run_query(
+        supabase
+        .table(LINKED_SESSIONS_TABLE)
+        .select(columns)
+        .eq("relationship_id", relationship_id_str)
+        .or_(f"user_a_personal_session_id.eq.{source_session_id_str},user_b_personal_session_id.eq.{source_session_id_str}")
+        .limit(1)
+        .execute()
+    )
     if getattr(res, "error", None):
         raise RuntimeError(f"Supabase select linked session by relationship and session failed: {res.error}")
-    return res.data[0] if res.data else None
+    return _linked_session(res.data[0]) if res.data else None
 
 # Update partner session for a specific source session row (first-time accept case)
 async def update_linked_session_partner_session_for_source(*, relationship_id: uuid.UUID, source_session_id: uuid.UUID, partner_session_id: uuid.UUID) -> None:
@@ -64,40 +97,39 @@ async def update_linked_session_partner_session_for_source(*, relationship_id: u
         raise RuntimeError(f"No linked session found for relationship {relationship_id} and source {source_session_id}")
 
     # Determine which field to update based on where the source session is
-    if existing.get("user_a_personal_session_id") == source_session_id_str:
+    if existing.user_a_personal_session_id == source_session_id:
         # Source is user_a, so update user_b
         field_to_update = "user_b_personal_session_id"
-    elif existing.get("user_b_personal_session_id") == source_session_id_str:
+    elif existing.user_b_personal_session_id == source_session_id:
         # Source is user_b, so update user_a
         field_to_update = "user_a_personal_session_id"
     else:
         raise RuntimeError(f"Source session {source_session_id} not found in linked session record")
 
-    def _update():
-        return (supabase
-                .table(LINKED_SESSIONS_TABLE)
-                .update({field_to_update: partner_session_id_str})
-                .eq("relationship_id", relationship_id_str)
-                .or_(f"user_a_personal_session_id.eq.{source_session_id_str},user_b_personal_session_id.eq.{source_session_id_str}")
-                .execute()
-                )
-    res = await run_in_threadpool(_update)
+    res = await run_query(
+        supabase
+        .table(LINKED_SESSIONS_TABLE)
+        .update({field_to_update: partner_session_id_str})
+        .eq("relationship_id", relationship_id_str)
+        .or_(f"user_a_personal_session_id.eq.{source_session_id_str},user_b_personal_session_id.eq.{source_session_id_str}")
+        .execute()
+    )
     if getattr(res, "error", None):
         raise RuntimeError(f"Supabase update linked session partner session by source failed: {res.error}")
+    invalidate("linked_session")
 
 
-# Count accepted pairs (both partners have personal sessions linked)
+# Count accepted pairs (both partners have personal sessions linked); HEAD request, no rows transferred
 async def count_accepted_linked_pairs(*, relationship_id: uuid.UUID) -> int:
     relationship_id_str = str(relationship_id)
-    def _count():
-        return (supabase
-                .table(LINKED_SESSIONS_TABLE)
-                .select("*", count='exact')
-                .eq("relationship_id", relationship_id_str)
-                .not_.is_("user_b_personal_session_id", "null")
-                .execute()
-                )
-    res = await run_in_threadpool(_count)
+    res = await run_query(
+        supabase
+        .table(LINKED_SESSIONS_TABLE)
+        .select("id", count="exact", head=True)
+        .eq("relationship_id", relationship_id_str)
+        .not_.is_("user_b_personal_session_id", "null")
+        .execute()
+    )
     if getattr(res, "error", None):
         raise RuntimeError(f"Supabase count linked accepted pairs failed: {res.error}")
-    return res.count if hasattr(res, 'count') else 0
\ No newline at end of file
+    return res.count or 0
\ No newline at end of file
@@ -0,0 +1,47 @@
+import base64
+import json
+from typing import Optional, Sequence, Tuple
+
+
+class InvalidCursor(ValueError):
+    """The page cursor is malformed or belongs to another listing."""
+
+
+# Opaque page cursor: which listing it belongs to, the walk direction and the sort key of the last row served
+def encode_cursor(kind: str, key: Sequence[str], *, newest_first: bool) -> str:
+    raw = json.dumps({"k": kind, "n": newest_first, "v": [str(v) for v in key]}, separators=(",", ":"))
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+
+# Inverse of encode_cursor: (key, newest_first); raises InvalidCursor for anything it didn't produce
+def decode_cursor(cursor: str, *, kind: str, size: int) -> Tuple[Tuple[str, ...], bool]:
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        data = json.loads(raw)
+        key = tuple(data["v"])
+        newest_first = data["n"]
+    except Exception:
+        raise InvalidCursor("Malformed page cursor")
+    if data.get("k") != kind or len(key) != size or not isinstance(newest_first, bool) or not all(isinstance(v, str) for v in key):
+        raise InvalidCursor("Malformed page cursor")
+    return key, newest_first
+
+
+def _quoted(value: str) -> str:
+    return '"' + value.replace("\\", "\\\\").replace('"', '\\"') + '"'
+
+
+# Restrict a PostgREST query to the rows after `key` in (columns...) order, ascending or descending.
+# The leading-column bound is redundant with the or= expansion but is what lets Postgres walk the
+# composite index from the cursor instead of filtering every row before it.
+def apply_keyset(query, columns: Sequence[str], key: Optional[Sequence[str]], *, descending: bool):
+    if key is None:
+        return query
+    strict, inclusive = ("lt", "lte") if descending else ("gt", "gte")
+    query = query.filter(columns[0], inclusive, key[0])
+    clauses = []
+    for i, column in enumerate(columns):
+        terms = [f"{c}.eq.{_quoted(v)}" for c, v in zip(columns[:i], key[:i])]
+        terms.append(f"{column}.{strict}.{_quoted(key[i])}")
+        clauses.append(terms[0] if len(terms) == 1 else f"and({','.join(terms)})")
+    return query.or_(",".join(clauses))
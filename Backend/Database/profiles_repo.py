@@ -0,0 +1,65 @@
+import uuid
+from typing import Optional
+from .request_scope import run_query, memoized, invalidate
+from .supabase_client import supabase
+
+PROFILES_TABLE = "profiles"
+AVATAR_BUCKET = "avatar"
+SIGNED_URL_TTL_SECONDS = 60 * 60 * 24
+
+
+# Fetch the given columns of a user's profile row ({} when the user has no profile yet)
+@memoized("profile")
+async def get_profile(*, user_id: uuid.UUID, columns: str) -> dict:
+    res = await run_query(
+        supabase
+        .table(PROFILES_TABLE)
+        .select(columns)
+        .eq("user_id", str(user_id))
+        .limit(1)
+        .execute()
+    )
+    if getattr(res, "error", None):
+        raise RuntimeError(f"Supabase select profile failed: {res.error}")
+    return res.data[0] if res.data else {}
+
+# Insert or update the given fields on a user's profile row
+async def upsert_profile(*, user_id: uuid.UUID, fields: dict) -> None:
+    res = await run_query(supabase.table(PROFILES_TABLE).upsert({"user_id": str(user_id), **fields}).execute())
+    if getattr(res, "error", None):
+        raise RuntimeError(f"Failed to update profile: {res.error}")
+    invalidate("profile")
+
+# Upload (or replace) an avatar object in the avatar bucket
+async def upload_avatar_object(*, key: str, data: bytes, content_type: str) -> None:
+    res = await run_query(
+        supabase.storage.from_(AVATAR_BUCKET).upload(
+            path = key,
+            file = data,
+            file_options = {"contentType": content_type, "upsert": "true"},
+        )
+    )
+    if getattr(res, "error", None):
+        raise RuntimeError(f"Storage upload failed: {res.error}")
+
+# Create a signed URL from a storage path ("bucket/key", or a bare key in the avatar bucket)
+async def create_signed_url(*, path_value: str) -> Optional[str]:
+    if "/" in path_value:
+        bucket, key = path_value.split("/", 1)
+    else:
+        bucket, key = AVATAR_BUCKET, path_value
+    try:
+        signed = await run_query(supabase.storage.from_(bucket).create_signed_url(key, SIGNED_URL_TTL_SECONDS))
+    except Exception:
+        return None
+    return signed.get("signedURL") if isinstance(signed, dict) else None
+
+# Return the auth user's user_metadata via the admin API (None if the user doesn't exist, {} if it has none)
+@memoized("auth_user")
+async def get_auth_user_metadata(*, user_id: uuid.UUID) -> Optional[dict]:
+    res = await run_query(supabase.auth.admin.get_user_by_id(str(user_id)))
+    user = getattr(res, "user", None) or getattr(res, "data", None)
+    if not user:
+        return None
+    meta = user.get("user_metadata") if isinstance(user, dict) else getattr(user, "user_metadata", None)
+    return meta if isinstance(meta, dict) else {}
@@ -0,0 +1,113 @@
+import asyncio
+import functools
+import os
+from contextvars import ContextVar
+from typing import Awaitable, Dict, Optional, Tuple, TypeVar
+
+T = TypeVar("T")
+
+# Cap on supabase queries in flight per process. Extra callers wait here instead of queueing inside
+# httpx's connection pool, whose bookkeeping cost grows with every request it holds.
+_query_slots = asyncio.Semaphore(max(1, int(os.getenv("SUPABASE_MAX_CONCURRENT_QUERIES", "16"))))
+
+
+class RequestScope:
+    """Per-request database bookkeeping: query count plus memoized reads.
+
+    Memoized reads are keyed by (namespace, kwargs). Identical lookups issued while one is
+    in flight share that query; later ones reuse its result until a write invalidates the
+    namespace. Nothing outlives the request.
+    """
+
+    def __init__(self, label: str = ""):
+        self.label = label
+        self.queries = 0
+        self.memo_hits = 0
+        self._memo: Dict[Tuple, asyncio.Task] = {}
+
+    def invalidate(self, *namespaces: str) -> None:
+        for key in [k for k in self._memo if k[0] in namespaces]:
+            self._memo.pop(key, None)
+
+
+_current_scope: ContextVar[Optional[RequestScope]] = ContextVar("db_request_scope", default=None)
+
+
+def current_scope() -> Optional[RequestScope]:
+    return _current_scope.get()
+
+
+# Await one supabase query, counting it against the current request
+async def run_query(query: Awaitable[T]) -> T:
+    scope = _current_scope.get()
+    if scope is not None:
+        scope.queries += 1
+    async with _query_slots:
+        return await query
+
+
+# Drop memoized reads for the given namespaces (call after any write that affects them)
+def invalidate(*namespaces: str) -> None:
+    scope = _current_scope.get()
+    if scope is not None:
+        scope.invalidate(*namespaces)
+
+
+# Decorator for keyword-only async repo reads: dedupe identical calls within one request
+def memoized(namespace: str):
+    def decorator(fn):
+        @functools.wraps(fn)
+        async def wrapper(**kwargs):
+            scope = _current_scope.get()
+            if scope is None:
+                return await fn(**kwargs)
+            loop = asyncio.get_running_loop()
+            key = (namespace, fn.__name__, tuple(sorted((k, str(v)) for k, v in kwargs.items())))
+            task = scope._memo.get(key)
+            if task is not None and task.get_loop() is loop:
+                scope.memo_hits += 1
+            else:
+                task = loop.create_task(fn(**kwargs))
+                scope._memo[key] = task
+            try:
+                # Shield so one cancelled caller can't cancel the query the others share
+                return await asyncio.shield(task)
+            except Exception:
+                if scope._memo.get(key) is task:
+                    scope._memo.pop(key, None)
+                raise
+        return wrapper
+    return decorator
+
+
+class RequestScopeMiddleware:
+    """ASGI middleware opening a RequestScope for every HTTP request.
+
+    The query count so far is sent as X-DB-Query-Count with the response headers (setup
+    queries for streams) and the final count is logged when the request completes.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope.get("type") != "http":
+            await self.app(scope, receive, send)
+            return
+
+        req_scope = RequestScope(label=f"{scope.get('method', '')} {scope.get('path', '')}")
+        token = _current_scope.set(req_scope)
+
+        async def send_with_count(message):
+            if message.get("type") == "http.response.start":
+                headers = list(message.get("headers") or [])
+                headers.append((b"x-db-query-count", str(req_scope.queries).encode()))
+                message = {**message, "headers": headers}
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_count)
+        finally:
+            _current_scope.reset(token)
+            if req_scope.queries or req_scope.memo_hits:
+                print(f"[DB] {req_scope.label} queries={req_scope.queries} memo_hits={req_scope.memo_hits}")
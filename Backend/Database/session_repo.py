@@ -1,10 +1,48 @@
+import asyncio
+import os
 import uuid
-from datetime import datetime, timezone
-from typing import List, Optional
-from starlette.concurrency import run_in_threadpool
+from dataclasses import dataclass
+from datetime import datetime, timedelta, timezone
+from typing import List, Optional, Sequence, Tuple
+from .pagination import apply_keyset
+from .request_scope import run_query, memoized, invalidate
 from .supabase_client import supabase
 
 SESSIONS_TABLE = "user_chat_sessions"
+TOMBSTONES_TABLE = "user_chat_session_tombstones"
+
+# How long deleted sessions keep a tombstone (the expiry in migration 007); older watermarks get a full list
+SESSIONS_TOMBSTONE_RETENTION = timedelta(days=30)
+# Delta reads start this far before the watermark: a write whose transaction began before the
+# watermark was read but committed after it carries an earlier updated_at
+SESSIONS_SYNC_OVERLAP = timedelta(seconds=float(os.getenv("SESSIONS_SYNC_OVERLAP_SECONDS", "5")))
+
+# The session fields the listing and the title lookups use (not the counters or the conversation context)
+@dataclass(frozen=True, slots=True)
+class SessionSummary:
+    id: uuid.UUID
+    title: Optional[str]
+    last_message_at: Optional[str]
+    last_message_content: Optional[str]
+    created_at: Optional[str]
+
+SESSION_SUMMARY_COLUMNS = "id, title, last_message_at, last_message_content, created_at"
+
+
+@dataclass(frozen=True, slots=True)
+class SessionTombstone:
+    id: uuid.UUID
+    deleted_at: str
+
+
+def _session_summary(row: dict) -> SessionSummary:
+    return SessionSummary(
+        id=uuid.UUID(row["id"]),
+        title=row.get("title"),
+        last_message_at=row.get("last_message_at"),
+        last_message_content=row.get("last_message_content"),
+        created_at=row.get("created_at"),
+    )
 
 
 # Create a new chat session row for the user with the given optional title
@@ -14,122 +52,187 @@ async def create_session(*, user_id: uuid.UUID, title: Optional[str] = None) ->
         "title": title,
         "last_message_at": datetime.now(timezone.utc).isoformat(),
     }
-    def _insert():
-        return supabase.table(SESSIONS_TABLE).insert(payload).execute()
-    res = await run_in_threadpool(_insert)
+    res = await run_query(supabase.table(SESSIONS_TABLE).insert(payload).execute())
     if getattr(res, "error", None):
         raise RuntimeError(f"Supabase insert session failed: {res.error}")
     if not hasattr(res, 'data') or not res.data:
         raise RuntimeError("Supabase insert session returned no data")
     return res.data[0]
 
-# List chat sessions for a specific user ordered by recent activity and creation time
-async def list_sessions_for_user(*, user_id: uuid.UUID, limit: int = 100, offset: int = 0) -> List[dict]:
-    def _select():
-        return (
-            supabase
-            .table(SESSIONS_TABLE)
-            .select("*")
-            .eq("user_id", str(user_id))
-            .order("last_message_at", desc=True)
-            .order("created_at", desc=True)
-            .range(offset, offset + max(limit - 1, 0))
-            .execute()
-        )
-    res = await run_in_threadpool(_select)
+SESSION_SORT_COLUMNS = ("last_message_at", "created_at", "id")
+
+# One keyset page of the user's sessions, most recent activity first: (last_message_at, created_at, id)
+# descending. `after` is that key of the last session of the previous page.
+async def list_sessions_for_user(*, user_id: uuid.UUID, limit: int = 100, after: Optional[Sequence[str]] = None) -> List[SessionSummary]:
+    query = (
+        supabase
+        .table(SESSIONS_TABLE)
+        .select(SESSION_SUMMARY_COLUMNS)
+        .eq("user_id", str(user_id))
+    )
+    res = await run_query(
+        apply_keyset(query, SESSION_SORT_COLUMNS, after, descending=True)
+        .order("last_message_at", desc=True)
+        .order("created_at", desc=True)
+        .order("id", desc=True)
+        .limit(limit)
+        .execute()
+    )
     if getattr(res, "error", None):
         raise RuntimeError(f"Supabase select sessions failed: {res.error}")
     if not hasattr(res, 'data'):
         raise RuntimeError("Supabase select sessions returned invalid response")
+    return [_session_summary(r) for r in res.data or []]
 
-    # Add last_message_content field to each session (it's now stored in the database)
-    for session in res.data or []:
-        original_content = session.get("last_message_content")
-        session["last_message_content"] = original_content
-
-    return res.data or []
+# Version of the user's session list: the newest session updated_at or tombstone deleted_at, whichever
+# is later (None for a user who never had a session), in one round trip (chat_sessions_version, migration 007).
+# Every change the list shows moves it forward, so it is both the ETag source and the watermark clients
+# pass back as `since`.
+async def get_sessions_version(*, user_id: uuid.UUID) -> Optional[str]:
+    res = await run_query(supabase.rpc("chat_sessions_version", {"p_user_id": str(user_id)}).execute())
+    if getattr(res, "error", None):
+        raise RuntimeError(f"Supabase chat_sessions_version failed: {res.error}")
+    data = res.data[0] if isinstance(res.data, list) else res.data
+    return data or None
 
-# Fetch a single session by id, ensuring it belongs to the user
-async def get_session_by_id(*, user_id: uuid.UUID, session_id: uuid.UUID) -> Optional[dict]:
-    def _select():
-        return (
+# Sessions created or updated and sessions deleted after `since` (with the sync overlap), at most `limit`
+# of each. None when a delta can't be served: the watermark is older than the tombstones or there are more
+# changes than `limit`; the caller sends the full list instead.
+async def list_session_changes_since(*, user_id: uuid.UUID, since: datetime,
+                                     limit: int = 100) -> Optional[Tuple[List[SessionSummary], List[SessionTombstone]]]:
+    if since < datetime.now(timezone.utc) - SESSIONS_TOMBSTONE_RETENTION:
+        return None
+    start = (since - SESSIONS_SYNC_OVERLAP).isoformat()
+    changed_res, deleted_res = await asyncio.gather(
+        run_query(
             supabase
             .table(SESSIONS_TABLE)
-            .select("*")
-            .eq("id", str(session_id))
+            .select(SESSION_SUMMARY_COLUMNS)
             .eq("user_id", str(user_id))
-            .limit(1)
+            .gt("updated_at", start)
+            .order("updated_at")
+            .limit(limit + 1)
             .execute()
-        )
-    res = await run_in_threadpool(_select)
-    if getattr(res, "error", None):
-        raise RuntimeError(f"Supabase select session failed: {res.error}")
-    return (res.data or [None])[0]
-
-# Bump the session's last_message_at timestamp to now (needed to order sessions by recent activity)
-async def touch_session(*, session_id: uuid.UUID) -> None:
-    def _update():
-        return (
+        ),
+        run_query(
             supabase
-            .table(SESSIONS_TABLE)
-            .update({"last_message_at": datetime.now(timezone.utc).isoformat()})
-            .eq("id", str(session_id))
+            .table(TOMBSTONES_TABLE)
+            .select("session_id, deleted_at")
+            .eq("user_id", str(user_id))
+            .gt("deleted_at", start)
+            .order("deleted_at")
+            .limit(limit + 1)
             .execute()
-        )
-    res = await run_in_threadpool(_update)
+        ),
+    )
+    for res in (changed_res, deleted_res):
+        if getattr(res, "error", None):
+            raise RuntimeError(f"Supabase select session changes failed: {res.error}")
+    changed, deleted = changed_res.data or [], deleted_res.data or []
+    if len(changed) > limit or len(deleted) > limit:
+        return None
+    return (
+        [_session_summary(r) for r in changed],
+        [SessionTombstone(id=uuid.UUID(r["session_id"]), deleted_at=r["deleted_at"]) for r in deleted],
+    )
+
+# Fetch a single session by id, ensuring it belongs to the user
+@memoized("session")
+async def get_session_by_id(*, user_id: uuid.UUID, session_id: uuid.UUID) -> Optional[SessionSummary]:
+    res = await run_query(
+        supabase
+        .table(SESSIONS_TABLE)
+        .select(SESSION_SUMMARY_COLUMNS)
+        .eq("id", str(session_id))
+        .eq("user_id", str(user_id))
+        .limit(1)
+        .execute()
+    )
     if getattr(res, "error", None):
-        raise RuntimeError(f"Supabase update session failed: {res.error}")
+        raise RuntimeError(f"Supabase select session failed: {res.error}")
+    return _session_summary(res.data[0]) if res.data else None
 
 # Ensure the session belongs to the given user or raise PermissionError
+@memoized("session")
 async def assert_session_owned_by_user(*, user_id: uuid.UUID, session_id: uuid.UUID) -> None:
-    def _select():
-        return (
-            supabase
-            .table(SESSIONS_TABLE)
-            .select("id")
-            .eq("id", str(session_id))
-            .eq("user_id", str(user_id))
-            .limit(1)
-            .execute()
-        )
-    res = await run_in_threadpool(_select)
+    res = await run_query(
+        supabase
+        .table(SESSIONS_TABLE)
+        .select("id")
+        .eq("id", str(session_id))
+        .eq("user_id", str(user_id))
+        .limit(1)
+        .execute()
+    )
     if getattr(res, "error", None):
         raise RuntimeError(f"Supabase verify session failed: {res.error}")
     if not res.data:
         raise PermissionError("Session not found or not owned by user")
 
 
+# Ownership check that also returns the session's server-side conversation context
+# (last_response_id, last_response_tokens, context_summary); raises PermissionError like the assert above
+@memoized("session")
+async def get_session_context(*, user_id: uuid.UUID, session_id: uuid.UUID) -> dict:
+    res = await run_query(
+        supabase
+        .table(SESSIONS_TABLE)
+        .select("id, last_response_id, last_response_tokens, last_response_partner_context_at, context_summary")
+        .eq("id", str(session_id))
+        .eq("user_id", str(user_id))
+        .limit(1)
+        .execute()
+    )
+    if getattr(res, "error", None):
+        raise RuntimeError(f"Supabase select session context failed: {res.error}")
+    if not res.data:
+        raise PermissionError("Session not found or not owned by user")
+    return res.data[0]
+
+
+# Store the session's conversation context after a turn (any of the context columns)
+async def update_session_context(*, session_id: uuid.UUID, fields: dict) -> None:
+    res = await run_query(
+        supabase
+        .table(SESSIONS_TABLE)
+        .update(fields)
+        .eq("id", str(session_id))
+        .execute()
+    )
+    if getattr(res, "error", None):
+        raise RuntimeError(f"Supabase update session context failed: {res.error}")
+    invalidate("session")
+
+
 # Update the title of a session owned by a user
 async def update_session_title(*, user_id: uuid.UUID, session_id: uuid.UUID, title: Optional[str]) -> None:
     # Verify ownership first
     await assert_session_owned_by_user(user_id=user_id, session_id=session_id)
-    def _update():
-        return (
-            supabase
-            .table(SESSIONS_TABLE)
-            .update({"title": title})
-            .eq("id", str(session_id))
-            .eq("user_id", str(user_id))
-            .execute()
-        )
-    res = await run_in_threadpool(_update)
+    res = await run_query(
+        supabase
+        .table(SESSIONS_TABLE)
+        .update({"title": title})
+        .eq("id", str(session_id))
+        .eq("user_id", str(user_id))
+        .execute()
+    )
     if getattr(res, "error", None):
         raise RuntimeError(f"Supabase update session title failed: {res.error}")
+    invalidate("session")
 
 
 # Delete a session owned by a user
 async def delete_session(*, user_id: uuid.UUID, session_id: uuid.UUID) -> None:
     # Verify ownership first
     await assert_session_owned_by_user(user_id=user_id, session_id=session_id)
-    def _delete():
-        return (
-            supabase
-            .table(SESSIONS_TABLE)
-            .delete()
-            .eq("id", str(session_id))
-            .eq("user_id", str(user_id))
-            .execute()
-        )
-    res = await run_in_threadpool(_delete)
+    res = await run_query(
+        supabase
+        .table(SESSIONS_TABLE)
+        .delete()
+        .eq("id", str(session_id))
+        .eq("user_id", str(user_id))
+        .execute()
+    )
     if getattr(res, "error", None):
-        raise RuntimeError(f"Supabase delete session failed: {res.error}")
\ No newline at end of file
+        raise RuntimeError(f"Supabase delete session failed: {res.error}")
+    invalidate("session")
\ No newline at end of file
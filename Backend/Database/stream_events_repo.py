@@ -0,0 +1,143 @@
+from datetime import datetime, timezone
+from typing import List, Optional, Tuple
+from .request_scope import run_query
+from .supabase_client import supabase
+
+STREAMS_TABLE = "chat_streams"
+EVENTS_TABLE = "chat_stream_events"
+
+
+# Register a resumable stream (frames are added with insert_events)
+async def create_stream(*, stream_id: str, user_id: str, session_id: str, expires_at: str) -> None:
+    payload = {"id": stream_id, "user_id": user_id, "session_id": session_id, "done": False, "expires_at": expires_at}
+    res = await run_query(supabase.table(STREAMS_TABLE).insert(payload).execute())
+    if getattr(res, "error", None):
+        raise RuntimeError(f"Supabase insert chat_stream failed: {res.error}")
+
+# Mark a stream finished and restart its TTL
+async def finish_stream(*, stream_id: str, expires_at: str) -> None:
+    res = await run_query(
+        supabase
+        .table(STREAMS_TABLE)
+        .update({"done": True, "expires_at": expires_at})
+        .eq("id", stream_id)
+        .execute()
+    )
+    if getattr(res, "error", None):
+        raise RuntimeError(f"Supabase update chat_stream failed: {res.error}")
+
+# Push back a live stream's expiry (the generating process renews it while frames keep coming)
+async def extend_stream(*, stream_id: str, expires_at: str) -> None:
+    res = await run_query(
+        supabase
+        .table(STREAMS_TABLE)
+        .update({"expires_at": expires_at})
+        .eq("id", stream_id)
+        .eq("done", False)
+        .execute()
+    )
+    if getattr(res, "error", None):
+        raise RuntimeError(f"Supabase extend chat_stream failed: {res.error}")
+
+# A client on another machine is following a live stream (the generating machine polls this)
+async def touch_stream_follower(*, stream_id: str, followed_at: str) -> None:
+    res = await run_query(
+        supabase
+        .table(STREAMS_TABLE)
+        .update({"followed_at": followed_at})
+        .eq("id", stream_id)
+        .eq("done", False)
+        .execute()
+    )
+    if getattr(res, "error", None):
+        raise RuntimeError(f"Supabase touch chat_stream failed: {res.error}")
+
+# Ask whichever machine generates a stream to stop it; False if the stream already finished
+async def request_stream_stop(*, stream_id: str, reason: str) -> bool:
+    res = await run_query(
+        supabase
+        .table(STREAMS_TABLE)
+        .update({"stop_requested": reason})
+        .eq("id", stream_id)
+        .eq("done", False)
+        .execute()
+    )
+    if getattr(res, "error", None):
+        raise RuntimeError(f"Supabase stop chat_stream failed: {res.error}")
+    return bool(res.data)
+
+# Follower heartbeats and stop requests of the given streams
+async def list_stream_controls(*, stream_ids: List[str]) -> List[dict]:
+    res = await run_query(
+        supabase
+        .table(STREAMS_TABLE)
+        .select("id, followed_at, stop_requested")
+        .in_("id", stream_ids)
+        .execute()
+    )
+    if getattr(res, "error", None):
+        raise RuntimeError(f"Supabase select chat_stream controls failed: {res.error}")
+    return res.data or []
+
+# Fetch an unexpired stream row or None
+async def get_stream(*, stream_id: str) -> Optional[dict]:
+    res = await run_query(
+        supabase
+        .table(STREAMS_TABLE)
+        .select("id, user_id, session_id, done")
+        .eq("id", stream_id)
+        .gt("expires_at", datetime.now(timezone.utc).isoformat())
+        .limit(1)
+        .execute()
+    )
+    if getattr(res, "error", None):
+        raise RuntimeError(f"Supabase select chat_stream failed: {res.error}")
+    return res.data[0] if res.data else None
+
+# Append a batch of (event_id, frame) rows
+async def insert_events(*, stream_id: str, events: List[Tuple[int, str]]) -> None:
+    rows = [{"stream_id": stream_id, "event_id": event_id, "frame": frame} for event_id, frame in events]
+    res = await run_query(supabase.table(EVENTS_TABLE).upsert(rows, on_conflict="stream_id,event_id").execute())
+    if getattr(res, "error", None):
+        raise RuntimeError(f"Supabase insert chat_stream_events failed: {res.error}")
+
+# Frames with event_id > after_id, oldest first
+async def list_events_after(*, stream_id: str, after_id: int, limit: int) -> List[dict]:
+    res = await run_query(
+        supabase
+        .table(EVENTS_TABLE)
+        .select("event_id, frame")
+        .eq("stream_id", stream_id)
+        .gt("event_id", after_id)
+        .order("event_id", desc=False)
+        .limit(limit)
+        .execute()
+    )
+    if getattr(res, "error", None):
+        raise RuntimeError(f"Supabase select chat_stream_events failed: {res.error}")
+    return res.data or []
+
+# Drop frames that fell out of the ring buffer
+async def trim_events(*, stream_id: str, up_to_id: int) -> None:
+    res = await run_query(
+        supabase
+        .table(EVENTS_TABLE)
+        .delete()
+        .eq("stream_id", stream_id)
+        .lte("event_id", up_to_id)
+        .execute()
+    )
+    if getattr(res, "error", None):
+        raise RuntimeError(f"Supabase trim chat_stream_events failed: {res.error}")
+
+# Remove expired streams (their frames cascade)
+async def delete_expired_streams() -> None:
+    res = await run_query(
+        supabase
+        .table(STREAMS_TABLE)
+        .delete()
+        .lt("expires_at", datetime.now(timezone.utc).isoformat())
+        .execute()
+    )
+    if getattr(res, "error", None):
+        raise RuntimeError(f"Supabase delete expired chat_streams failed: {res.error}")
@@ -1,15 +1,59 @@
 import os
 from typing import Optional
+
+import httpx
 from dotenv import load_dotenv
-from supabase import create_client, Client
+from supabase import AsyncClient, AsyncClientOptions
 
 load_dotenv()
 
-def _init_supabase_client() -> Client:
+
+def _http2_enabled() -> bool:
+    if os.getenv("SUPABASE_HTTP2", "true").strip().lower() == "false":
+        return False
+    try:
+        import h2  # noqa: F401
+    except ImportError:
+        print("[Supabase] h2 not installed; using HTTP/1.1 (pip install 'httpx[http2]')")
+        return False
+    return True
+
+
+# One pooled HTTP client shared by PostgREST, Storage and Auth (admin) calls
+def _init_http_client() -> httpx.AsyncClient:
+    limits = httpx.Limits(
+        max_connections = int(os.getenv("SUPABASE_MAX_CONNECTIONS", "50")),
+        max_keepalive_connections = int(os.getenv("SUPABASE_MAX_KEEPALIVE_CONNECTIONS", "20")),
+        keepalive_expiry = float(os.getenv("SUPABASE_KEEPALIVE_EXPIRY_SECONDS", "30")),
+    )
+    timeout = httpx.Timeout(
+        float(os.getenv("SUPABASE_TIMEOUT_SECONDS", "20")),
+        connect = float(os.getenv("SUPABASE_CONNECT_TIMEOUT_SECONDS", "5")),
+        pool = float(os.getenv("SUPABASE_POOL_TIMEOUT_SECONDS", "10")),
+    )
+    http2 = _http2_enabled()
+    print(f"[DB] supabase client max_connections={limits.max_connections} keepalive={limits.max_keepalive_connections} http2={http2}")
+    return httpx.AsyncClient(limits = limits, timeout = timeout, http2 = http2, follow_redirects = True)
+
+
+def _init_supabase_client() -> AsyncClient:
     url: Optional[str] = os.getenv("SUPABASE_URL")
     key: Optional[str] = os.getenv("SUPABASE_SECRET_KEY")
     if not url or not key:
         raise RuntimeError("Missing SUPABASE_URL or SUPABASE_SECRET_KEY in environment")
-    return create_client(url, key)
+    # Service-role client: no user session to persist or refresh
+    options = AsyncClientOptions(
+        httpx_client = _init_http_client(),
+        auto_refresh_token = False,
+        persist_session = False,
+    )
+    return AsyncClient(url, key, options)
+
+supabase: AsyncClient = _init_supabase_client()
+
 
-supabase: Client = _init_supabase_client()
\ No newline at end of file
+# Close the shared pool (app shutdown)
+async def close_supabase_client() -> None:
+    http_client = supabase.options.httpx_client
+    if http_client is not None:
+        await http_client.aclose()
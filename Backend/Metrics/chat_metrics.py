@@ -0,0 +1,41 @@
+from typing import Optional
+
+from .metrics import histogram
+from .timing import PhaseTimer
+
+TOKEN_BUCKETS = (16, 32, 64, 128, 256, 512, 1024, 2048, 4096, 8192)
+RATE_BUCKETS = (5, 10, 20, 40, 60, 80, 100, 150, 200, 300)
+
+chat_stage_seconds = histogram("chat_stage_seconds", "Duration of each /chat stream stage, by stage")
+chat_output_tokens = histogram("chat_output_tokens", "Output tokens per chat response (Responses API usage)", TOKEN_BUCKETS)
+partner_context_trimmed_tokens = histogram("chat_partner_context_trimmed_tokens", "Partner A/B context tokens left out of a chat prompt by the token budget", (0,) + TOKEN_BUCKETS)
+chat_tokens_per_second = histogram("chat_output_tokens_per_second", "Output tokens per second between first and last token", RATE_BUCKETS)
+
+# Timer phases recorded as-is (durations) and the stages derived from marks (elapsed since request start)
+_PHASE_STAGES = ("admission", "ownership", "create_session", "link_status", "linked_session", "history", "context", "setup",
+                 "persist_user", "persist_assistant")
+
+
+# Aggregate one finished chat stream's PhaseTimer into the stage histograms
+def record_chat_stream(timer: PhaseTimer, *, output_tokens: Optional[int]) -> None:
+    for stage in _PHASE_STAGES:
+        ms = timer.get(stage)
+        if ms is not None:
+            chat_stage_seconds.observe(ms / 1000.0, stage=stage)
+
+    requested = timer.get("openai_request_at")
+    created = timer.get("openai_created_at")
+    first_token = timer.get("first_token_at")
+    done = timer.get("stream_done_at")
+    if requested is not None and created is not None:
+        chat_stage_seconds.observe((created - requested) / 1000.0, stage="openai_connect")
+    if first_token is not None:
+        chat_stage_seconds.observe(first_token / 1000.0, stage="time_to_first_token")
+    if requested is not None and done is not None:
+        chat_stage_seconds.observe((done - requested) / 1000.0, stage="stream")
+    chat_stage_seconds.observe(timer.elapsed_ms() / 1000.0, stage="total")
+
+    if output_tokens:
+        chat_output_tokens.observe(output_tokens)
+        if first_token is not None and done is not None and done > first_token:
+            chat_tokens_per_second.observe(output_tokens / ((done - first_token) / 1000.0))
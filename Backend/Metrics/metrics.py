@@ -0,0 +1,159 @@
+import bisect
+import threading
+from typing import Dict, List, Optional, Sequence, Tuple
+
+LabelKey = Tuple[Tuple[str, str], ...]
+
+
+class Counter:
+    """Monotonically increasing value, optionally split by label values."""
+
+    def __init__(self, name: str, help_text: str):
+        self.name = name
+        self.help = help_text
+        self._values: Dict[LabelKey, float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1.0, **labels: str) -> None:
+        key = tuple(sorted((k, str(v)) for k, v in labels.items()))
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def value(self, **labels: str) -> float:
+        key = tuple(sorted((k, str(v)) for k, v in labels.items()))
+        return self._values.get(key, 0.0)
+
+    def samples(self) -> List[Tuple[LabelKey, float]]:
+        with self._lock:
+            return list(self._values.items())
+
+
+class Gauge(Counter):
+    """Value that goes up and down (in-flight requests, open connections)."""
+
+    def dec(self, amount: float = 1.0, **labels: str) -> None:
+        self.inc(-amount, **labels)
+
+    def set(self, value: float, **labels: str) -> None:
+        key = tuple(sorted((k, str(v)) for k, v in labels.items()))
+        with self._lock:
+            self._values[key] = value
+
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+
+class Histogram:
+    """Cumulative-bucket histogram of observed values, optionally split by label values."""
+
+    def __init__(self, name: str, help_text: str, buckets: Sequence[float] = LATENCY_BUCKETS):
+        self.name = name
+        self.help = help_text
+        self.buckets = tuple(sorted(buckets))
+        self._values: Dict[LabelKey, List[float]] = {}  # per-bucket counts (+Inf last), then sum, then count
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, **labels: str) -> None:
+        key = tuple(sorted((k, str(v)) for k, v in labels.items()))
+        idx = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            row = self._values.get(key)
+            if row is None:
+                row = self._values[key] = [0.0] * (len(self.buckets) + 3)
+            row[idx] += 1
+            row[-2] += value
+            row[-1] += 1
+
+    # (cumulative bucket counts incl. +Inf, sum, count) per label set
+    def samples(self) -> List[Tuple[LabelKey, List[float], float, float]]:
+        with self._lock:
+            rows = [(key, list(row)) for key, row in self._values.items()]
+        out = []
+        for key, row in rows:
+            cumulative, total = [], 0.0
+            for n in row[:-2]:
+                total += n
+                cumulative.append(total)
+            out.append((key, cumulative, row[-2], row[-1]))
+        return out
+
+    # Approximate quantile from bucket bounds (upper bound of the bucket holding it); None when empty
+    def quantile(self, q: float, **labels: str) -> Optional[float]:
+        key = tuple(sorted((k, str(v)) for k, v in labels.items()))
+        for sample_key, cumulative, _, count in self.samples():
+            if sample_key != key or not count:
+                continue
+            rank = q * count
+            for bound, seen in zip(self.buckets + (float("inf"),), cumulative):
+                if seen >= rank:
+                    return bound
+        return None
+
+
+_registry: Dict[str, object] = {}
+_registry_lock = threading.Lock()
+
+
+# Get or create a process-wide counter by name
+def counter(name: str, help_text: str) -> Counter:
+    with _registry_lock:
+        metric = _registry.get(name)
+        if metric is None:
+            metric = _registry[name] = Counter(name, help_text)
+        return metric  # type: ignore[return-value]
+
+
+# Get or create a process-wide gauge by name
+def gauge(name: str, help_text: str) -> Gauge:
+    with _registry_lock:
+        metric = _registry.get(name)
+        if metric is None:
+            metric = _registry[name] = Gauge(name, help_text)
+        return metric  # type: ignore[return-value]
+
+
+# Get or create a process-wide histogram by name
+def histogram(name: str, help_text: str, buckets: Sequence[float] = LATENCY_BUCKETS) -> Histogram:
+    with _registry_lock:
+        metric = _registry.get(name)
+        if metric is None:
+            metric = _registry[name] = Histogram(name, help_text, buckets)
+        return metric  # type: ignore[return-value]
+
+
+def all_metrics() -> List[object]:
+    with _registry_lock:
+        return list(_registry.values())
+
+
+def _num(value: float) -> str:
+    return str(int(value)) if float(value).is_integer() else repr(float(value))
+
+
+def _format_labels(key: LabelKey, extra: Tuple[Tuple[str, str], ...] = ()) -> str:
+    pairs = key + extra
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{k}="{v}"' for k, v in pairs) + "}"
+
+
+# Prometheus text exposition format (0.0.4) for every registered metric
+def render_prometheus() -> str:
+    lines: List[str] = []
+    for metric in sorted(all_metrics(), key=lambda m: m.name):  # type: ignore[attr-defined]
+        if isinstance(metric, Histogram):
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} histogram")
+            for key, cumulative, total, count in metric.samples():
+                for bound, seen in zip(metric.buckets + (float("inf"),), cumulative):
+                    le = "+Inf" if bound == float("inf") else repr(bound)
+                    lines.append(f"{metric.name}_bucket{_format_labels(key, (('le', le),))} {_num(seen)}")
+                lines.append(f"{metric.name}_sum{_format_labels(key)} {_num(total)}")
+                lines.append(f"{metric.name}_count{_format_labels(key)} {_num(count)}")
+            continue
+        kind = "gauge" if isinstance(metric, Gauge) else "counter"
+        lines.append(f"# HELP {metric.name} {metric.help}")  # type: ignore[attr-defined]
+        lines.append(f"# TYPE {metric.name} {kind}")  # type: ignore[attr-defined]
+        for key, value in metric.samples():  # type: ignore[attr-defined]
+            lines.append(f"{metric.name}{_format_labels(key)} {_num(value)}")  # type: ignore[attr-defined]
+    return "\n".join(lines) + "\n"
@@ -0,0 +1,45 @@
+import time
+from contextlib import contextmanager
+from typing import Awaitable, Dict, Optional, TypeVar
+
+T = TypeVar("T")
+
+
+class PhaseTimer:
+    """Wall-clock timings (ms) for the named phases of one request.
+
+    Phases may overlap when they run concurrently; each records its own duration.
+    mark() records the elapsed time since the timer was created (e.g. first byte).
+    """
+
+    def __init__(self):
+        self._t0 = time.perf_counter()
+        self.phases: Dict[str, float] = {}
+
+    def elapsed_ms(self) -> float:
+        return (time.perf_counter() - self._t0) * 1000.0
+
+    @contextmanager
+    def phase(self, name: str):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.phases[name] = (time.perf_counter() - start) * 1000.0
+
+    async def timed(self, name: str, awaitable: Awaitable[T]) -> T:
+        with self.phase(name):
+            return await awaitable
+
+    def mark(self, name: str) -> None:
+        self.phases.setdefault(name, self.elapsed_ms())
+
+    def get(self, name: str) -> Optional[float]:
+        return self.phases.get(name)
+
+    # Value for the Server-Timing response header
+    def server_timing(self) -> str:
+        return ", ".join(f"{name};dur={dur:.1f}" for name, dur in self.phases.items())
+
+    def summary(self) -> str:
+        return " ".join(f"{name}={dur:.1f}ms" for name, dur in self.phases.items())
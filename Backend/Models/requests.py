@@ -24,9 +24,11 @@ class MessageDTO(BaseModel):
     session_id: UUID
     role: str
     content: str
+    created_at: Optional[str] = None
 
 class MessagesResponse(BaseModel):
     messages: list[MessageDTO]
+    next_cursor: Optional[str] = None  # pass back as ?cursor= for the next page; null on the last one
 
 class SessionDTO(BaseModel):
     id: UUID
@@ -35,8 +37,16 @@ class SessionDTO(BaseModel):
     last_message_at: Optional[str] = None
     last_message_content: Optional[str] = None
 
+class SessionTombstoneDTO(BaseModel):
+    id: UUID
+    deleted_at: str
+
 class SessionsResponse(BaseModel):
     sessions: list[SessionDTO]
+    next_cursor: Optional[str] = None
+    deleted: list[SessionTombstoneDTO] = []
+    watermark: Optional[str] = None  # pass back as ?since= on the next refresh (keep the first page's when paging)
+    delta: bool = False  # True: upsert `sessions` and drop `deleted` from the cached list; False: replace it
 
 # Link models
 class CreateLinkInviteResponse(BaseModel):
@@ -1,248 +1,358 @@
 import json
+import math
+import hashlib
 import uuid
+import asyncio
 import traceback
-from typing import Optional
-from fastapi import APIRouter, Depends, HTTPException
+from datetime import datetime, timezone
+from contextlib import suppress
+from typing import List, Literal, Optional
+from fastapi import APIRouter, Depends, HTTPException, Header, Query, Request, Response
 from fastapi.responses import StreamingResponse
-from starlette.background import BackgroundTask
-from starlette.concurrency import iterate_in_threadpool
+import openai
 
 from ..auth import get_current_user
 from ..Agents.chat import ChatAgent
 from ..Agents.chat_title import ChatTitleAgent
+from ..Agents.chat_title_worker import ChatTitleWorker
+from ..Agents.openai_client import record_usage
+from ..Agents.conversation_summary import fold_turn, summary_from_rows
+from ..Agents.admission import admission, AdmissionRejected, is_rate_limited
+from ..Agents.partner_context import (
+    partner_letter_for,
+    render_partner_ab_context,
+    extract_partner_received,
+    partner_entries_since,
+    partner_entries_watermark,
+)
 from ..Database.chat_repo import (
-    save_message,
+    append_message,
     list_messages_for_session,
-    update_session_last_message,
-    count_user_messages,
-    get_recent_user_messages,
+    list_recent_messages_for_session,
 )
-from ..Database.link_repo import get_link_status_for_user, get_partner_user_id
+from ..Database.pagination import InvalidCursor, encode_cursor, decode_cursor
+from ..Database.link_repo import get_link_status_for_user
 from ..Database.linked_sessions_repo import get_linked_session_by_relationship_and_source_session
 from ..Database.session_repo import (
+    SessionSummary,
     create_session,
     list_sessions_for_user,
+    get_sessions_version,
+    list_session_changes_since,
     assert_session_owned_by_user,
+    get_session_context,
+    update_session_context,
     update_session_title,
     delete_session,
 )
-from ..Models.requests import ChatRequest, MessagesResponse, MessageDTO, SessionsResponse, SessionDTO
+from ..Models.requests import ChatRequest, MessagesResponse, MessageDTO, SessionsResponse, SessionDTO, SessionTombstoneDTO
+from ..Metrics.timing import PhaseTimer
+from ..Metrics.chat_metrics import record_chat_stream, partner_context_trimmed_tokens
+from ..Streaming.partner_message_parser import PartnerMessageParser, TokenEvent, PartnerMessageEvent
+from ..Streaming.sse_writer import SSEWriter
+from ..Streaming.stream_store import build_stream_store, tail_stream, StreamGone
+from ..Streaming.generations import GenerationRegistry
+from ..Streaming.checkpoint import AssistantCheckpointer
 
 router = APIRouter(prefix="/chat", tags=["chat"])
 
 chat_agent = ChatAgent()
 personal_agent = ChatTitleAgent()
+title_worker = ChatTitleWorker(personal_agent)
+stream_store = build_stream_store()
+generations = GenerationRegistry(store=stream_store)
+
+
+# Stored assistant message: {"_therai": {"type": "segments", ...}} plus partial/truncated flags when set
+def _assistant_annotation(segments: list, *, partial: bool = False, truncated: bool = False) -> Optional[str]:
+    if not segments:
+        return None
+    annotation_obj = {"_therai": {"type": "segments", "segments": segments}}
+    if partial:
+        annotation_obj["_therai"]["partial"] = True
+    if truncated:
+        annotation_obj["_therai"]["truncated"] = True
+    return json.dumps(annotation_obj, ensure_ascii=False)
+
+
+# Render parser events through the SSE writer (segment events are only tracked for persistence).
+# Token text is coalesced by the writer; returns b"" while it is still buffering.
+def _parser_events_to_sse(writer: SSEWriter, events) -> bytes:
+    out = []
+    for ev in events:
+        if isinstance(ev, TokenEvent):
+            out.append(writer.token(ev.text))
+        elif isinstance(ev, PartnerMessageEvent):
+            out.append(writer.event("tool_start", json.dumps({"name": "emit_partner_message"})))
+            out.append(writer.event("partner_message", json.dumps(ev.text)))
+            out.append(writer.event("tool_done"))
+    return b"".join(out)
+
+
+# Render the partner thread within the token budget, recording how much was trimmed
+def _budgeted_partner_context(entries, *, header: str = "Messages:") -> Optional[str]:
+    text, trimmed = render_partner_ab_context(entries, header=header)
+    partner_context_trimmed_tokens.observe(trimmed)
+    if trimmed:
+        print(f"[SSE] partner context trimmed tokens={trimmed}")
+    return text
+
+
+# Resolve this session's partner letter and the chronological A/B thread of delivered messages.
+# Returns (partner_entries, partner_letter, relationship_id); lookups that don't depend on each other run concurrently.
+async def _load_partner_context(*, user_uuid: uuid.UUID, session_uuid: uuid.UUID, timer: PhaseTimer) -> tuple[List[dict], str, Optional[str]]:
+    try:
+        linked, relationship_id, _ = await timer.timed(
+            "link_status", get_link_status_for_user(user_id=user_uuid)
+        )
+        if not linked or not relationship_id:
+            return [], "A", None
+
+        mapped = await timer.timed(
+            "linked_session",
+            get_linked_session_by_relationship_and_source_session(
+                relationship_id=relationship_id, source_session_id=session_uuid, with_partner_context=True
+            ),
+        )
+        partner_letter = partner_letter_for(mapped, user_uuid)
+        if not partner_letter:
+            return [], "A", relationship_id
+
+        # Materialized on the linked_sessions row by partner_router; no history scan needed
+        if mapped.partner_context is not None:
+            return list(mapped.partner_context), partner_letter, relationship_id
+
+        # Rows without a materialized context (migration not applied yet): rebuild from both histories.
+        # The linked_sessions row already names both partners; no separate partner lookup needed.
+        if partner_letter == "A":
+            partner_user_id, partner_session_id = mapped.user_b_id, mapped.user_b_personal_session_id
+        else:
+            partner_user_id, partner_session_id = mapped.user_a_id, mapped.user_a_personal_session_id
+        if not partner_session_id:
+            return [], partner_letter, relationship_id
+
+        with timer.phase("history"):
+            partner_messages, current_messages = await asyncio.gather(
+                list_messages_for_session(user_id=partner_user_id, session_id=partner_session_id, limit=500),
+                list_messages_for_session(user_id=user_uuid, session_id=session_uuid, limit=500),
+            )
 
+        sent_by_me = extract_partner_received(partner_messages, partner_letter)
+        sent_by_partner = extract_partner_received(current_messages, "B" if partner_letter == "A" else "A")
+        merged = sent_by_me + sent_by_partner
+        merged.sort(key=lambda x: x["created_at"])  # chronological
+        return merged, partner_letter, relationship_id
+    except Exception as e:
+        print(f"Context retrieval warning (stream): {e}")
+        return [], "A", None
 
-@router.post("/sessions/message/stream")
-async def chat_message_stream(request: ChatRequest, current_user: dict = Depends(get_current_user)):
+
+# Ownership check plus the session's stored conversation context ({} when the context columns are missing)
+async def _load_session_context(*, user_uuid: uuid.UUID, session_uuid: uuid.UUID) -> dict:
     try:
-        try:
-            user_uuid = uuid.UUID(current_user.get("sub"))
-        except Exception:
-            raise HTTPException(status_code=401, detail="Invalid user ID in token")
+        return await get_session_context(user_id=user_uuid, session_id=session_uuid)
+    except PermissionError:
+        raise
+    except Exception as e:
+        # Migration 003 not applied yet: keep the old ownership-only behaviour
+        print(f"[SSE] session context unavailable: {e}")
+        await assert_session_owned_by_user(user_id=user_uuid, session_id=session_uuid)
+        return {}
 
-        # Create or assert session ownership
-        if request.session_id is not None:
-            try:
-                await assert_session_owned_by_user(user_id=user_uuid, session_id=request.session_id)
-                session_uuid = request.session_id
-            except PermissionError:
-                raise HTTPException(status_code=403, detail="Forbidden: invalid session")
-        else:
-            session_row = await create_session(user_id=user_uuid, title=None)
-            session_uuid = uuid.UUID(session_row["id"])
 
-        # Persist user message
-        await save_message(user_id=user_uuid, session_id=session_uuid, role="user", content=request.message)
-        await update_session_last_message(session_id=session_uuid, content=request.message)
-        user_message_count = await count_user_messages(session_id=session_uuid)
+# One-time summary for sessions that predate server-side context, from their newest messages
+async def _backfill_summary(*, user_uuid: uuid.UUID, session_uuid: uuid.UUID) -> Optional[str]:
+    try:
+        rows = await list_recent_messages_for_session(user_id=user_uuid, session_id=session_uuid, limit=40)
+    except Exception as e:
+        print(f"[SSE] summary backfill failed: {e}")
+        return None
+    return summary_from_rows(rows)
+
+
+def _is_broken_chain(error: Exception) -> bool:
+    if isinstance(error, openai.NotFoundError):
+        return True
+    return isinstance(error, openai.BadRequestError) and "previous_response" in str(error)
+
+
+# After a turn: fold it into the rolling summary and remember the response to chain from, with the partner
+# thread watermark it has seen. A turn that didn't complete (stopped, failed) can't be chained from, so the
+# next one restarts from the summary.
+async def _save_session_context(*, session_uuid: uuid.UUID, summary: Optional[str], user_text: str, assistant_text: str, state: dict) -> None:
+    fields = {
+        "context_summary": fold_turn(summary, user_text=user_text, assistant_text=assistant_text),
+        "context_summary_updated_at": datetime.now(timezone.utc).isoformat(),
+        "last_response_id": None,
+        "last_response_tokens": None,
+        "last_response_partner_context_at": None,
+    }
+    if state.get("completed") and state.get("response_id") and not state.get("truncated"):
+        fields["last_response_id"] = state["response_id"]
+        fields["last_response_tokens"] = int(state.get("input_tokens") or 0) + int(state.get("output_tokens") or 0)
+        fields["last_response_partner_context_at"] = state.get("partner_context_at")
+    try:
+        await update_session_context(session_id=session_uuid, fields=fields)
+    except Exception as e:
+        print(f"[SSE] session context update failed: {e}")
 
-        # Title generation on first two messages
-        if user_message_count in (1, 2):
-            try:
-                recent_user_messages = await get_recent_user_messages(session_id=session_uuid, limit=2)
-                chat_title = personal_agent.generate_chat_title(recent_user_messages)
-                if chat_title:
-                    await update_session_title(user_id=user_uuid, session_id=session_uuid, title=chat_title)
-            except Exception:
-                pass
 
-        # Build A/B delivered messages context (no separate PARTNER context)
-        partner_ab_context_text: Optional[str] = None
-        linked_session = None
-        try:
-            linked, relationship_id, _ = await get_link_status_for_user(user_id=user_uuid)
-            if linked and relationship_id:
-                linked_session = await get_linked_session_by_relationship_and_source_session(
-                    relationship_id=relationship_id, source_session_id=session_uuid
-                )
-                mapped = await get_linked_session_by_relationship_and_source_session(
-                    relationship_id=relationship_id, source_session_id=session_uuid
-                )
-                linked_session = mapped if mapped else linked_session
-                partner_session_id_str = None
-                if mapped:
-                    cur_id = str(user_uuid)
-                    if mapped.get("user_a_id") == cur_id:
-                        partner_session_id_str = mapped.get("user_b_personal_session_id")
-                    elif mapped.get("user_b_id") == cur_id:
-                        partner_session_id_str = mapped.get("user_a_personal_session_id")
-                if partner_session_id_str:
-                    partner_user_id = await get_partner_user_id(user_id=user_uuid)
-                    if partner_user_id:
-                        partner_messages = await list_messages_for_session(
-                            user_id=partner_user_id,
-                            session_id=uuid.UUID(partner_session_id_str),
-                            limit=500,
-                        )
-
-                        # Build chronological A/B thread from delivered messages
-                        try:
-                            current_messages = await list_messages_for_session(
-                                user_id=user_uuid,
-                                session_id=session_uuid,
-                                limit=500,
-                            )
-
-                            def _extract_partner_received(rows, sender_label):
-                                items = []
-                                for r in rows or []:
-                                    try:
-                                        if r.get("role") != "assistant":
-                                            continue
-                                        raw = r.get("content") or ""
-                                        obj = json.loads(raw)
-                                        meta = (obj or {}).get("_therai") if isinstance(obj, dict) else None
-                                        if not meta or meta.get("type") != "partner_received":
-                                            continue
-                                        text = meta.get("text") or ""
-                                        created = r.get("created_at")
-                                        if created is None:
-                                            continue
-                                        items.append({"created_at": created, "sender": sender_label, "text": text})
-                                    except Exception:
-                                        continue
-                                return items
-
-                            if mapped:
-                                cur_id = str(user_uuid)
-                                if mapped.get("user_a_id") == cur_id:
-                                    me_label = "Partner A"
-                                    partner_label = "Partner B"
-                                else:
-                                    me_label = "Partner B"
-                                    partner_label = "Partner A"
-                            else:
-                                me_label = "Partner A"
-                                partner_label = "Partner B"
-
-                            sent_by_me = _extract_partner_received(partner_messages, me_label)
-                            sent_by_partner = _extract_partner_received(current_messages, partner_label)
-                            merged = sent_by_me + sent_by_partner
-                            merged.sort(key=lambda x: x["created_at"])  # chronological
-
-                            if merged:
-                                lines = ["Messages:"]
-                                for m in merged:
-                                    try:
-                                        text = (m.get("text") or "").strip()
-                                        if text:
-                                            lines.append(f"{m['sender']}: {text}")
-                                    except Exception:
-                                        continue
-                                partner_ab_context_text = "\n".join(lines)
-                        except Exception:
-                            partner_ab_context_text = None
-        except Exception as e:
-            print(f"Context retrieval warning (stream): {e}")
-
-        # Determine partner letter for this session
-        try:
-            partner_letter = "A"
-            if linked_session:
-                cur_id = str(user_uuid)
-                if linked_session.get("user_a_id") == cur_id:
-                    partner_letter = "A"
-                elif linked_session.get("user_b_id") == cur_id:
-                    partner_letter = "B"
-        except Exception:
-            partner_letter = "A"
+# Tail a stream for one HTTP client; while attached it keeps the generation alive, here or on the
+# machine running it (see GenerationRegistry)
+async def _follow_stream(stream_id: str, last_id: int, http_request: Request):
+    generations.attach(stream_id)
+    try:
+        async with stream_store.follow(stream_id):
+            async for chunk in tail_stream(stream_store, stream_id, last_id=last_id, is_disconnected=http_request.is_disconnected):
+                yield chunk
+    finally:
+        generations.detach(stream_id)
 
-        state = {"final_text": "", "partner_texts": [], "segments": []}
 
-        async def persist_stream_results():
-            try:
-                final_text = (state.get("final_text") or "").strip()
-                partner_texts = state.get("partner_texts") or []
-                segments = state.get("segments") or []
-                if segments:
-                    try:
-                        annotation_obj = {"_therai": {"type": "segments", "segments": segments}}
-                        annotation = json.dumps(annotation_obj, ensure_ascii=False)
-                        await save_message(user_id=user_uuid, session_id=session_uuid, role="assistant", content=annotation)
-                        return
-                    except Exception:
-                        pass
-                # Fallback: persist plain text as a single text segment
-                if final_text:
-                    try:
-                        annotation_obj = {"_therai": {"type": "segments", "segments": [{"type": "text", "content": final_text}]}}
-                        annotation = json.dumps(annotation_obj, ensure_ascii=False)
-                        await save_message(user_id=user_uuid, session_id=session_uuid, role="assistant", content=annotation)
-                    except Exception:
-                        pass
-            except Exception as e:
-                print(f"[SSE] persist task fatal: {e}")
+@router.post("/sessions/message/stream")
+async def chat_message_stream(request: ChatRequest, http_request: Request, current_user: dict = Depends(get_current_user)):
+    admitted = handed_off = False
 
-        def iter_sse():
-            # Anti-buffering prelude
-            yield (":" + " " * 2048 + "\n\n").encode()
+    # Idempotent: the upstream stream starting, generate() ending and an early failure all release the slot
+    def release_slot() -> None:
+        nonlocal admitted
+        if admitted:
+            admitted = False
+            admission.release()
+
+    try:
+        try:
+            user_uuid = uuid.UUID(current_user.get("sub"))
+        except Exception:
+            raise HTTPException(status_code=401, detail="Invalid user ID in token")
 
-            sess_payload = json.dumps({"session_id": str(session_uuid)})
-            yield f"event: session\ndata: {sess_payload}\n\n".encode()
+        timer = PhaseTimer()
 
-            full_text_parts = []
-            segments_list = []
-            current_text_segment = ""
+        # Admission first: a rejected turn must not leave a saved user message (or new session) behind.
+        # The slot is held until the model starts answering (response.created / first delta), not for the whole stream.
+        with timer.phase("admission"):
             try:
-                input_messages = chat_agent.build_messages(
-                    session_partner_letter = partner_letter,
-                    last_user_message = request.message,
-                    partner_ab_context_text = partner_ab_context_text,
+                await admission.acquire(user_id=str(user_uuid))
+            except AdmissionRejected as e:
+                raise HTTPException(
+                    status_code=429,
+                    detail=f"Too many requests ({e.reason}); try again shortly",
+                    headers={"Retry-After": str(max(1, math.ceil(e.retry_after)))},
                 )
+            admitted = True
 
-                print(f"[SSE] /chat stream start (Responses API) model={chat_agent.model}")
-                print(f"[SSE] Number of messages: {len(input_messages)}")
+        # Setup graph: ownership check ‖ partner context (link status → linked session → both histories).
+        # Nothing the prompt needs waits on a write; the user-message writes are deferred below.
+        with timer.phase("setup"):
+            if request.session_id is not None:
+                session_uuid = request.session_id
+                ownership_task = asyncio.create_task(
+                    timer.timed("ownership", _load_session_context(user_uuid=user_uuid, session_uuid=session_uuid))
+                )
+            else:
+                session_row = await timer.timed("create_session", create_session(user_id=user_uuid, title=None))
+                session_uuid = uuid.UUID(session_row["id"])
+                ownership_task = None
 
-                import re, time, threading
-                from queue import Queue, Empty
-                open_pat = re.compile(r"<partner_message(?:\s+[^>]*)?>")
-                end_marker = "</partner_message>"
-                tag_start = "<partner_message"
+            context_task = asyncio.create_task(
+                timer.timed("context", _load_partner_context(user_uuid=user_uuid, session_uuid=session_uuid, timer=timer))
+            )
+            session_ctx: dict = {}
+            if ownership_task is not None:
+                try:
+                    session_ctx = await ownership_task
+                except PermissionError:
+                    context_task.cancel()
+                    raise HTTPException(status_code=403, detail="Forbidden: invalid session")
+                except BaseException:
+                    context_task.cancel()
+                    raise
+            partner_entries, partner_letter, relationship_id = await context_task
+
+            # Conversation memory: chain from the last response while that context stays within budget,
+            # otherwise start a fresh chain from the session's rolling summary
+            chain_id = request.previous_response_id
+            partner_watermark = None
+            if not chain_id and (session_ctx.get("last_response_tokens") or 0) <= chat_agent.chain_token_budget:
+                chain_id = session_ctx.get("last_response_id")
+                partner_watermark = session_ctx.get("last_response_partner_context_at") if chain_id else None
+            summary = session_ctx.get("context_summary")
+            if summary is None and ownership_task is not None:
+                summary = await timer.timed("summary_backfill", _backfill_summary(user_uuid=user_uuid, session_uuid=session_uuid))
+
+        # The response will have seen the partner thread up to its newest entry, whether sent now or earlier in the chain
+        state = {"final_text": "", "partner_texts": [], "segments": [],
+                 "partner_context_at": partner_entries_watermark(partner_entries) or partner_watermark}
+        turn = {"previous_response_id": chain_id}
+        q: asyncio.Queue = asyncio.Queue()
+
+        # Writes that don't feed the prompt run alongside the stream instead of ahead of it.
+        # A failed user-message write stops the generation (see generate()); its reply is never stored.
+        async def persist_user_message():
+            with timer.phase("persist_user"):
+                try:
+                    appended = await append_message(user_id=user_uuid, session_id=session_uuid, role="user", content=request.message)
+                except Exception as e:
+                    print(f"[SSE] user message write failed session={session_uuid}: {e}")
+                    q.put_nowait(("user_write_failed", str(e)))
+                    raise
+                user_message_count = appended["counts"]["user_message_count"]
+
+            # Title generation is debounced and runs on the title worker; never awaited here
+            title_worker.notify_user_message(user_id=user_uuid, session_id=session_uuid, user_message_count=user_message_count)
+
+        user_write_task = asyncio.create_task(persist_user_message())
+
+        # A chain has already seen the partner thread up to its watermark: chained turns send only newer entries
+        def build_input(chained: bool) -> list:
+            if chained:
+                partner_ab_context_text = _budgeted_partner_context(
+                    partner_entries_since(partner_entries, partner_watermark), header="New partner messages:"
+                )
+            else:
+                partner_ab_context_text = _budgeted_partner_context(partner_entries)
+            return chat_agent.build_messages(
+                session_partner_letter = partner_letter,
+                last_user_message = request.message,
+                partner_ab_context_text = partner_ab_context_text,
+                chained = chained,
+                conversation_summary = summary,
+            )
 
-                buffer = ""
-                in_partner = False
+        turn["messages"] = input_messages = build_input(bool(chain_id))
+        prompt_cache_key = chat_agent.prompt_cache_key_for(relationship_id)
 
-                from contextlib import suppress
+        print(f"[SSE] /chat stream start (Responses API) model={chat_agent.model}")
+        print(f"[SSE] Number of messages: {len(input_messages)} chained={bool(chain_id)}")
 
-                q: Queue = Queue()
-                done = {"flag": False}
+        # Resumable stream: every event gets an id and lands in the store's ring buffer
+        stream_id = str(uuid.uuid4())
+        await stream_store.open(stream_id, user_id=str(user_uuid), session_id=str(session_uuid))
 
-                def producer():
+        async def producer():
+            timer.mark("openai_request_at")
+            try:
+                for attempt in range(2):
+                    received = False
                     try:
-                        with chat_agent.stream_response(
-                            messages = input_messages,
-                            previous_response_id = request.previous_response_id,
+                        async with chat_agent.stream_response(
+                            messages = turn["messages"],
+                            previous_response_id = turn["previous_response_id"],
+                            prompt_cache_key = prompt_cache_key,
                         ) as stream:
-                            for event in stream:
+                            async for event in stream:
+                                received = True
                                 etype = getattr(event, "type", "")
                                 if etype == "response.created":
+                                    timer.mark("openai_created_at")
+                                    release_slot()
                                     rid = None
                                     with suppress(Exception):
                                         rid = getattr(getattr(event, "response", None), "id", None)
                                     if rid:
-                                        q.put(("response_id", json.dumps({"response_id": rid})))
+                                        state["response_id"] = rid
+                                        generations.alias(rid, stream_id)
+                                        q.put_nowait(("response_id", json.dumps({"response_id": rid})))
                                     continue
                                 if etype == "response.output_text.delta":
                                     delta = getattr(event, "delta", "") or ""
@@ -250,7 +360,8 @@ async def chat_message_stream(request: ChatRequest, current_user: dict = Depends
                                         with suppress(Exception):
                                             delta = str(delta)
                                     if delta:
-                                        q.put(("delta", delta))
+                                        release_slot()
+                                        q.put_nowait(("delta", delta))
                                     continue
                                 if etype == "response.error":
                                     err_msg = "Streaming error"
@@ -258,64 +369,157 @@ async def chat_message_stream(request: ChatRequest, current_user: dict = Depends
                                         err_obj = getattr(event, "error", None)
                                         if err_obj is not None:
                                             err_msg = str(err_obj)
-                                    q.put(("error", err_msg))
+                                    q.put_nowait(("error", err_msg))
                                     return
                                 if etype == "response.completed":
+                                    state["completed"] = True
+                                    with suppress(Exception):
+                                        usage = event.response.usage
+                                        state["output_tokens"] = int(usage.output_tokens)
+                                        state["input_tokens"], state["cached_input_tokens"] = record_usage(usage, agent="chat")
                                     break
-                    finally:
-                        done["flag"] = True
+                        return
+                    except Exception as e:
+                        if attempt == 0 and not received and turn["previous_response_id"] and _is_broken_chain(e):
+                            # Stored response expired or unknown: restart the chain from the session summary
+                            print(f"[SSE] previous_response_id unusable ({e}); continuing from session summary")
+                            turn["previous_response_id"] = None
+                            turn["messages"] = build_input(False)
+                            continue
+                        raise
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                # Still rate limited after backoff: a non-streaming retry would only add load
+                q.put_nowait(("rate_limited" if is_rate_limited(e) else "error", str(e)))
+            finally:
+                q.put_nowait(("completed", None))
+
+        # Start the model as soon as its inputs exist, before the response object is even returned
+        producer_task = asyncio.create_task(producer())
+
+        parser = PartnerMessageParser()
 
-                t = threading.Thread(target=producer, daemon=True)
-                t.start()
+        # Keep message order: the user row must land before the assistant row (raises if it never did)
+        async def wait_user_message():
+            await user_write_task
 
-                heartbeat_interval = 0.1
+        async def user_message_saved() -> bool:
+            try:
+                await user_write_task
+                return True
+            except Exception:
+                return False
+
+        # The assistant row is upserted while the stream runs (marked partial) and finalized at the end,
+        # so a crash mid-stream leaves the reply up to the last checkpoint instead of nothing
+        checkpointer = AssistantCheckpointer(
+            user_id=user_uuid,
+            session_id=session_uuid,
+            snapshot=lambda: _assistant_annotation(parser.snapshot(), partial=True),
+            before_first_write=wait_user_message,
+        )
 
+        async def persist_stream_results():
+            try:
+                if not await user_message_saved():
+                    # No question stored: keep the reply (and the turn's context) out of the session too
+                    await checkpointer.finish(None)
+                    return
+                segments = state.get("segments") or []
+                final_text = (state.get("final_text") or "").strip()
+                if not segments and final_text:
+                    # Fallback: persist plain text as a single text segment
+                    segments = [{"type": "text", "content": final_text}]
+                with timer.phase("persist_assistant"):
+                    await checkpointer.finish(_assistant_annotation(segments, truncated=bool(state.get("truncated"))))
+                await _save_session_context(
+                    session_uuid=session_uuid,
+                    summary=summary,
+                    user_text=request.message,
+                    assistant_text=state.get("final_text") or "",
+                    state=state,
+                )
+            except Exception as e:
+                print(f"[SSE] persist task fatal: {e}")
+            finally:
+                record_chat_stream(timer, output_tokens=state.get("output_tokens"))
+                print(f"[SSE] /chat timings session={session_uuid} {timer.summary()} checkpoints={checkpointer.checkpoints} "
+                      f"input_tokens={state.get('input_tokens', 0)} cached_input_tokens={state.get('cached_input_tokens', 0)}")
+
+        # Generation runs decoupled from the HTTP response: every frame goes to the stream store,
+        # and this response (or a reconnect with Last-Event-ID) tails it from there
+        async def generate():
+            writer = SSEWriter(ids=True)
+
+            async def emit(chunk: bytes) -> None:
+                if chunk:
+                    await stream_store.append(stream_id, chunk)
+
+            await emit(writer.event("session", json.dumps({
+                "session_id": str(session_uuid),
+                "stream_id": stream_id,
+                "message_id": str(checkpointer.message_id),
+            })))
+
+            get_task = None
+            try:
                 while True:
-                    try:
-                        kind, payload = q.get(timeout=heartbeat_interval)
-                    except Empty:
-                        if done["flag"] and q.empty():
-                            break
-                        # On heartbeat, flush any safe plain text to reduce tail lag
-                        if not in_partner and buffer:
-                            # Compute longest overlap of buffer suffix with tag_start prefix
-                            max_k = min(len(buffer), len(tag_start))
-                            overlap = 0
-                            for k in range(max_k, -1, -1):
-                                if buffer.endswith(tag_start[:k]):
-                                    overlap = k
-                                    break
-                            flush_len = len(buffer) - overlap
-                            if flush_len > 0:
-                                flushable = buffer[:flush_len]
-                                full_text_parts.append(flushable)
-                                yield f"event: token\ndata: {json.dumps(flushable)}\n\n".encode()
-                                current_text_segment += flushable
-                                buffer = buffer[flush_len:]
-                        # Heartbeat to avoid intermediary buffering
-                        yield b":\n\n"
+                    # Keep one pending get across timeouts so a racing timeout never drops an item
+                    if get_task is None:
+                        get_task = asyncio.ensure_future(q.get())
+                    ready, _ = await asyncio.wait({get_task}, timeout=writer.wait_timeout())
+                    if ready:
+                        kind, payload = get_task.result()
+                        get_task = None
+                    else:
+                        # Token latency budget reached (flush) or idle long enough for a keepalive
+                        await emit(writer.on_timeout())
                         continue
 
                     if kind == "response_id":
-                        yield f"event: response_id\ndata: {payload}\n\n".encode()
+                        await emit(writer.event("response_id", payload))
                         continue
 
                     if kind == "completed":
                         # Producer signaled completion; exit loop promptly
                         break
 
+                    if kind == "stopped":
+                        # Stop endpoint or no client left: upstream is already being closed, keep what we have
+                        state["truncated"] = True
+                        state["stop_reason"] = payload
+                        break
+
+                    if kind == "user_write_failed":
+                        # Reported below, after the loop; leaving it stops reading from OpenAI
+                        break
+
+                    if kind == "rate_limited":
+                        print(f"[SSE] OpenAI rate limited: {payload}")
+                        await emit(writer.event("error", json.dumps("rate_limited")))
+                        break
+
                     if kind == "error":
                         err_msg = payload
                         print(f"[SSE] OpenAI streaming error: {err_msg}")
                         try:
-                            resp_fallback = chat_agent.create_response(
-                                messages = input_messages,
-                                previous_response_id = request.previous_response_id,
-                            )
+                            # A fresh upstream call: queue for a slot like any other
+                            release_slot()
+                            async with admission.slot():
+                                resp_fallback = await chat_agent.create_response(
+                                    messages = turn["messages"],
+                                    previous_response_id = turn["previous_response_id"],
+                                    prompt_cache_key = prompt_cache_key,
+                                )
                             with suppress(Exception):
                                 rid_fb = getattr(resp_fallback, "id", None)
                                 if rid_fb:
-                                    yield f"event: response_id\ndata: {json.dumps({'response_id': rid_fb})}\n\n".encode()
+                                    state["response_id"] = rid_fb
+                                    state["completed"] = True
+                                    state["input_tokens"] = int(resp_fallback.usage.input_tokens)
+                                    state["output_tokens"] = int(resp_fallback.usage.output_tokens)
+                                    await emit(writer.event("response_id", json.dumps({"response_id": rid_fb})))
                             text_fb = getattr(resp_fallback, "output_text", None)
                             if not text_fb:
                                 parts_fb = []
@@ -323,128 +527,60 @@ async def chat_message_stream(request: ChatRequest, current_user: dict = Depends
                                     if getattr(block, "type", None) == "output_text" and getattr(block, "text", None):
                                         parts_fb.append(block.text)
                                 text_fb = "".join(parts_fb)
-                            text_fb = (text_fb or "")
-
-                            pos_fb = 0
-                            while True:
-                                m_fb = open_pat.search(text_fb, pos_fb)
-                                if not m_fb:
-                                    remaining_fb = text_fb[pos_fb:]
-                                    if remaining_fb:
-                                        full_text_parts.append(remaining_fb)
-                                        yield f"event: token\ndata: {json.dumps(remaining_fb)}\n\n".encode()
-                                        current_text_segment += remaining_fb
-                                    break
-                                before_fb = text_fb[pos_fb:m_fb.start()]
-                                if before_fb:
-                                    full_text_parts.append(before_fb)
-                                    yield f"event: token\ndata: {json.dumps(before_fb)}\n\n".encode()
-                                    current_text_segment += before_fb
-                                close_idx_fb = text_fb.find(end_marker, m_fb.end())
-                                if close_idx_fb == -1:
-                                    remainder_fb = text_fb[m_fb.start():]
-                                    if remainder_fb:
-                                        full_text_parts.append(remainder_fb)
-                                        yield f"event: token\ndata: {json.dumps(remainder_fb)}\n\n".encode()
-                                        current_text_segment += remainder_fb
-                                    break
-                                content_fb = text_fb[m_fb.end():close_idx_fb]
-                                yield f"event: tool_start\ndata: {json.dumps({'name': 'emit_partner_message'})}\n\n".encode()
-                                yield f"event: partner_message\ndata: {json.dumps(content_fb)}\n\n".encode()
-                                yield b"event: tool_done\ndata: {}\n\n"
-
-                                if current_text_segment:
-                                    segments_list.append({"type": "text", "content": current_text_segment})
-                                    current_text_segment = ""
-                                segments_list.append({"type": "partner_draft", "text": content_fb})
-
-                                pos_fb = close_idx_fb + len(end_marker)
+                            await emit(_parser_events_to_sse(writer, parser.feed(text_fb or "")))
 
                         except Exception as fe:
                             print(f"[SSE] Fallback non-streaming failed: {fe}")
-                            yield f"event: error\ndata: {json.dumps(err_msg)}\n\n".encode()
+                            await emit(writer.event("error", json.dumps(err_msg)))
                             break
                         continue
 
                     if kind == "delta":
-                        delta = payload
-                        buffer += delta
-
-                        # Process buffer for partner tags and plain text
-                        while True:
-                            if not in_partner:
-                                m = open_pat.search(buffer)
-                                if m:
-                                    before = buffer[:m.start()]
-                                    if before:
-                                        full_text_parts.append(before)
-                                        yield f"event: token\ndata: {json.dumps(before)}\n\n".encode()
-                                        current_text_segment += before
-                                    buffer = buffer[m.end():]
-                                    in_partner = True
-                                    continue
-                                # No open tag; flush all except any suffix that matches the start of a tag
-                                if buffer:
-                                    max_k = min(len(buffer), len(tag_start))
-                                    overlap = 0
-                                    for k in range(max_k, -1, -1):
-                                        if buffer.endswith(tag_start[:k]):
-                                            overlap = k
-                                            break
-                                    flush_len = len(buffer) - overlap
-                                    if flush_len > 0:
-                                        flushable = buffer[:flush_len]
-                                        full_text_parts.append(flushable)
-                                        yield f"event: token\ndata: {json.dumps(flushable)}\n\n".encode()
-                                        current_text_segment += flushable
-                                        buffer = buffer[flush_len:]
-                                break
-                            else:
-                                close_idx = buffer.find(end_marker)
-                                if close_idx == -1:
-                                    # still inside partner block, wait for more data
-                                    break
-                                content = buffer[:close_idx]
-                                yield f"event: tool_start\ndata: {json.dumps({'name': 'emit_partner_message'})}\n\n".encode()
-                                yield f"event: partner_message\ndata: {json.dumps(content)}\n\n".encode()
-                                yield b"event: tool_done\ndata: {}\n\n"
-
-                                if current_text_segment:
-                                    segments_list.append({"type": "text", "content": current_text_segment})
-                                    current_text_segment = ""
-                                segments_list.append({"type": "partner_draft", "text": content})
-
-                                buffer = buffer[close_idx + len(end_marker):]
-                                in_partner = False
-                                continue
-
-                # Flush any pending buffered text (including partial tags) before finalizing
-                if buffer:
-                    # If we're mid-partner block and never saw a close tag, treat remainder as plain text
-                    full_text_parts.append(buffer)
-                    yield f"event: token\ndata: {json.dumps(buffer)}\n\n".encode()
-                    current_text_segment += buffer
-                    buffer = ""
-
-                # Flush any trailing text segment captured during streaming
-                if current_text_segment:
-                    segments_list.append({"type": "text", "content": current_text_segment})
-                    current_text_segment = ""
-
-                final_text = "".join(full_text_parts)
-                state["final_text"] = final_text or ""
-                if segments_list:
-                    state["segments"] = segments_list
-
-                yield b"event: done\ndata: {}\n\n"
+                        timer.mark("first_token_at")
+                        await emit(_parser_events_to_sse(writer, parser.feed(payload)))
+                        checkpointer.mark()
+
+                # Flush any held-back text (partial tags, unterminated partner block) before finalizing
+                tail = _parser_events_to_sse(writer, parser.close())
+
+                state["final_text"] = parser.text
+                if parser.segments:
+                    state["segments"] = parser.segments
+
+                if not await user_message_saved():
+                    await emit(tail + writer.event("error", json.dumps("user_message_not_saved")))
+                    return
+                done_payload = {"truncated": True, "reason": state["stop_reason"]} if state.get("truncated") else {}
+                await emit(tail + writer.event("done", json.dumps(done_payload)))
             except Exception as e:
                 print(f"[SSE] /chat stream error: {e}\n" + traceback.format_exc())
-                yield f"event: error\ndata: {json.dumps(str(e))}\n\n".encode()
+                await emit(writer.event("error", json.dumps(str(e))))
             finally:
-                pass
+                timer.mark("stream_done_at")
+                if get_task is not None:
+                    get_task.cancel()
+                # Finished early (error): stop reading from OpenAI
+                if not producer_task.done():
+                    producer_task.cancel()
+                    with suppress(asyncio.CancelledError, Exception):
+                        await producer_task
+                release_slot()
+                await stream_store.close(stream_id)
+                await persist_stream_results()
+                generations.record_output(
+                    state.get("output_tokens") or len(parser.text) // 4, truncated=bool(state.get("truncated"))
+                )
+
+        # Stop endpoint / disconnect: close the upstream OpenAI stream now and let generate() finalize
+        def stop_generation(reason: str) -> None:
+            q.put_nowait(("stopped", reason))
+            producer_task.cancel()
+
+        generations.start(stream_id, generate(), user_id=str(user_uuid), on_stop=stop_generation)
+        handed_off = True
 
         return StreamingResponse(
-            iterate_in_threadpool(iter_sse()),
+            _follow_stream(stream_id, 0, http_request),
             media_type="text/event-stream",
             headers={
                 "Cache-Control": "no-cache, no-transform",
@@ -452,61 +588,235 @@ async def chat_message_stream(request: ChatRequest, current_user: dict = Depends
                 "X-Accel-Buffering": "no",
                 "Content-Encoding": "identity",
                 "Content-Type": "text/event-stream; charset=utf-8",
+                "Server-Timing": timer.server_timing(),
             },
-            background=BackgroundTask(persist_stream_results),
         )
     except HTTPException:
         raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error processing stream: {str(e)}")
+    finally:
+        if not handed_off:
+            release_slot()
+
+
+# Reconnect to a stream: replay the events after Last-Event-ID, then keep following the live generation
+@router.get("/streams/{stream_id}/events")
+async def resume_chat_stream(
+    stream_id: uuid.UUID,
+    http_request: Request,
+    last_event_id_header: Optional[str] = Header(default=None, alias="Last-Event-ID"),
+    last_event_id: Optional[int] = Query(default=None),
+    current_user: dict = Depends(get_current_user),
+):
+    try:
+        user_uuid = uuid.UUID(current_user.get("sub"))
+    except Exception:
+        raise HTTPException(status_code=401, detail="Invalid user ID in token")
 
+    try:
+        after_id = int(last_event_id_header) if last_event_id_header else (last_event_id or 0)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid Last-Event-ID")
+
+    meta = await stream_store.get_meta(str(stream_id))
+    if meta is None or meta.user_id != str(user_uuid):
+        raise HTTPException(status_code=404, detail="Stream not found")
+    try:
+        await stream_store.read_after(str(stream_id), after_id)
+    except StreamGone:
+        # Events were evicted: the client must reload the session messages instead
+        raise HTTPException(status_code=410, detail="Stream events no longer available")
+
+    return StreamingResponse(
+        _follow_stream(str(stream_id), after_id, http_request),
+        media_type="text/event-stream",
+        headers={
+            "Cache-Control": "no-cache, no-transform",
+            "Connection": "keep-alive",
+            "X-Accel-Buffering": "no",
+            "Content-Encoding": "identity",
+            "Content-Type": "text/event-stream; charset=utf-8",
+        },
+    )
 
+
+# Stop generating: cancel an in-flight response by stream id (or OpenAI response id); partial output is kept
+@router.post("/streams/{stream_id}/stop")
+async def stop_chat_stream(stream_id: str, current_user: dict = Depends(get_current_user)):
+    user_id = current_user.get("sub")
+    if not user_id:
+        raise HTTPException(status_code=401, detail="Invalid user ID in token")
+
+    running_id = generations.resolve(stream_id)
+    if running_id is not None:
+        if generations.owner(running_id) != user_id:
+            raise HTTPException(status_code=404, detail="Stream not found")
+        return {"success": True, "stopped": generations.stop(running_id, reason="stop")}
+
+    # Not running here: already finished, or generating on another machine (which picks the request up from the store)
+    meta = await stream_store.get_meta(stream_id)
+    if meta is None or meta.user_id != user_id:
+        raise HTTPException(status_code=404, detail="Stream not found")
+    if meta.done:
+        return {"success": True, "stopped": False}
+    return {"success": True, "stopped": await stream_store.request_stop(stream_id, reason="stop")}
+
+
+# Keyset paging: a page is `limit` rows after the cursor's (created_at, id); "newest" (the default) walks back
+# from the latest message, "oldest" forward from the first. Each page is returned in chronological order.
 @router.get("/sessions/{session_id}/messages", response_model=MessagesResponse)
-async def get_messages(session_id: uuid.UUID, current_user: dict = Depends(get_current_user)):
+async def get_messages(
+    session_id: uuid.UUID,
+    limit: int = Query(default=200, ge=1, le=500),
+    cursor: Optional[str] = Query(default=None),
+    order: Literal["newest", "oldest"] = Query(default="newest"),
+    current_user: dict = Depends(get_current_user),
+):
     try:
         user_uuid = uuid.UUID(current_user.get("sub"))
     except Exception:
         raise HTTPException(status_code=401, detail="Invalid user ID in token")
 
+    newest_first = order == "newest"
+    after = None
+    if cursor:
+        try:
+            after, newest_first = decode_cursor(cursor, kind="messages", size=2)
+        except InvalidCursor:
+            raise HTTPException(status_code=400, detail="Invalid cursor")
+
     try:
         await assert_session_owned_by_user(user_id=user_uuid, session_id=session_id)
     except PermissionError:
         raise HTTPException(status_code=403, detail="Forbidden: invalid session")
 
-    rows = await list_messages_for_session(user_id=user_uuid, session_id=session_id, limit=200, offset=0)
+    rows = await list_messages_for_session(
+        user_id=user_uuid,
+        session_id=session_id,
+        limit=limit + 1,
+        newest_first=newest_first,
+        after=after,
+    )
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        last = rows[-1]
+        next_cursor = encode_cursor("messages", (last.created_at, str(last.id)), newest_first=newest_first)
+    if newest_first:
+        rows.reverse()
     return MessagesResponse(
         messages=[
             MessageDTO(
-                id=uuid.UUID(r["id"]),
-                user_id=uuid.UUID(r["user_id"]),
-                session_id=uuid.UUID(r["session_id"]),
-                role=r["role"],
-                content=r["content"],
+                id=r.id,
+                user_id=user_uuid,
+                session_id=session_id,
+                role=r.role,
+                content=r.content,
+                created_at=r.created_at,
             )
             for r in rows
-        ]
+        ],
+        next_cursor=next_cursor,
     )
 
 
+# Weak ETag of one sessions listing: the list version plus everything that selects the page
+def _sessions_etag(*, user_id: uuid.UUID, version: Optional[str], limit: int, cursor: Optional[str], since: Optional[str]) -> str:
+    digest = hashlib.sha1(f"{user_id}|{version}|{limit}|{cursor}|{since}".encode()).hexdigest()[:32]
+    return f'W/"{digest}"'
+
+
+def _etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    if not if_none_match:
+        return False
+    tags = [t.strip() for t in if_none_match.split(",")]
+    return "*" in tags or etag.removeprefix("W/") in (t.removeprefix("W/") for t in tags)
+
+
+def _session_dto(r: SessionSummary, user_uuid: uuid.UUID) -> SessionDTO:
+    return SessionDTO(
+        id=r.id,
+        user_id=user_uuid,
+        title=r.title,
+        last_message_at=r.last_message_at,
+        last_message_content=r.last_message_content,
+    )
+
+
+# Full listing (keyset pages via `cursor`) or, with `since` (the `watermark` of an earlier response), only the
+# sessions created, updated or deleted after it. A delta too old or too large to serve falls back to the first
+# page of the full listing (delta=false). Answers 304 when If-None-Match still matches the list's version.
 @router.get("/sessions", response_model=SessionsResponse)
-async def get_sessions(current_user: dict = Depends(get_current_user)):
+async def get_sessions(
+    response: Response,
+    limit: int = Query(default=100, ge=1, le=200),
+    cursor: Optional[str] = Query(default=None),
+    since: Optional[str] = Query(default=None),
+    if_none_match: Optional[str] = Header(default=None, alias="If-None-Match"),
+    current_user: dict = Depends(get_current_user),
+):
     try:
         user_uuid = uuid.UUID(current_user.get("sub"))
     except Exception:
         raise HTTPException(status_code=401, detail="Invalid user ID in token")
 
-    rows = await list_sessions_for_user(user_id=user_uuid, limit=100, offset=0)
+    if cursor and since:
+        raise HTTPException(status_code=400, detail="cursor and since can't be combined")
+    after = None
+    if cursor:
+        try:
+            after, _ = decode_cursor(cursor, kind="sessions", size=3)
+        except InvalidCursor:
+            raise HTTPException(status_code=400, detail="Invalid cursor")
+    since_at = None
+    if since:
+        try:
+            since_at = datetime.fromisoformat(since)
+        except ValueError:
+            raise HTTPException(status_code=400, detail="Invalid since watermark")
+        if since_at.tzinfo is None:
+            since_at = since_at.replace(tzinfo=timezone.utc)
+
+    async def load_page():
+        changes = None
+        if since_at is not None:
+            changes = await list_session_changes_since(user_id=user_uuid, since=since_at, limit=limit)
+        rows = await list_sessions_for_user(user_id=user_uuid, limit=limit + 1, after=after) if changes is None else None
+        return changes, rows
+
+    if if_none_match:
+        # Revalidation: the version alone decides 304, the page is only read when it changed
+        version = await get_sessions_version(user_id=user_uuid)
+        etag = _sessions_etag(user_id=user_uuid, version=version, limit=limit, cursor=cursor, since=since)
+        if _etag_matches(if_none_match, etag):
+            return Response(status_code=304, headers={"ETag": etag, "Cache-Control": "private, no-cache"})
+        changes, rows = await load_page()
+    else:
+        # A write landing between the two reads is re-sent by the next delta (SESSIONS_SYNC_OVERLAP)
+        version, (changes, rows) = await asyncio.gather(get_sessions_version(user_id=user_uuid), load_page())
+        etag = _sessions_etag(user_id=user_uuid, version=version, limit=limit, cursor=cursor, since=since)
+    response.headers["ETag"] = etag
+    response.headers["Cache-Control"] = "private, no-cache"
+
+    if changes is not None:
+        changed, deleted = changes
+        return SessionsResponse(
+            sessions=[_session_dto(r, user_uuid) for r in changed],
+            deleted=[SessionTombstoneDTO(id=t.id, deleted_at=t.deleted_at) for t in deleted],
+            watermark=version or since,
+            delta=True,
+        )
+
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        last = rows[-1]
+        next_cursor = encode_cursor("sessions", (last.last_message_at, last.created_at, str(last.id)), newest_first=True)
     return SessionsResponse(
-        sessions=[
-            SessionDTO(
-                id=uuid.UUID(r["id"]),
-                user_id=uuid.UUID(r["user_id"]),
-                title=r.get("title"),
-                last_message_at=r.get("last_message_at"),
-                last_message_content=r.get("last_message_content"),
-            )
-            for r in rows
-        ]
+        sessions=[_session_dto(r, user_uuid) for r in rows],
+        next_cursor=next_cursor,
+        watermark=version,
     )
 
 
@@ -6,7 +6,7 @@ from fastapi import APIRouter, Depends, HTTPException
 from ..auth import get_current_user
 from ..Models.requests import CreateLinkInviteResponse, AcceptLinkInviteRequest, AcceptLinkInviteResponse, UnlinkResponse, LinkStatusResponse
 from ..Database.link_repo import accept_link_invite, unlink_relationship_for_user, get_link_status_for_user, get_or_create_link_invite
-from ..Database.supabase_client import supabase
+from ..Database.profiles_repo import get_profile, get_auth_user_metadata
 
 router = APIRouter(prefix = "/link")
 
@@ -26,32 +26,21 @@ async def create_invite(current_user: dict = Depends(get_current_user)):
         inviter_name: str = ""
         try:
             # Prefer saved profile full_name
-            prof = supabase.table("profiles").select("full_name").eq("user_id", str(user_uuid)).limit(1).execute()
-            if not getattr(prof, "error", None) and prof.data:
-                saved_full = (prof.data[0].get("full_name") or "").strip()
-                inviter_name = saved_full or ""
+            prof = await get_profile(user_id = user_uuid, columns = "full_name")
+            inviter_name = (prof.get("full_name") or "").strip()
             if not inviter_name:
                 # Fallback to auth metadata
-                res = supabase.auth.admin.get_user_by_id(str(user_uuid))  # type: ignore[attr-defined]
-                user = getattr(res, "user", None) or getattr(res, "data", None)
-                def extract_name(meta_dict):
-                    if not isinstance(meta_dict, dict):
-                        return ""
-                    return (meta_dict.get("full_name") or meta_dict.get("name") or meta_dict.get("display_name") or "").strip()
-                if isinstance(user, dict):
-                    inviter_name = extract_name(user.get("user_metadata"))
-                else:
-                    meta = getattr(user, "user_metadata", None)
-                    inviter_name = extract_name(meta if isinstance(meta, dict) else None)
+                meta = await get_auth_user_metadata(user_id = user_uuid) or {}
+                inviter_name = (meta.get("full_name") or meta.get("name") or meta.get("display_name") or "").strip()
         except Exception:
             inviter_name = ""
 
-        qp = f"code={row['invite_token']}"
+        qp = f"code={row.invite_token}"
         if inviter_name:
             qp += f"&name={urllib.parse.quote(inviter_name)}"
         share_url = f"{base.rstrip('/')}/link?{qp}"
 
-        return CreateLinkInviteResponse(invite_token = row["invite_token"], share_url = share_url)
+        return CreateLinkInviteResponse(invite_token = row.invite_token, share_url = share_url)
     except PermissionError as e:  # Error if user is already linked (must unlink first)
         raise HTTPException(status_code = 400, detail = str(e))
     except Exception as e:
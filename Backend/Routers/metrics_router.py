@@ -0,0 +1,24 @@
+import os
+import hmac
+from typing import Optional
+from fastapi import APIRouter, Header, HTTPException, Request
+from fastapi.responses import PlainTextResponse
+
+from ..Metrics.metrics import render_prometheus
+
+router = APIRouter()
+
+_LOOPBACK = {"127.0.0.1", "::1", "localhost"}
+
+# In-process metrics (Prometheus text format). With METRICS_TOKEN set, a matching Bearer token is required;
+# without it, only loopback clients may read them.
+@router.get("/metrics", response_class = PlainTextResponse)
+async def metrics(request: Request, authorization: Optional[str] = Header(default = None)):
+    token = os.getenv("METRICS_TOKEN", "")
+    if token:
+        supplied = (authorization or "").removeprefix("Bearer ").strip()
+        if not hmac.compare_digest(supplied.encode(), token.encode()):
+            raise HTTPException(status_code = 401, detail = "Invalid metrics token")
+    elif not request.client or request.client.host not in _LOOPBACK:
+        raise HTTPException(status_code = 404, detail = "Not Found")
+    return PlainTextResponse(render_prometheus(), media_type = "text/plain; version=0.0.4")
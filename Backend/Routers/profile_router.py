@@ -3,7 +3,7 @@ from fastapi import APIRouter, HTTPException, Depends, UploadFile, File, Form
 from fastapi import Body
 from ..auth import get_current_user
 from ..Database.link_repo import get_partner_user_id, get_link_status_for_user
-from ..Database.supabase_client import supabase
+from ..Database.profiles_repo import get_profile, upsert_profile, upload_avatar_object, create_signed_url, get_auth_user_metadata
 
 router = APIRouter(prefix = "/profile", tags = ["profile"])
 
@@ -28,22 +28,12 @@ async def upload_avatar(file: UploadFile = File(...), current_user: dict = Depen
         else:
             key = f"{user_id}"
 
-        res = supabase.storage.from_("avatar").upload(
-            path = key,
-            file = data,
-            file_options = {"contentType": content_type, "upsert": "true"},
-        )
-
-        if getattr(res, "error", None):
-            raise HTTPException(status_code = 500, detail = f"Storage upload failed: {res.error}")
+        await upload_avatar_object(key = key, data = data, content_type = content_type)
 
         path_value = f"avatar/{key}"
-        up = supabase.table("profiles").upsert({"user_id": str(user_id), "avatar_path": path_value}).execute()
-        if getattr(up, "error", None):
-            raise HTTPException(status_code = 500, detail = f"Failed to update profile: {up.error}")
+        await upsert_profile(user_id = user_id, fields = {"avatar_path": path_value})
 
-        signed = supabase.storage.from_("avatar").create_signed_url(key, 60 * 60 * 24)
-        url_value = signed.get("signedURL") if isinstance(signed, dict) else None
+        url_value = await create_signed_url(path_value = path_value)
 
         return {"path": path_value, "url": url_value}
     except HTTPException:
@@ -83,13 +73,7 @@ async def update_profile(
             raise HTTPException(status_code=400, detail="No fields provided for update")
 
         # Update the profile
-        result = supabase.table("profiles").upsert({
-            "user_id": str(user_id),
-            **update_data
-        }).execute()
-
-        if getattr(result, "error", None):
-            raise HTTPException(status_code=500, detail=f"Failed to update profile: {result.error}")
+        await upsert_profile(user_id=user_id, fields=update_data)
 
         return {"success": True, "message": "Profile updated successfully"}
     except HTTPException:
@@ -127,13 +111,7 @@ async def update_profile_post(
         if not update_data:
             raise HTTPException(status_code=400, detail="No fields provided for update")
 
-        result = supabase.table("profiles").upsert({
-            "user_id": str(user_id),
-            **update_data
-        }).execute()
-
-        if getattr(result, "error", None):
-            raise HTTPException(status_code=500, detail=f"Failed to update profile: {result.error}")
+        await upsert_profile(user_id=user_id, fields=update_data)
 
         return {"success": True, "message": "Profile updated successfully"}
     except HTTPException:
@@ -151,12 +129,7 @@ async def get_profile_info(current_user: dict = Depends(get_current_user)):
             raise HTTPException(status_code=401, detail="Invalid user ID in token")
 
         # Get profile from database
-        result = supabase.table("profiles").select("full_name, bio").eq("user_id", str(user_id)).limit(1).execute()
-        
-        if getattr(result, "error", None):
-            raise HTTPException(status_code=500, detail=f"Failed to get profile: {result.error}")
-
-        profile_data = result.data[0] if result.data else {}
+        profile_data = await get_profile(user_id=user_id, columns="full_name, bio")
         
         # Fallback to auth metadata if profile fields are empty
         auth_metadata = current_user.get("user_metadata", {})
@@ -184,11 +157,10 @@ async def get_self_and_partner_avatars(current_user: dict = Depends(get_current_
         except Exception:
             raise HTTPException(status_code = 401, detail = "Invalid user ID in token")
 
-        me_sel = supabase.table("profiles").select("avatar_path").eq("user_id", str(user_id)).limit(1).execute()
-        me_path = (me_sel.data[0].get("avatar_path") if me_sel.data else None) if not getattr(me_sel, "error", None) else None
+        me_path = await _avatar_path_for(user_id)
 
         if me_path:
-            me_url = _signed_url_from_path(me_path)
+            me_url = await create_signed_url(path_value = me_path)
         else:
             try:
                 meta = current_user.get("user_metadata") or {}
@@ -206,9 +178,8 @@ async def get_self_and_partner_avatars(current_user: dict = Depends(get_current_
         partner_url = None
         partner_source = "default"
         if partner_id:
-            ps = supabase.table("profiles").select("avatar_path").eq("user_id", str(partner_id)).limit(1).execute()
-            p_path = (ps.data[0].get("avatar_path") if ps.data else None) if not getattr(ps, "error", None) else None
-            partner_url = _signed_url_from_path(p_path) if p_path else _provider_avatar_from_admin(partner_id)
+            p_path = await _avatar_path_for(partner_id)
+            partner_url = await create_signed_url(path_value = p_path) if p_path else await _provider_avatar_from_admin(partner_id)
             partner_source = "storage" if p_path and partner_url else ("provider" if partner_url else "default")
 
         return {
@@ -220,42 +191,20 @@ async def get_self_and_partner_avatars(current_user: dict = Depends(get_current_
     except Exception as e:
         raise HTTPException(status_code = 500, detail = str(e))
 
- # Create a signed URL from a storage path
-def _signed_url_from_path(path_value: str) -> str | None:
+# Saved avatar storage path for a user, or None (lookup errors fall back to provider/default avatars)
+async def _avatar_path_for(user_id: uuid.UUID) -> str | None:
     try:
-        if "/" in path_value:
-            bucket, key = path_value.split("/", 1)
-        else:
-            bucket, key = "avatar", path_value
-        signed = supabase.storage.from_(bucket).create_signed_url(key, 60 * 60 * 24)
-        return signed.get("signedURL") if isinstance(signed, dict) else None
+        return (await get_profile(user_id = user_id, columns = "avatar_path")).get("avatar_path")
     except Exception:
         return None
 
 # Get a user's avatar URL from their auth provider metadata via admin API
-def _provider_avatar_from_admin(user_id: uuid.UUID) -> str | None:
+async def _provider_avatar_from_admin(user_id: uuid.UUID) -> str | None:
     try:
-        res = supabase.auth.admin.get_user_by_id(str(user_id))  # type: ignore[attr-defined]
-        user = getattr(res, "user", None) or getattr(res, "data", None)
-        if not user:
+        meta = await get_auth_user_metadata(user_id = user_id)
+        if not meta:
             return None
-
-        def extract_from_meta(meta_dict):
-            if not isinstance(meta_dict, dict):
-                return None
-            return meta_dict.get("avatar_url") or meta_dict.get("picture")
-
-        if isinstance(user, dict):
-            meta = user.get("user_metadata")
-            url = extract_from_meta(meta)
-            if url:
-                return url
-        else:
-            meta = getattr(user, "user_metadata", None)
-            url = extract_from_meta(meta if isinstance(meta, dict) else None)
-            if url:
-                return url
-        return None
+        return meta.get("avatar_url") or meta.get("picture")
     except Exception as e:
         print(f"[Avatar] Error fetching partner avatar for {user_id}: {e}")
         return None
@@ -281,10 +230,9 @@ async def get_partner_info(current_user: dict = Depends(get_current_user)):
 
         # Get partner info from auth provider, but prefer saved profile full_name if present
         try:
-            res = supabase.auth.admin.get_user_by_id(str(partner_id))  # type: ignore[attr-defined]
-            user = getattr(res, "user", None) or getattr(res, "data", None)
+            meta = await get_auth_user_metadata(user_id=partner_id)
 
-            if not user:
+            if meta is None:
                 return {"linked": True, "partner": {"name": "Unknown", "avatar_url": None}}
 
             # Extract name and avatar from user metadata
@@ -301,30 +249,20 @@ async def get_partner_info(current_user: dict = Depends(get_current_user)):
                     return None
                 return meta_dict.get("avatar_url") or meta_dict.get("picture")
 
-            if isinstance(user, dict):
-                meta = user.get("user_metadata")
-                name = extract_name_from_meta(meta)
-                avatar_url = extract_avatar_from_meta(meta)
-            else:
-                meta = getattr(user, "user_metadata", None)
-                name = extract_name_from_meta(meta if isinstance(meta, dict) else None)
-                avatar_url = extract_avatar_from_meta(meta if isinstance(meta, dict) else None)
+            name = extract_name_from_meta(meta)
+            avatar_url = extract_avatar_from_meta(meta)
 
-            # Prefer partner's saved profile full_name if available
+            # Prefer partner's saved profile full_name and storage avatar (one profile read for both)
             try:
-                prof = supabase.table("profiles").select("full_name").eq("user_id", str(partner_id)).limit(1).execute()
-                if not getattr(prof, "error", None) and prof.data:
-                    saved_full = (prof.data[0].get("full_name") or "").strip()
-                    if saved_full:
-                        name = saved_full
+                prof = await get_profile(user_id=partner_id, columns="full_name, avatar_path")
             except Exception:
-                # ignore profile lookup errors and keep provider-derived name
-                pass
-
-            # Try to get custom avatar from storage
-            ps = supabase.table("profiles").select("avatar_path").eq("user_id", str(partner_id)).limit(1).execute()
-            p_path = (ps.data[0].get("avatar_path") if ps.data else None) if not getattr(ps, "error", None) else None
-            custom_avatar_url = _signed_url_from_path(p_path) if p_path else None
+                # ignore profile lookup errors and keep provider-derived name/avatar
+                prof = {}
+            saved_full = (prof.get("full_name") or "").strip()
+            if saved_full:
+                name = saved_full
+            p_path = prof.get("avatar_path")
+            custom_avatar_url = await create_signed_url(path_value=p_path) if p_path else None
 
             return {
                 "linked": True,
@@ -355,14 +293,7 @@ async def get_onboarding(current_user: dict = Depends(get_current_user)):
             raise HTTPException(status_code=401, detail="Invalid user ID in token")
 
         # Read current profile onboarding fields
-        sel = supabase.table("profiles").select(
-            "full_name, partner_display_name, onboarding_step"
-        ).eq("user_id", str(user_id)).limit(1).execute()
-
-        if getattr(sel, "error", None):
-            raise HTTPException(status_code=500, detail=f"Failed to load onboarding: {sel.error}")
-
-        row = sel.data[0] if sel.data else {}
+        row = await get_profile(user_id=user_id, columns="full_name, partner_display_name, onboarding_step")
 
         # Also include linking status for client logic
         linked, _, _ = await get_link_status_for_user(user_id=user_id)
@@ -413,22 +344,14 @@ async def update_onboarding(
             if new_step not in ("none", "asked_name", "asked_partner", "suggested_link", "completed"):
                 raise HTTPException(status_code=400, detail="Invalid onboarding_step")
             # Fetch current step
-            cur = supabase.table("profiles").select("onboarding_step").eq("user_id", str(user_id)).limit(1).execute()
-            if getattr(cur, "error", None):
-                raise HTTPException(status_code=500, detail=f"Failed to load current step: {cur.error}")
-            cur_step = (cur.data[0].get("onboarding_step") if cur.data else "none") or "none"
+            cur = await get_profile(user_id=user_id, columns="onboarding_step")
+            cur_step = cur.get("onboarding_step") or "none"
             order = {"none": 0, "asked_name": 1, "asked_partner": 2, "suggested_link": 3, "completed": 4}
             if order.get(new_step, -1) < order.get(cur_step, 0) and new_step != "completed":
                 raise HTTPException(status_code=400, detail="Onboarding step cannot regress")
 
         # Persist
-        res = supabase.table("profiles").upsert({
-            "user_id": str(user_id),
-            **update_data
-        }).execute()
-
-        if getattr(res, "error", None):
-            raise HTTPException(status_code=500, detail=f"Failed to update onboarding: {res.error}")
+        await upsert_profile(user_id=user_id, fields=update_data)
 
         return {"success": True}
     except HTTPException:
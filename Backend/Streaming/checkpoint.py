@@ -0,0 +1,102 @@
+import os
+import time
+import uuid
+import asyncio
+from typing import Awaitable, Callable, Optional
+
+from ..Database.chat_repo import upsert_message
+
+
+class AssistantCheckpointer:
+    """Write-behind persistence of one streaming assistant message.
+
+    The message id is chosen up front and every write upserts that one row, so the row is
+    created by the first checkpoint and overwritten by the later ones. While the stream runs,
+    `mark()` schedules a checkpoint of `snapshot()` at most every `interval_ms`;
+    `finish(content)` cancels what is scheduled, waits for a write in flight and writes the
+    final content. Writes are serialized and nothing is written after finish, so a slow
+    checkpoint can never overwrite the final message; repeating finish is harmless.
+
+    `before_first_write` is awaited once before the row is created (the user message must
+    land first so ordering by created_at holds). If it raises, the row is never written: the
+    checkpointer is abandoned and every later write, final one included, is a no-op.
+    """
+
+    def __init__(self, *, user_id: uuid.UUID, session_id: uuid.UUID, snapshot: Callable[[], Optional[str]],
+                 before_first_write: Optional[Callable[[], Awaitable[None]]] = None,
+                 interval_ms: Optional[float] = None):
+        self.message_id = uuid.uuid4()
+        self.user_id = user_id
+        self.session_id = session_id
+        # 0 disables checkpoints: the message is only written by finish()
+        self.interval_seconds = max(0.0, float(os.getenv("CHAT_CHECKPOINT_INTERVAL_MS", "1500") if interval_ms is None else interval_ms) / 1000.0)
+        self.enabled = self.interval_seconds > 0
+        self.checkpoints = 0
+
+        self._snapshot = snapshot
+        self._before_first_write = before_first_write
+        self._first_write_done = False
+        self._last_written: Optional[str] = None
+        self._last_write_at = 0.0
+        self._lock = asyncio.Lock()
+        self._scheduled: Optional[asyncio.Task] = None
+        self._finished = False
+        self._abandoned = False
+
+    # New output is available; schedule a checkpoint unless one is already pending
+    def mark(self) -> None:
+        if not self.enabled or self._finished or self._scheduled is not None:
+            return
+        delay = max(0.0, self._last_write_at + self.interval_seconds - time.monotonic())
+        self._scheduled = asyncio.create_task(self._checkpoint_later(delay))
+
+    # Write the final content (None: keep whatever is already stored)
+    async def finish(self, content: Optional[str]) -> None:
+        self._finished = True
+        scheduled, self._scheduled = self._scheduled, None
+        if scheduled is not None:
+            scheduled.cancel()
+        if content is not None:
+            await self._write(content)
+
+    async def _checkpoint_later(self, delay: float) -> None:
+        try:
+            await asyncio.sleep(delay)
+        except asyncio.CancelledError:
+            return
+        self._scheduled = None
+        if self._finished:
+            return
+        try:
+            content = self._snapshot()
+            if content is not None:
+                await self._write(content, checkpoint=True)
+        except Exception as e:
+            print(f"[SSE] assistant checkpoint failed message_id={self.message_id}: {e}")
+
+    async def _write(self, content: str, *, checkpoint: bool = False) -> None:
+        async with self._lock:
+            if self._abandoned or (checkpoint and self._finished):
+                return
+            if content == self._last_written:
+                return
+            if not self._first_write_done:
+                if self._before_first_write is not None:
+                    try:
+                        await self._before_first_write()
+                    except Exception as e:
+                        print(f"[SSE] assistant message not written message_id={self.message_id}: {e}")
+                        self._abandoned = True
+                        return
+                self._first_write_done = True
+            await upsert_message(
+                message_id=self.message_id,
+                user_id=self.user_id,
+                session_id=self.session_id,
+                role="assistant",
+                content=content,
+            )
+            self._last_written = content
+            self._last_write_at = time.monotonic()
+            if checkpoint:
+                self.checkpoints += 1
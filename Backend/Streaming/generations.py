@@ -0,0 +1,164 @@
+import os
+import time
+import asyncio
+import contextvars
+from collections import OrderedDict
+from typing import Callable, Coroutine, Dict, Optional
+
+from ..Metrics.metrics import counter
+
+cancelled_generations = counter("chat_generations_cancelled_total", "Chat generations cancelled before completion, by reason")
+tokens_saved = counter("chat_output_tokens_saved_estimate_total", "Estimated output tokens not generated thanks to cancellation")
+
+
+class _Generation:
+    __slots__ = ("task", "user_id", "on_stop", "followers", "remote_until", "idle_timer", "stop_reason")
+
+    def __init__(self, task: asyncio.Task, user_id: str, on_stop: Callable[[str], None]):
+        self.task = task
+        self.user_id = user_id
+        self.on_stop = on_stop
+        self.followers = 0
+        self.remote_until = 0.0  # epoch seconds a client on another machine counts as following until
+        self.idle_timer: Optional[asyncio.TimerHandle] = None
+        self.stop_reason: Optional[str] = None
+
+
+class GenerationRegistry:
+    """Chat generations running in this process, keyed by stream id.
+
+    A generation is stopped when asked to (stop endpoint) or once no client has followed
+    its stream for `grace_seconds`; 0 stops it as soon as the last client disconnects. The
+    grace window gives a dropped client time to resume before the upstream is closed.
+
+    With a shared stream store (STREAM_RESUME_STORE=supabase) the client may resume, or ask to
+    stop, on another machine. Every `control_seconds` one query reads the follower heartbeats and
+    stop requests of all generations running here; a recent heartbeat counts as a follower.
+
+    Estimated savings use a moving average of completed responses' output tokens: a
+    stopped response is assumed to have had that many tokens left minus what it produced.
+    """
+
+    def __init__(self, *, grace_seconds: Optional[float] = None, store=None):
+        self.grace_seconds = max(0.0, float(os.getenv("STREAM_DISCONNECT_GRACE_SECONDS", "10") if grace_seconds is None else grace_seconds))
+        self.control_seconds = max(0.1, float(os.getenv("STREAM_CONTROL_POLL_MS", "1000")) / 1000.0)
+        self._store = store if getattr(store, "shared", False) else None
+        self._watcher: Optional[asyncio.Task] = None
+        self._running: Dict[str, _Generation] = {}
+        self._aliases: "OrderedDict[str, str]" = OrderedDict()  # OpenAI response id -> stream id
+        self._avg_output_tokens = float(os.getenv("CHAT_AVG_OUTPUT_TOKENS", "400"))
+
+    # Run `coro` as a task in a fresh context (it outlives the request); `on_stop(reason)` must end it early
+    def start(self, stream_id: str, coro: Coroutine, *, user_id: str, on_stop: Callable[[str], None]) -> asyncio.Task:
+        task = asyncio.create_task(coro, context=contextvars.Context())
+        gen = _Generation(task, user_id, on_stop)
+        self._running[stream_id] = gen
+        task.add_done_callback(lambda _t: self._finished(stream_id))
+        # Nobody is following yet; the response that started it attaches right away
+        self._arm_idle_timer(gen, stream_id, max(self.grace_seconds, 5.0))
+        if self._store is not None and (self._watcher is None or self._watcher.done()):
+            self._watcher = asyncio.create_task(self._watch_remote(), context=contextvars.Context())
+        return task
+
+    def alias(self, response_id: str, stream_id: str) -> None:
+        self._aliases[response_id] = stream_id
+        while len(self._aliases) > 10_000:
+            self._aliases.popitem(last=False)
+
+    # Map a stream id or an OpenAI response id to a running generation's stream id
+    def resolve(self, any_id: str) -> Optional[str]:
+        if any_id in self._running:
+            return any_id
+        stream_id = self._aliases.get(any_id)
+        return stream_id if stream_id in self._running else None
+
+    def owner(self, stream_id: str) -> Optional[str]:
+        gen = self._running.get(stream_id)
+        return gen.user_id if gen else None
+
+    def attach(self, stream_id: str) -> None:
+        gen = self._running.get(stream_id)
+        if gen is None:
+            return
+        gen.followers += 1
+        if gen.idle_timer is not None:
+            gen.idle_timer.cancel()
+            gen.idle_timer = None
+
+    def detach(self, stream_id: str) -> None:
+        gen = self._running.get(stream_id)
+        if gen is None:
+            return
+        gen.followers = max(0, gen.followers - 1)
+        if gen.followers == 0:
+            if self.grace_seconds == 0:
+                self._idle(stream_id)
+            else:
+                self._arm_idle_timer(gen, stream_id, self.grace_seconds)
+
+    # Ask a running generation to stop; False if it already finished or is stopping
+    def stop(self, stream_id: str, *, reason: str) -> bool:
+        gen = self._running.get(stream_id)
+        if gen is None or gen.stop_reason is not None or gen.task.done():
+            return False
+        gen.stop_reason = reason
+        if gen.idle_timer is not None:
+            gen.idle_timer.cancel()
+            gen.idle_timer = None
+        cancelled_generations.inc(reason=reason)
+        print(f"[SSE] stopping generation stream={stream_id} reason={reason}")
+        gen.on_stop(reason)
+        return True
+
+    # Called once per finished generation with its output token count
+    def record_output(self, output_tokens: int, *, truncated: bool) -> None:
+        if truncated:
+            tokens_saved.inc(max(0.0, self._avg_output_tokens - output_tokens))
+        elif output_tokens > 0:
+            self._avg_output_tokens += 0.05 * (output_tokens - self._avg_output_tokens)
+
+    def _arm_idle_timer(self, gen: _Generation, stream_id: str, delay: float) -> None:
+        if gen.idle_timer is not None:
+            gen.idle_timer.cancel()
+        loop = asyncio.get_running_loop()
+        gen.idle_timer = loop.call_later(delay, lambda: self._idle(stream_id))
+
+    # No local follower for the grace period: stop, unless a client elsewhere is still following
+    def _idle(self, stream_id: str) -> None:
+        gen = self._running.get(stream_id)
+        if gen is None:
+            return
+        gen.idle_timer = None
+        remaining = gen.remote_until - time.time()
+        if remaining > 0:
+            self._arm_idle_timer(gen, stream_id, remaining)
+            return
+        self.stop(stream_id, reason="disconnect")
+
+    # Runs while this process has generations; exits when the last one finishes (start() restarts it)
+    async def _watch_remote(self) -> None:
+        # A heartbeat keeps counting for the grace period, and at least two heartbeat intervals
+        window = max(self.grace_seconds, 2 * self._store.heartbeat_seconds)
+        while self._running:
+            await asyncio.sleep(self.control_seconds)
+            stream_ids = list(self._running)
+            if not stream_ids:
+                return
+            try:
+                controls = await self._store.read_controls(stream_ids)
+            except Exception as e:
+                print(f"[SSE] stream control poll failed: {e}")
+                continue
+            for stream_id, (followed_at, stop_reason) in controls.items():
+                gen = self._running.get(stream_id)
+                if gen is None:
+                    continue
+                if stop_reason:
+                    self.stop(stream_id, reason=stop_reason)
+                elif followed_at is not None:
+                    gen.remote_until = max(gen.remote_until, followed_at + window)
+
+    def _finished(self, stream_id: str) -> None:
+        gen = self._running.pop(stream_id, None)
+        if gen is not None and gen.idle_timer is not None:
+            gen.idle_timer.cancel()
@@ -0,0 +1,187 @@
+from dataclasses import dataclass
+from typing import List, Union
+
+TAG_OPEN = "<partner_message"
+TAG_CLOSE = "</partner_message>"
+
+# An open tag with attributes (<partner_message to="B">) is held until its '>' arrives;
+# past this many characters we give up and treat it as plain text
+MAX_OPEN_TAG_CHARS = 256
+
+_TEXT = 0
+_OPEN_TAG = 1
+_PARTNER = 2
+
+
+@dataclass(frozen=True, slots=True)
+class TokenEvent:
+    text: str
+
+
+@dataclass(frozen=True, slots=True)
+class PartnerMessageEvent:
+    text: str
+
+
+@dataclass(frozen=True, slots=True)
+class SegmentEvent:
+    segment: dict
+
+
+ParserEvent = Union[TokenEvent, PartnerMessageEvent, SegmentEvent]
+
+
+class PartnerMessageParser:
+    """Incremental splitter for model output containing <partner_message>...</partner_message> blocks.
+
+    Each feed() only looks at the new delta plus a bounded carry (a partial tag of at most a few
+    dozen characters), so a whole response is parsed in linear time. Plain text is emitted as soon
+    as it cannot be the start of an open tag; partner blocks are emitted once their close tag arrives.
+    Completed segments ({"type": "text"} / {"type": "partner_draft"}) are reported as they close.
+    """
+
+    def __init__(self):
+        self.segments: List[dict] = []
+        self._state = _TEXT
+        self._pending = ""  # text-state partial open tag, or the open tag read so far
+        self._open_has_attrs = False
+        self._partner_parts: List[str] = []
+        self._partner_carry = ""  # tail that may be the start of the close tag
+        self._text_parts: List[str] = []
+        self._segment_parts: List[str] = []
+
+    @property
+    def text(self) -> str:
+        return "".join(self._text_parts)
+
+    # Segments so far plus the open text segment; an unterminated partner block is left out
+    def snapshot(self) -> List[dict]:
+        if not self._segment_parts:
+            return list(self.segments)
+        return self.segments + [{"type": "text", "content": "".join(self._segment_parts)}]
+
+    def feed(self, delta: str) -> List[ParserEvent]:
+        events: List[ParserEvent] = []
+        data = delta or ""
+        while data:
+            if self._state == _TEXT:
+                data = self._feed_text(data, events)
+            elif self._state == _OPEN_TAG:
+                data = self._feed_open_tag(data, events)
+            else:
+                data = self._feed_partner(data, events)
+        return events
+
+    # Flush everything still held back; an unterminated partner block is surfaced as plain text
+    def close(self) -> List[ParserEvent]:
+        events: List[ParserEvent] = []
+        if self._state == _PARTNER:
+            self._emit_text("".join(self._partner_parts) + self._partner_carry, events)
+            self._partner_parts = []
+            self._partner_carry = ""
+        else:
+            self._emit_text(self._pending, events)
+        self._pending = ""
+        self._state = _TEXT
+        self._close_text_segment(events)
+        return events
+
+    def _feed_text(self, data: str, events: List[ParserEvent]) -> str:
+        window = self._pending + data if self._pending else data
+        self._pending = ""
+        pos = 0
+        tag_len = len(TAG_OPEN)
+        while True:
+            i = window.find("<", pos)
+            if i == -1:
+                self._emit_text(window, events)
+                return ""
+            candidate = window[i:i + tag_len]
+            if candidate == TAG_OPEN:
+                self._emit_text(window[:i], events)
+                self._state = _OPEN_TAG
+                self._pending = TAG_OPEN
+                self._open_has_attrs = False
+                return window[i + tag_len:]
+            if len(candidate) < tag_len and TAG_OPEN.startswith(candidate):
+                # Window ends in what may become an open tag; hold just that suffix
+                self._emit_text(window[:i], events)
+                self._pending = candidate
+                return ""
+            pos = i + 1
+
+    def _feed_open_tag(self, data: str, events: List[ParserEvent]) -> str:
+        if not self._open_has_attrs:
+            first = data[0]
+            if first == ">":
+                self._enter_partner()
+                return data[1:]
+            if not first.isspace():
+                # "<partner_messageX": not our tag after all
+                self._emit_text(self._pending, events)
+                self._pending = ""
+                self._state = _TEXT
+                return data
+            self._open_has_attrs = True
+
+        end = data.find(">")
+        if end == -1:
+            self._pending += data
+            if len(self._pending) > MAX_OPEN_TAG_CHARS:
+                return self._abandon_open_tag(events)
+            return ""
+        self._enter_partner()
+        return data[end + 1:]
+
+    def _abandon_open_tag(self, events: List[ParserEvent]) -> str:
+        held = self._pending
+        self._pending = ""
+        self._state = _TEXT
+        self._emit_text("<", events)
+        return held[1:]
+
+    def _enter_partner(self) -> None:
+        self._state = _PARTNER
+        self._pending = ""
+        self._partner_parts = []
+        self._partner_carry = ""
+
+    def _feed_partner(self, data: str, events: List[ParserEvent]) -> str:
+        window = self._partner_carry + data if self._partner_carry else data
+        idx = window.find(TAG_CLOSE)
+        if idx == -1:
+            keep = len(TAG_CLOSE) - 1
+            if len(window) > keep:
+                self._partner_parts.append(window[:-keep])
+                self._partner_carry = window[-keep:]
+            else:
+                self._partner_carry = window
+            return ""
+
+        self._partner_parts.append(window[:idx])
+        content = "".join(self._partner_parts)
+        self._partner_parts = []
+        self._partner_carry = ""
+        self._state = _TEXT
+
+        self._close_text_segment(events)
+        events.append(PartnerMessageEvent(content))
+        segment = {"type": "partner_draft", "text": content}
+        self.segments.append(segment)
+        events.append(SegmentEvent(segment))
+        return window[idx + len(TAG_CLOSE):]
+
+    def _emit_text(self, text: str, events: List[ParserEvent]) -> None:
+        if not text:
+            return
+        self._text_parts.append(text)
+        self._segment_parts.append(text)
+        events.append(TokenEvent(text))
+
+    def _close_text_segment(self, events: List[ParserEvent]) -> None:
+        if not self._segment_parts:
+            return
+        segment = {"type": "text", "content": "".join(self._segment_parts)}
+        self._segment_parts = []
+        self.segments.append(segment)
+        events.append(SegmentEvent(segment))
@@ -0,0 +1,114 @@
+import os
+import json
+import time
+from typing import Optional
+
+
+# Padding comment sent first so proxies that buffer small responses start flushing immediately
+PRELUDE = (":" + " " * 2048 + "\n\n").encode()
+KEEPALIVE = b":\n\n"
+
+
+class SSEWriter:
+    """Encodes server-sent events and coalesces token text into fewer frames.
+
+    Token text is buffered and flushed as one `event: token` frame once it is
+    `flush_bytes` UTF-8 bytes long or its oldest piece has waited `flush_ms`. Any other event first
+    flushes pending tokens, in the same write, so ordering is preserved. Keepalive
+    comments are only sent after `keepalive_seconds` without any write.
+
+    The caller owns the clock: it waits at most `wait_timeout()` for its next input and
+    calls `on_timeout()` when that wait expires.
+
+    With `ids=True` every event frame carries an increasing `id:` line (1, 2, ...) so a
+    client can resume with Last-Event-ID; see `split_frames`.
+    """
+
+    def __init__(self, *, flush_ms: Optional[float] = None, flush_bytes: Optional[int] = None,
+                 keepalive_seconds: Optional[float] = None, ids: bool = False):
+        self.flush_seconds = max(0.0, float(os.getenv("SSE_TOKEN_FLUSH_MS", "40") if flush_ms is None else flush_ms) / 1000.0)
+        self.flush_bytes = max(1, int(os.getenv("SSE_TOKEN_FLUSH_BYTES", "512") if flush_bytes is None else flush_bytes))
+        self.keepalive_seconds = max(0.1, float(os.getenv("SSE_KEEPALIVE_SECONDS", "15") if keepalive_seconds is None else keepalive_seconds))
+
+        self._pending: list[str] = []
+        self._pending_bytes = 0
+        self._pending_since: Optional[float] = None
+        self._last_write = time.monotonic()
+
+        self.ids = ids
+        self.last_id = 0
+        self.frames = 0  # SSE frames written (keepalives excluded)
+        self.keepalives = 0
+
+    def prelude(self) -> bytes:
+        self._last_write = time.monotonic()
+        return PRELUDE
+
+    # Buffer token text; returns a frame once the byte threshold is reached, else b""
+    def token(self, text: str) -> bytes:
+        if not text:
+            return b""
+        if self._pending_since is None:
+            self._pending_since = time.monotonic()
+        self._pending.append(text)
+        self._pending_bytes += len(text.encode("utf-8"))
+        if self._pending_bytes >= self.flush_bytes or self.flush_seconds == 0.0:
+            return self.flush()
+        return b""
+
+    # Any non-token event; `data` is the already-serialized payload (JSON text)
+    def event(self, name: str, data: str = "{}") -> bytes:
+        return self.flush() + self._frame(name, data)
+
+    # Emit all pending token text as a single frame (b"" when nothing is pending)
+    def flush(self) -> bytes:
+        if not self._pending:
+            return b""
+        text = "".join(self._pending)
+        self._pending.clear()
+        self._pending_bytes = 0
+        self._pending_since = None
+        # Raw UTF-8 (not \u escapes), so the frame is as long as the bytes counted above
+        return self._frame("token", json.dumps(text, ensure_ascii=False))
+
+    # Seconds the caller may wait for input before on_timeout() has something to do
+    def wait_timeout(self) -> float:
+        now = time.monotonic()
+        if self._pending_since is not None:
+            return max(0.0, self._pending_since + self.flush_seconds - now)
+        return max(0.0, self._last_write + self.keepalive_seconds - now)
+
+    # Flush tokens that reached their latency budget, or send a keepalive when idle
+    def on_timeout(self) -> bytes:
+        now = time.monotonic()
+        if self._pending_since is not None:
+            if now - self._pending_since >= self.flush_seconds:
+                return self.flush()
+            return b""
+        if now - self._last_write >= self.keepalive_seconds:
+            self.keepalives += 1
+            return self._written(KEEPALIVE)
+        return b""
+
+    def _frame(self, name: str, data: str) -> bytes:
+        self.frames += 1
+        if self.ids:
+            self.last_id += 1
+            return self._written(f"id: {self.last_id}\nevent: {name}\ndata: {data}\n\n".encode())
+        return self._written(f"event: {name}\ndata: {data}\n\n".encode())
+
+    def _written(self, frame: bytes) -> bytes:
+        self._last_write = time.monotonic()
+        return frame
+
+
+# Split writer output produced with ids=True into [(event_id, frame_bytes), ...]; comments are dropped.
+# Payloads are JSON-encoded, so a blank line only ever ends a frame.
+def split_frames(chunk: bytes) -> list[tuple[int, bytes]]:
+    out = []
+    for frame in chunk.split(b"\n\n"):
+        if not frame.startswith(b"id: "):
+            continue
+        event_id = int(frame[4:frame.index(b"\n")])
+        out.append((event_id, frame + b"\n\n"))
+    return out
@@ -0,0 +1,337 @@
+import os
+import time
+import asyncio
+from collections import deque
+from contextlib import asynccontextmanager
+from datetime import datetime, timedelta, timezone
+from typing import Awaitable, Callable, Deque, Dict, List, Optional, Tuple
+
+from .sse_writer import PRELUDE, KEEPALIVE, split_frames
+from ..Database.stream_events_repo import (
+    create_stream,
+    extend_stream,
+    finish_stream,
+    get_stream,
+    insert_events,
+    list_events_after,
+    list_stream_controls,
+    request_stream_stop,
+    touch_stream_follower,
+    trim_events,
+    delete_expired_streams,
+)
+
+Event = Tuple[int, bytes]
+
+
+class StreamGone(Exception):
+    """The requested events were evicted (or the stream expired); the client must reload the session."""
+
+
+class StreamMeta:
+    __slots__ = ("user_id", "session_id", "done")
+
+    def __init__(self, user_id: str, session_id: str, done: bool):
+        self.user_id = user_id
+        self.session_id = session_id
+        self.done = done
+
+
+class _Buffer:
+    __slots__ = ("meta", "events", "last_id", "expires_at", "changed")
+
+    def __init__(self, meta: StreamMeta, max_events: int, expires_at: float):
+        self.meta = meta
+        self.events: Deque[Event] = deque(maxlen=max_events)
+        self.last_id = 0
+        self.expires_at = expires_at
+        self.changed = asyncio.Event()
+
+
+class InMemoryStreamStore:
+    """Per-stream ring buffer of SSE frames (with ids) for one process.
+
+    Each stream keeps its last `max_events` frames. A stream lives for `ttl_seconds` after
+    it finishes; a stream that never finishes is dropped `ttl_seconds` after its last
+    append. Expired streams are swept on open().
+    """
+
+    # Streams are only visible to this process: followers and stop requests never come from elsewhere
+    shared = False
+
+    def __init__(self, *, max_events: int, ttl_seconds: float):
+        self.max_events = max_events
+        self.ttl_seconds = ttl_seconds
+        self._streams: Dict[str, _Buffer] = {}
+        self._next_sweep = 0.0
+
+    async def open(self, stream_id: str, *, user_id: str, session_id: str) -> None:
+        self._sweep()
+        self._streams[stream_id] = _Buffer(StreamMeta(user_id, session_id, False), self.max_events, time.monotonic() + self.ttl_seconds)
+
+    # Append writer output (ids=True); frames without an id (comments) are ignored
+    async def append(self, stream_id: str, chunk: bytes) -> None:
+        self._append_local(stream_id, split_frames(chunk) if chunk else [])
+
+    def _append_local(self, stream_id: str, frames: List[Event]) -> None:
+        buf = self._streams.get(stream_id)
+        if buf is None or not frames:
+            return
+        buf.events.extend(frames)
+        buf.last_id = frames[-1][0]
+        buf.expires_at = time.monotonic() + self.ttl_seconds
+        self._notify(buf)
+
+    async def close(self, stream_id: str) -> None:
+        buf = self._streams.get(stream_id)
+        if buf is None:
+            return
+        buf.meta.done = True
+        buf.expires_at = time.monotonic() + self.ttl_seconds
+        self._notify(buf)
+
+    async def get_meta(self, stream_id: str) -> Optional[StreamMeta]:
+        buf = self._live(stream_id)
+        return buf.meta if buf else None
+
+    # Events with id > last_id plus whether the stream has finished; raises StreamGone on a gap
+    async def read_after(self, stream_id: str, last_id: int) -> Tuple[List[Event], bool]:
+        buf = self._live(stream_id)
+        if buf is None:
+            raise StreamGone(stream_id)
+        if buf.events and buf.events[0][0] > last_id + 1:
+            raise StreamGone(stream_id)
+        if buf.last_id <= last_id:
+            return [], buf.meta.done
+        return [ev for ev in buf.events if ev[0] > last_id], buf.meta.done
+
+    # Wait until events after last_id exist or the stream finishes; False on timeout
+    async def wait(self, stream_id: str, last_id: int, timeout: float) -> bool:
+        buf = self._live(stream_id)
+        if buf is None or buf.last_id > last_id or buf.meta.done:
+            return True
+        changed = buf.changed
+        try:
+            await asyncio.wait_for(changed.wait(), timeout)
+            return True
+        except asyncio.TimeoutError:
+            return False
+
+    # Held by every HTTP client while it tails a stream
+    @asynccontextmanager
+    async def follow(self, stream_id: str):
+        yield
+
+    # Ask the machine generating a stream to stop it; False if no other machine can be reached
+    async def request_stop(self, stream_id: str, *, reason: str) -> bool:
+        return False
+
+    def _notify(self, buf: _Buffer) -> None:
+        changed, buf.changed = buf.changed, asyncio.Event()
+        changed.set()
+
+    def _live(self, stream_id: str) -> Optional[_Buffer]:
+        buf = self._streams.get(stream_id)
+        if buf is not None and buf.expires_at < time.monotonic():
+            self._streams.pop(stream_id, None)
+            return None
+        return buf
+
+    def _sweep(self) -> None:
+        now = time.monotonic()
+        if now < self._next_sweep:
+            return
+        self._next_sweep = now + 30.0
+        for stream_id in [sid for sid, buf in self._streams.items() if buf.expires_at < now]:
+            self._streams.pop(stream_id, None)
+
+
+class SupabaseStreamStore(InMemoryStreamStore):
+    """Ring buffer shared across machines through the chat_streams / chat_stream_events tables.
+
+    The generating process keeps the in-memory buffer for its own tailers and writes frames
+    behind in batches every `flush_seconds`. A reconnect that lands on another machine
+    reads the tables and polls them every `poll_seconds` while the stream is live.
+    Like the local buffer, a stream row stays alive `ttl_seconds` past its last frames: flushes
+    renew its expires_at once half of that lease is used up, so a generation that runs longer
+    than the TTL is neither hidden from other machines nor swept from under them.
+    A client following from another machine stamps followed_at every `heartbeat_seconds`, and a
+    stop asked for there sets stop_requested; the generating machine reads both with read_controls().
+    See Database/Migrations/002_chat_stream_events.sql and 010_chat_stream_control.sql.
+    """
+
+    shared = True
+
+    def __init__(self, *, max_events: int, ttl_seconds: float, flush_seconds: float, poll_seconds: float,
+                 heartbeat_seconds: float):
+        super().__init__(max_events=max_events, ttl_seconds=ttl_seconds)
+        self.flush_seconds = flush_seconds
+        self.poll_seconds = poll_seconds
+        self.heartbeat_seconds = heartbeat_seconds
+        self._pending: Dict[str, List[Event]] = {}
+        self._flushers: Dict[str, asyncio.Task] = {}
+        self._renew_at: Dict[str, float] = {}
+        self._next_table_sweep = 0.0
+
+    async def open(self, stream_id: str, *, user_id: str, session_id: str) -> None:
+        await super().open(stream_id, user_id=user_id, session_id=session_id)
+        await create_stream(stream_id=stream_id, user_id=user_id, session_id=session_id, expires_at=self._expiry())
+        self._renew_at[stream_id] = time.monotonic() + self.ttl_seconds / 2
+        if time.monotonic() >= self._next_table_sweep:
+            self._next_table_sweep = time.monotonic() + 60.0
+            await self._safe(delete_expired_streams())
+
+    async def append(self, stream_id: str, chunk: bytes) -> None:
+        frames = split_frames(chunk) if chunk else []
+        if not frames or stream_id not in self._streams:
+            return
+        self._append_local(stream_id, frames)
+        self._pending.setdefault(stream_id, []).extend(frames)
+        if stream_id not in self._flushers:
+            self._flushers[stream_id] = asyncio.create_task(self._flush_later(stream_id))
+
+    async def close(self, stream_id: str) -> None:
+        await super().close(stream_id)
+        flusher = self._flushers.pop(stream_id, None)
+        if flusher is not None:
+            flusher.cancel()
+        await self._safe(self._flush(stream_id))
+        self._renew_at.pop(stream_id, None)
+        await self._safe(finish_stream(stream_id=stream_id, expires_at=self._expiry()))
+
+    async def get_meta(self, stream_id: str) -> Optional[StreamMeta]:
+        local = await super().get_meta(stream_id)
+        if local is not None:
+            return local
+        row = await get_stream(stream_id=stream_id)
+        if not row:
+            return None
+        return StreamMeta(row["user_id"], row["session_id"], bool(row.get("done")))
+
+    async def read_after(self, stream_id: str, last_id: int) -> Tuple[List[Event], bool]:
+        if self._live(stream_id) is not None:
+            return await super().read_after(stream_id, last_id)
+        meta = await self.get_meta(stream_id)
+        if meta is None:
+            raise StreamGone(stream_id)
+        rows = await list_events_after(stream_id=stream_id, after_id=last_id, limit=self.max_events)
+        if rows and rows[0]["event_id"] > last_id + 1:
+            raise StreamGone(stream_id)
+        events = [(r["event_id"], r["frame"].encode()) for r in rows]
+        # Only report done once everything has been read
+        return events, meta.done and len(rows) < self.max_events
+
+    async def wait(self, stream_id: str, last_id: int, timeout: float) -> bool:
+        if self._live(stream_id) is not None:
+            return await super().wait(stream_id, last_id, timeout)
+        # Remote stream: nothing to wait on but the next poll; report a timeout so the caller re-reads
+        await asyncio.sleep(min(timeout, self.poll_seconds))
+        return False
+
+    # Following a stream generated elsewhere: keep telling its machine that a client is still there
+    @asynccontextmanager
+    async def follow(self, stream_id: str):
+        if stream_id in self._streams:
+            yield
+            return
+        heartbeat = asyncio.create_task(self._heartbeat(stream_id))
+        try:
+            yield
+        finally:
+            heartbeat.cancel()
+
+    async def request_stop(self, stream_id: str, *, reason: str) -> bool:
+        return await request_stream_stop(stream_id=stream_id, reason=reason)
+
+    # Latest remote follower heartbeat (epoch seconds) and stop request per stream
+    async def read_controls(self, stream_ids: List[str]) -> Dict[str, Tuple[Optional[float], Optional[str]]]:
+        controls = {}
+        for row in await list_stream_controls(stream_ids=stream_ids):
+            followed_at = row.get("followed_at")
+            controls[row["id"]] = (
+                datetime.fromisoformat(followed_at).timestamp() if followed_at else None,
+                row.get("stop_requested"),
+            )
+        return controls
+
+    async def _heartbeat(self, stream_id: str) -> None:
+        while True:
+            await self._safe(touch_stream_follower(stream_id=stream_id, followed_at=datetime.now(timezone.utc).isoformat()))
+            await asyncio.sleep(self.heartbeat_seconds)
+
+    async def _flush_later(self, stream_id: str) -> None:
+        try:
+            await asyncio.sleep(self.flush_seconds)
+        except asyncio.CancelledError:
+            return
+        self._flushers.pop(stream_id, None)
+        await self._safe(self._flush(stream_id))
+
+    async def _flush(self, stream_id: str) -> None:
+        frames = self._pending.pop(stream_id, None)
+        if not frames:
+            return
+        await insert_events(stream_id=stream_id, events=[(eid, frame.decode()) for eid, frame in frames])
+        last_id = frames[-1][0]
+        if last_id > self.max_events:
+            await trim_events(stream_id=stream_id, up_to_id=last_id - self.max_events)
+        renew_at = self._renew_at.get(stream_id)
+        if renew_at is not None and time.monotonic() >= renew_at:
+            self._renew_at[stream_id] = time.monotonic() + self.ttl_seconds / 2
+            await extend_stream(stream_id=stream_id, expires_at=self._expiry())
+
+    def _expiry(self) -> str:
+        return (datetime.now(timezone.utc) + timedelta(seconds=self.ttl_seconds)).isoformat()
+
+    async def _safe(self, awaitable) -> None:
+        try:
+            await awaitable
+        except Exception as e:
+            print(f"[StreamStore] supabase write failed: {e}")
+
+
+# Pick the store from env: STREAM_RESUME_STORE=memory (default, single process) or supabase
+def build_stream_store():
+    max_events = max(16, int(os.getenv("STREAM_RESUME_BUFFER_EVENTS", "2048")))
+    ttl_seconds = max(1.0, float(os.getenv("STREAM_RESUME_TTL_SECONDS", "300")))
+    if os.getenv("STREAM_RESUME_STORE", "memory").strip().lower() == "supabase":
+        return SupabaseStreamStore(
+            max_events=max_events,
+            ttl_seconds=ttl_seconds,
+            flush_seconds=max(0.01, float(os.getenv("STREAM_RESUME_FLUSH_MS", "250")) / 1000.0),
+            poll_seconds=max(0.05, float(os.getenv("STREAM_RESUME_POLL_MS", "500")) / 1000.0),
+            heartbeat_seconds=max(0.5, float(os.getenv("STREAM_FOLLOWER_HEARTBEAT_SECONDS", "3"))),
+        )
+    return InMemoryStreamStore(max_events=max_events, ttl_seconds=ttl_seconds)
+
+
+# Serve a stream from the store: replay events after last_id, then follow it live until done.
+# Keepalive comments go out while nothing new arrives; a gap ends the response with an error event.
+# While idle, `is_disconnected` (e.g. Request.is_disconnected) is polled so a vanished client ends the
+# tail promptly instead of at the next write.
+async def tail_stream(store, stream_id: str, *, last_id: int = 0, keepalive_seconds: Optional[float] = None,
+                      is_disconnected: Optional[Callable[[], Awaitable[bool]]] = None):
+    keepalive = max(0.1, float(os.getenv("SSE_KEEPALIVE_SECONDS", "15") if keepalive_seconds is None else keepalive_seconds))
+    poll = min(keepalive, 1.0) if is_disconnected is not None else keepalive
+    yield PRELUDE
+    last_write = time.monotonic()
+    while True:
+        try:
+            events, done = await store.read_after(stream_id, last_id)
+        except StreamGone:
+            yield b'event: error\ndata: "stream_gone"\n\n'
+            return
+        if events:
+            last_id = events[-1][0]
+            yield b"".join(frame for _, frame in events)
+            last_write = time.monotonic()
+            continue
+        if done:
+            return
+        if await store.wait(stream_id, last_id, poll):
+            continue
+        if is_disconnected is not None and await is_disconnected():
+            return
+        if time.monotonic() - last_write >= keepalive:
+            yield KEEPALIVE
+            last_write = time.monotonic()
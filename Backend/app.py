@@ -1,3 +1,4 @@
+from contextlib import asynccontextmanager
 from fastapi import FastAPI
 
 from .Apple.aasa_router import router as aasa_router
@@ -6,12 +7,28 @@ from .Routers.partner_router import router as partner_router
 from .Routers.profile_router import router as profile_router
 from .APNS.notifications_router import router as notifications_router
 from .Routers.chat_router import router as chat_router
+from .Routers.metrics_router import router as metrics_router
+from .Database.request_scope import RequestScopeMiddleware
+from .Agents.openai_client import close_openai_client
+from .Database.supabase_client import close_supabase_client
 
-app = FastAPI()
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    yield
+    await close_openai_client()
+    await close_supabase_client()
+
+
+app = FastAPI(lifespan=lifespan)
+
+# Per-request DB query counting and read memoization for every router
+app.add_middleware(RequestScopeMiddleware)
 
 app.include_router(aasa_router)
 app.include_router(link_router)
 app.include_router(partner_router)
 app.include_router(profile_router)
 app.include_router(notifications_router)
-app.include_router(chat_router)
\ No newline at end of file
+app.include_router(chat_router)
+app.include_router(metrics_router)
\ No newline at end of file
@@ -1,15 +1,19 @@
 import os
+import time
 import jwt
 from jwt import PyJWKClient
 from typing import Optional
 from dotenv import load_dotenv
 from fastapi import HTTPException, Depends
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
+from .Metrics.metrics import histogram
 
 load_dotenv()
 
 security = HTTPBearer()
 
+auth_verify_seconds = histogram("auth_verify_seconds", "JWT verification time per authenticated request")
+
 class SupabaseAuth:
     def __init__(self):
         base_url: Optional[str] = os.getenv("SUPABASE_URL")
@@ -52,7 +56,11 @@ class SupabaseAuth:
 
     def get_current_user(self, credentials: HTTPAuthorizationCredentials = Depends(security)) -> dict:
         token = credentials.credentials
-        return self.verify_jwt(token)
+        start = time.perf_counter()
+        try:
+            return self.verify_jwt(token)
+        finally:
+            auth_verify_seconds.observe(time.perf_counter() - start)
 
 # Create auth instance
 auth = SupabaseAuth()